@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+CachedAudio = namedtuple("CachedAudio", "data sample_rate channels")
+
+
+def cache_key(file_path):
+    # A file that is rewritten in place gets a new key, so stale PCM is
+    # never served.
+    st = os.stat(file_path)
+    return (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+
+class DecodedAudioCache:
+    # LRU cache of decoded PCM bounded by total bytes rather than entry count.
+    # Shared by the GUI thread and the prefetch worker.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def max_entry_bytes(self):
+        # One track may not take more than a quarter of the budget, otherwise
+        # a single long mix would flush everything else.
+        return self.max_bytes // 4
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        logging.debug(f"Audio cache hit: {key[0]}")
+        return entry
+
+    def put(self, key, data, sample_rate, channels):
+        if len(data) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.data)
+            self._entries[key] = CachedAudio(data, sample_rate, channels)
+            self._size += len(data)
+            self._evict()
+        return True
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._size -= len(entry.data)
+            self.evictions += 1
+            logging.debug(f"Audio cache evicted: {key[0]}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
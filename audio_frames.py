@@ -0,0 +1,74 @@
+# MPEG audio and ADTS frame headers, shared by the seek index (which walks
+# every frame) and the tag reader (which only needs the first one).
+
+PROBE_SIZE = 16 * 1024  # Searched for the first audio frame after any ID3v2 tag
+SYNC_FRAMES = 4  # Frames that must follow each other before the stream is believed
+
+# kbps by (MPEG-1?, layer) for bitrate indexes 1-14
+MPEG_BITRATES = {
+    (True, 1): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+def find_frame(data, parse):
+    # First offset where SYNC_FRAMES frames follow each other, so a stray
+    # sync word in a tag or in the audio isn't taken for the stream start.
+    position = data.find(b"\xff")
+    while 0 <= position <= len(data) - 4:
+        following = position
+        for _ in range(SYNC_FRAMES):
+            frame = parse(data, following)
+            if frame is None:
+                break
+            following += frame[0]
+        else:
+            return position
+        if frame is None and following > position and following + 8 > len(data):
+            return position  # The chain ran off the end of the probe
+        position = data.find(b"\xff", position + 1)
+    return -1
+
+
+def mp3_frame(data, position):
+    # (frame length, samples, sample rate, bytes of header, CRC and side
+    # info) or None
+    if position + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[position:position + 4]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version, layer = (b1 >> 3) & 3, 4 - ((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MPEG_BITRATES[(mpeg1, layer)][bitrate_index - 1] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    overhead = 4 if b1 & 1 else 6
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, overhead
+    if layer == 3:
+        mono = b3 >> 6 == 3
+        overhead += (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, overhead
+
+
+def adts_frame(data, position):
+    if position + 7 > len(data):
+        return None
+    b0, b1, b2, b3, b4, b5, b6 = data[position:position + 7]
+    if b0 != 0xFF or b1 & 0xF6 != 0xF0 or (b2 >> 2) & 0xF >= len(ADTS_SAMPLE_RATES):
+        return None
+    length = ((b3 & 3) << 11) | (b4 << 3) | (b5 >> 5)
+    if length < 7:
+        return None
+    return length, 1024 * ((b6 & 3) + 1), ADTS_SAMPLE_RATES[(b2 >> 2) & 0xF], 7 if b1 & 1 else 9
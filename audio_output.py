@@ -0,0 +1,245 @@
+import logging
+import os
+import threading
+import wave
+from abc import ABC, abstractmethod
+
+import pyaudio
+
+from audio_stream import SAMPLE_WIDTH
+
+# Frames per callback for each latency profile. Smaller buffers react sooner
+# (volume, seeks, skips) but wake the CPU more often and leave less slack
+# before an underflow.
+OUTPUT_PROFILES = {
+    "low-latency": 256,
+    "balanced": 1024,
+    "power-saving": 4096,
+}
+DEFAULT_PROFILE = "balanced"
+
+
+class AudioOutput(ABC):
+    # Where rendered audio goes. Keeps one stream open across tracks:
+    # open() hands back the stream it already has when the sample rate and
+    # channel count match, and only closes and reopens it when they don't.
+    # Streams look like PyAudio's (start_stream, stop_stream, is_active,
+    # is_stopped, close) and pull audio through the engine's callback.
+    # realtime is False for sinks that can run ahead of the clock; the
+    # engine then waits for a slow decoder rather than padding with silence.
+    realtime = True
+
+    def __init__(self, profile=DEFAULT_PROFILE, frames_per_buffer=None):
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown latency profile: {profile}")
+        self.profile = profile
+        self.frames_per_buffer = frames_per_buffer or OUTPUT_PROFILES[profile]
+        self.stream = None
+        self.format = None  # (sample rate, channels) of the open stream
+        self.streams_opened = 0
+
+    @property
+    def description(self):
+        return f"{self.name}, {self.profile} ({self.frames_per_buffer} frames)"
+
+    @property
+    def initialized(self):
+        return self.streams_opened > 0
+
+    def open(self, sample_rate, channels, callback):
+        if self.stream is not None and self.format == (sample_rate, channels):
+            return self.stream
+        self.close()
+        self.stream = self.open_stream(sample_rate, channels, callback)
+        self.format = (sample_rate, channels)
+        self.streams_opened += 1
+        logging.debug(f"Opened {self.description} at {sample_rate} Hz, {channels} channels")
+        return self.stream
+
+    @abstractmethod
+    def open_stream(self, sample_rate, channels, callback):
+        ...
+
+    def stop(self):
+        # Stops the callback and keeps the stream for the next track
+        if self.stream is not None and not self.stream.is_stopped():
+            self.stream.stop_stream()
+
+    def close(self):
+        if self.stream is not None:
+            self.stop()
+            self.stream.close()
+            self.stream = None
+            self.format = None
+
+    def shutdown(self):
+        self.close()
+
+
+class PyAudioOutput(AudioOutput):
+    # A sound card through PortAudio. device is an output device index, a
+    # piece of its name, or None for the system default.
+    name = "device"
+
+    def __init__(self, device=None, profile=DEFAULT_PROFILE, frames_per_buffer=None):
+        super().__init__(profile, frames_per_buffer)
+        self.device = device
+        self.p = None  # PyAudio instance, created on first use
+
+    @property
+    def description(self):
+        device = "default device" if self.device is None else f"device {self.device!r}"
+        return f"{device}, {self.profile} ({self.frames_per_buffer} frames)"
+
+    @property
+    def initialized(self):
+        return self.p is not None
+
+    def instance(self):
+        # PyAudio() enumerates every host API and device, which takes seconds
+        # on some machines, so it waits until something is actually played.
+        if self.p is None:
+            self.p = pyaudio.PyAudio()
+        return self.p
+
+    def devices(self):
+        # (index, name, max output channels, default sample rate) per output device
+        p = self.instance()
+        devices = []
+        for index in range(p.get_device_count()):
+            info = p.get_device_info_by_index(index)
+            if info.get("maxOutputChannels", 0) > 0:
+                devices.append((index, info["name"], info["maxOutputChannels"], int(info["defaultSampleRate"])))
+        return devices
+
+    def device_index(self):
+        if self.device is None or isinstance(self.device, int):
+            return self.device
+        wanted = self.device.lower()
+        for index, name, _, _ in self.devices():
+            if wanted in name.lower():
+                return index
+        raise ValueError(f"No output device matches {self.device!r}")
+
+    def open_stream(self, sample_rate, channels, callback):
+        return self.instance().open(format=pyaudio.paInt16, channels=channels, rate=sample_rate,
+                                    output=True, output_device_index=self.device_index(),
+                                    frames_per_buffer=self.frames_per_buffer, stream_callback=callback)
+
+    def shutdown(self):
+        super().shutdown()
+        if self.p is not None:
+            self.p.terminate()
+            self.p = None
+
+
+class SinkStream:
+    # Stands in for a device stream: calls the callback back to back on its
+    # own thread, as fast as it returns, and passes each buffer to write.
+    def __init__(self, sample_rate, channels, frames_per_buffer, callback, write):
+        self.rate = sample_rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.frames = 0  # Written since the stream was opened
+        self._callback = callback
+        self._write = write
+        self._active = False
+        self._stopped = True
+        self._thread = None
+
+    def start_stream(self):
+        self._active = True
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="sink-stream", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        frame_size = self.channels * SAMPLE_WIDTH
+        try:
+            while self._active:
+                data, flag = self._callback(None, self.frames_per_buffer, {}, 0)
+                self._write(data)
+                self.frames += len(data) // frame_size
+                if flag != pyaudio.paContinue:
+                    break
+        finally:
+            self._active = False  # Finished, like a device stream whose callback completed
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._stopped = True
+
+    def close(self):
+        self.stop_stream()
+
+    def is_active(self):
+        return self._active
+
+    def is_stopped(self):
+        return self._stopped
+
+
+class NullOutput(AudioOutput):
+    # Throws the audio away as fast as the engine renders it, for load tests
+    # on machines without a sound card.
+    name = "null sink"
+    realtime = False
+
+    def open_stream(self, sample_rate, channels, callback):
+        return SinkStream(sample_rate, channels, self.frames_per_buffer, callback, lambda data: None)
+
+
+class WavFileOutput(AudioOutput):
+    # Renders to 16-bit WAV faster than real time. A WAV file has one
+    # format, so when a track needs the stream reopened at another rate or
+    # channel count the sink starts a new numbered file next to the first
+    # (song.wav, song-2.wav, ...); set a fixed output rate to get one file.
+    name = "WAV file"
+    realtime = False
+
+    def __init__(self, file_path, profile="power-saving", frames_per_buffer=None):
+        super().__init__(profile, frames_per_buffer)
+        self.file_path = file_path
+        self.files = []  # Every file written so far
+        self._wave = None
+
+    @property
+    def description(self):
+        return f"WAV file {self.file_path}"
+
+    def open_stream(self, sample_rate, channels, callback):
+        file_path = self.file_path
+        if self.files:
+            stem, extension = os.path.splitext(self.file_path)
+            file_path = f"{stem}-{len(self.files) + 1}{extension}"
+        self._wave = wave.open(file_path, "wb")
+        self._wave.setnchannels(channels)
+        self._wave.setsampwidth(SAMPLE_WIDTH)
+        self._wave.setframerate(sample_rate)
+        self.files.append(file_path)
+        logging.info(f"Rendering to {file_path}")
+        return SinkStream(sample_rate, channels, self.frames_per_buffer, callback, self._wave.writeframesraw)
+
+    def close(self):
+        super().close()
+        if self._wave is not None:
+            self._wave.close()  # Patches the sizes in the header
+            self._wave = None
+
+
+def create_output(spec=None, profile=None, frames_per_buffer=None):
+    # From a command line style spec: None or "default" for the default
+    # device, "null", "wav:PATH", or anything else as a device index/name.
+    # Without a profile each output uses its own default.
+    settings = {"frames_per_buffer": frames_per_buffer}
+    if profile is not None:
+        settings["profile"] = profile
+    if spec in (None, "", "default"):
+        return PyAudioOutput(**settings)
+    if spec == "null":
+        return NullOutput(**settings)
+    if spec.startswith("wav:"):
+        return WavFileOutput(spec[4:], **settings)
+    return PyAudioOutput(int(spec) if spec.isdigit() else spec, **settings)
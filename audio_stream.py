@@ -0,0 +1,529 @@
+import logging
+import mmap
+import os
+import struct
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_WIDTH = 2  # int16 output, matches pyaudio.paInt16
+PIPE_CHUNK_SIZE = 64 * 1024
+READAHEAD_BYTES = 4 * 1024 * 1024  # How far ahead of playback a mapped file is paged in
+SEEK_PREROLL_SECONDS = 0.2  # Decoded and dropped in front of an ffmpeg seek so the decoder has warmed up
+CAPTURE_FINISHERS = 2  # Closed sources that may keep decoding at once to fill the cache
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Where the samples of an uncompressed WAV file live, from its header
+WavLayout = namedtuple("WavLayout", "data_offset data_size sample_rate channels bits_per_sample")
+
+
+def probe_audio(file_path):
+    # Ask ffprobe for the native format so the output stream can be opened
+    # before anything has been decoded.
+    from pydub.utils import mediainfo_json
+    info = mediainfo_json(file_path)
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "audio":
+            duration = stream.get("duration") or info.get("format", {}).get("duration") or 0
+            return int(stream["sample_rate"]), int(stream["channels"]), float(duration)
+    raise ValueError(f"No audio stream found in {file_path}")
+
+
+def decoder_command(file_path, sample_rate, channels, start_seconds=0.0, demuxer=None):
+    # ffmpeg invocation that writes interleaved s16le PCM to stdout. With a
+    # demuxer, the input is raw frames of that format on stdin instead of
+    # the file; start_seconds makes ffmpeg seek the file itself.
+    from pydub.utils import get_encoder_name
+    command = [get_encoder_name(), "-nostdin", "-v", "error"]
+    if start_seconds:
+        command += ["-ss", f"{start_seconds:.6f}"]
+    if demuxer:
+        command += ["-f", demuxer, "-i", "pipe:0"]
+    else:
+        command += ["-i", file_path]
+    return command + [
+        "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate), "-ac", str(channels),
+        "-",
+    ]
+
+
+def read_wav_layout(file_path):
+    # Walks the RIFF chunks of a WAV (or RF64/BW64, for files over 4 GB)
+    # and returns its WavLayout, or None if it isn't plain integer PCM.
+    with open(file_path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64", b"BW64") or header[8:] != b"WAVE":
+            return None
+        file_size = os.fstat(f.fileno()).st_size
+        fmt = None
+        large_data_size = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"data":
+                if fmt is None:
+                    return None
+                tag, channels, sample_rate, bits = fmt
+                if tag != WAVE_FORMAT_PCM or not channels or not sample_rate or bits % 8:
+                    return None
+                offset = f.tell()
+                if size == 0xFFFFFFFF and large_data_size is not None:
+                    size = large_data_size
+                # Recorders that were cut off leave a size past the end of file
+                size = min(size, file_size - offset)
+                return WavLayout(offset, size - size % (channels * bits // 8), sample_rate, channels, bits)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    return None
+                tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", body)
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack_from("<H", body, 24)[0]  # First field of the SubFormat GUID
+                fmt = (tag, channels, sample_rate, bits)
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b"ds64":
+                body = f.read(size)
+                if len(body) >= 16:
+                    large_data_size = struct.unpack_from("<Q", body, 8)[0]
+                f.seek(size % 2, os.SEEK_CUR)
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)  # Chunks are padded to even sizes
+
+
+class PCMRingBuffer:
+    # Bounded byte ring shared by one decoder thread (writer) and the audio
+    # callback (reader). The writer blocks when the ring is full, so memory
+    # use is fixed by the capacity and not by the track length.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._read_pos = 0
+        self._fill = 0
+        self._eof = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def fill(self):
+        return self._fill
+
+    @property
+    def exhausted(self):
+        return self._eof and self._fill == 0
+
+    @property
+    def eof(self):
+        return self._eof  # Nothing more will be written
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write(self, data):
+        view = memoryview(data)
+        with self._cond:
+            while view:
+                while self._fill == self.capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return False
+                write_pos = (self._read_pos + self._fill) % self.capacity
+                count = min(len(view), self.capacity - self._fill, self.capacity - write_pos)
+                self._buffer[write_pos:write_pos + count] = view[:count]
+                self._fill += count
+                view = view[count:]
+                self._cond.notify_all()
+        return True
+
+    def read_into(self, out, align=1):
+        # Never blocks: copies whatever is buffered into the writable view
+        # out, rounded down to whole frames unless the writer has finished.
+        # Returns the number of bytes copied.
+        with self._cond:
+            count = min(len(out), self._fill)
+            if not self._eof:
+                count -= count % align
+            first = min(count, self.capacity - self._read_pos)
+            out[:first] = self._view[self._read_pos:self._read_pos + first]
+            if count > first:
+                out[first:count] = self._view[:count - first]
+            self._read_pos = (self._read_pos + count) % self.capacity
+            self._fill -= count
+            self._cond.notify_all()
+        return count
+
+    def wait_for(self, nbytes, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._fill >= nbytes or self._eof or self._closed, timeout)
+
+    def finish(self):
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._eof = True
+            self._fill = 0
+            self._cond.notify_all()
+
+
+class PCMBufferSource:
+    # Fully decoded track held in memory (the classic pydub path).
+    def __init__(self, data, sample_rate, channels, file_path=None):
+        self.file_path = file_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = channels * SAMPLE_WIDTH
+        self.gain = 1.0  # Loudness correction applied on output
+        self._data = memoryview(data)
+        self._pos = 0
+        self.duration = len(self._data) / (self.frame_size * sample_rate)
+
+    @property
+    def exhausted(self):
+        return self._pos >= len(self._data)
+
+    @property
+    def buffered_bytes(self):
+        return len(self._data) - self._pos
+
+    @property
+    def buffer_fill(self):
+        return 1.0  # Fully decoded
+
+    @property
+    def remaining_frames(self):
+        return (len(self._data) - self._pos) // self.frame_size
+
+    def wait_for_data(self, frames, timeout=None):
+        return True  # Already in memory
+
+    def read_into(self, out):
+        count = min(len(out), len(self._data) - self._pos)
+        out[:count] = self._data[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(self, frame):
+        # Only before the source is handed to the audio thread
+        self._pos = min(frame * self.frame_size, len(self._data))
+
+    def close(self):
+        self._pos = len(self._data)
+
+
+class MappedPCMSource(PCMBufferSource):
+    # 16-bit PCM WAV data served straight from a read-only memory map: no
+    # decoder and no copy of the file on the heap. The pages belong to the OS
+    # page cache, so they are shared with anything else reading the file and
+    # can be dropped under memory pressure. Readahead is requested a few MB
+    # in front of playback so the audio thread doesn't wait on the disk.
+    def __init__(self, file_path, layout):
+        with open(file_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._offset = layout.data_offset
+        self._map_views = [memoryview(self._map)]
+        self._map_views.append(self._map_views[0][layout.data_offset:layout.data_offset + layout.data_size])
+        super().__init__(self._map_views[1], layout.sample_rate, layout.channels, file_path)
+        self._advised_until = 0
+        self._advise()
+
+    def read_into(self, out):
+        count = super().read_into(out)
+        if self._pos >= self._advised_until:
+            self._advise()
+        return count
+
+    def seek(self, frame):
+        super().seek(frame)
+        self._advise()
+
+    def _advise(self):
+        if not hasattr(self._map, "madvise") or self.exhausted:
+            return
+        start = (self._offset + self._pos) // mmap.PAGESIZE * mmap.PAGESIZE
+        self._map.madvise(mmap.MADV_WILLNEED, start, min(READAHEAD_BYTES, len(self._map) - start))
+        self._advised_until = self._pos + READAHEAD_BYTES // 2
+
+    def close(self):
+        # Only called once the audio thread has moved on from this source.
+        # Every view onto the map has to go before the map itself can close.
+        if self._map.closed:
+            return
+        views = [self._data] + self._map_views[::-1]
+        self._data = memoryview(b"")  # Reads as exhausted from here on
+        self._pos = 0
+        for view in views:
+            view.release()
+        self._map.close()
+
+
+class StreamingSource:
+    # Decodes a file through an ffmpeg pipe into a PCMRingBuffer so playback
+    # can start as soon as the first few hundred milliseconds are ready.
+    # If on_complete is given and the decoded track fits in capture_limit
+    # bytes, the full PCM is also collected and handed over once the decoder
+    # reaches the end cleanly (used to fill the decoded-audio cache). Such a
+    # source that is closed early (skipped, seeked, a stale prefetch) keeps
+    # decoding to the end without the ring, CAPTURE_FINISHERS at a time.
+    # A waveform builder, if given, is fed on the decoder thread and handed
+    # to on_waveform(builder, sample_rate) once the whole track is through.
+    # A source opened at start_frame decodes from the nearest restart point
+    # in seek_index and drops the samples before the target, or lets ffmpeg
+    # seek when the format has no index. stream_format (sample rate,
+    # channels, duration) saves the ffprobe run when it is already known.
+    def __init__(self, file_path, buffer_seconds=5.0, on_complete=None, capture_limit=0,
+                 start_frame=0, seek_index=None, stream_format=None, waveform=None, on_waveform=None):
+        self.file_path = file_path
+        self.sample_rate, self.channels, self.duration = stream_format or probe_audio(file_path)
+        self.frame_size = self.channels * SAMPLE_WIDTH
+        self.gain = 1.0  # Loudness correction applied on output
+        estimated_size = self.duration * self.sample_rate * self.frame_size
+        if start_frame or not 0 < estimated_size <= capture_limit:
+            on_complete = None  # Only a decode from the start is worth caching
+        self._on_complete = on_complete
+        self._waveform = None if start_frame else waveform
+        self._on_waveform = on_waveform
+        capacity = int(self.sample_rate * buffer_seconds) * self.frame_size
+        self._ring = PCMRingBuffer(capacity)
+        self._start_frame = start_frame
+        self._frames_read = 0
+        self._seek_index = seek_index if start_frame else None
+        self._process = None
+        self._thread = None
+        self._decoding = False
+        self._finishing = False  # Closed, but capturing the rest of the track
+
+    _finishers = threading.BoundedSemaphore(CAPTURE_FINISHERS)
+    _finish_lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self._ring.exhausted
+
+    @property
+    def buffered_bytes(self):
+        return self._ring.fill
+
+    @property
+    def buffer_fill(self):
+        return self._ring.fill / self._ring.capacity
+
+    @property
+    def remaining_frames(self):
+        # Estimated from the probed duration until the decoder finishes
+        if self._ring.eof:
+            return self._ring.fill // self.frame_size
+        expected = round(self.duration * self.sample_rate) - self._start_frame - self._frames_read
+        return max(expected, self._ring.fill // self.frame_size)
+
+    def start(self):
+        index = self._seek_index
+        skip = 0
+        if index is not None:
+            offset, skip = index.locate(self._start_frame)
+            command = decoder_command(self.file_path, self.sample_rate, self.channels, demuxer=index.demuxer)
+        else:
+            # ffmpeg lands on the exact sample but starts decoding right
+            # there; earlier frames are needed for the overlap (AAC in MP4,
+            # Vorbis, Opus), so it starts a little early.
+            skip = min(self._start_frame, int(self.sample_rate * SEEK_PREROLL_SECONDS))
+            command = decoder_command(self.file_path, self.sample_rate, self.channels,
+                                      start_seconds=(self._start_frame - skip) / self.sample_rate)
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                         stdin=subprocess.PIPE if index is not None else None,
+                                         stderr=subprocess.DEVNULL, bufsize=0)
+        if index is not None:
+            threading.Thread(target=self._feed, args=(self._process.stdin, index.header, offset),
+                             name="stream-feeder", daemon=True).start()
+        self._thread = threading.Thread(target=self._pump,
+                                        args=(self._process, self._ring, skip * self.frame_size),
+                                        name="stream-decoder", daemon=True)
+        self._decoding = True
+        self._thread.start()
+
+    def _feed(self, stdin, header, offset):
+        # Writes the stream header and the file from offset on to ffmpeg
+        try:
+            with open(self.file_path, "rb") as f:
+                f.seek(offset)
+                stdin.write(header)
+                while True:
+                    chunk = f.read(PIPE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+        except (OSError, ValueError):
+            pass  # ffmpeg was killed by close()
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def _pump(self, process, ring, skip=0):
+        # skip: bytes of decoded output in front of the seek target
+        pipe = process.stdout
+        captured = [] if self._on_complete else None
+        waveform = self._waveform
+        complete = False
+        try:
+            while True:
+                chunk = pipe.read(PIPE_CHUNK_SIZE)
+                if not chunk:
+                    # close() shuts the ring before killing ffmpeg, so EOF on
+                    # an open ring means the whole track came through, even
+                    # if playback ends and kills the process right after.
+                    complete = ring is None or not ring.closed
+                    break
+                if skip:
+                    dropped = min(skip, len(chunk))
+                    skip -= dropped
+                    chunk = chunk[dropped:]
+                    if not chunk:
+                        continue
+                if ring is not None and not ring.write(chunk):
+                    if not self._finishing:
+                        break
+                    ring = None  # Closed: only the capture wants the rest
+                if captured is not None:
+                    captured.append(chunk)
+                if waveform is not None:
+                    waveform.feed(chunk)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Decoder pipe for {self.file_path} failed: {e}")
+        finally:
+            with self._finish_lock:
+                self._decoding = False
+                if self._finishing:
+                    self._finishers.release()
+            self._ring.finish()
+            pipe.close()
+            process.wait()
+            # Once closed, ffmpeg may hit the closed pipe before the kill
+            stopped = self._ring.closed and not self._finishing
+            if process.returncode not in (0, -9) and not stopped:
+                logging.warning(f"ffmpeg exited with {process.returncode} for {self.file_path}")
+            elif complete:
+                if captured is not None:
+                    self._on_complete(b"".join(captured))
+                if waveform is not None:
+                    self._on_waveform(waveform, self.sample_rate)
+
+    def wait_ready(self, prebuffer_seconds=0.3, timeout=10.0):
+        prebuffer = int(self.sample_rate * prebuffer_seconds) * self.frame_size
+        prebuffer = min(prebuffer, self._ring.capacity)
+        if not self._ring.wait_for(prebuffer, timeout):
+            raise TimeoutError(f"Decoder did not produce audio for {self.file_path} within {timeout}s")
+
+    def wait_for_data(self, frames, timeout=None):
+        # For sinks with no deadline: False if the decoder didn't produce
+        # that many frames (or finish) in time
+        nbytes = min(max(frames, 1) * self.frame_size, self._ring.capacity)
+        return self._ring.wait_for(nbytes, timeout)
+
+    def read_into(self, out):
+        count = self._ring.read_into(out, self.frame_size)
+        self._frames_read += count // self.frame_size
+        return count
+
+    def close(self):
+        with self._finish_lock:
+            if self._on_complete and self._decoding and not self._finishing:
+                self._finishing = self._finishers.acquire(blocking=False)
+        self._ring.close()
+        if not self._finishing and self._process and self._process.poll() is None:
+            self._process.kill()
+
+
+class TrackPrefetcher:
+    # Opens the next track's source on a worker thread while the current one
+    # plays, so the audio callback can switch to it without decoding anything.
+    def __init__(self, open_source):
+        self._open_source = open_source
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending_key = None
+        self._ready = None  # (key, source)
+
+    def request(self, index, file_path):
+        key = (index, file_path)
+        with self._lock:
+            if key == self._pending_key:
+                return
+            self._generation += 1
+            generation = self._generation
+            self._pending_key = key
+            stale, self._ready = self._ready, None
+        if stale:
+            stale[1].close()
+        self._executor.submit(self._run, generation, key)
+
+    def _run(self, generation, key):
+        try:
+            source = self._open_source(key[1])
+        except Exception as e:
+            logging.warning(f"Prefetch of {key[1]} failed: {e}")
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._ready = (key, source)
+                logging.debug(f"Prefetched: {key[1]}")
+                return
+        source.close()
+
+    def take(self, index, file_path, sample_rate=None, channels=None):
+        # Safe to call from the audio thread. Only hands over a source that is
+        # ready, is still the wanted track and (optionally) is read at the
+        # rate and channel count of the open stream; anything else stays put
+        # for the GUI thread.
+        with self._lock:
+            if self._ready is None or self._ready[0] != (index, file_path):
+                return None
+            source = self._ready[1]
+            if sample_rate is not None and (source.reader.output_rate, source.channels) != (sample_rate, channels):
+                return None
+            self._ready = None
+            self._pending_key = None
+        return source
+
+    @property
+    def ready_key(self):
+        # (index, path) of the source waiting to be taken, or None
+        with self._lock:
+            return self._ready[0] if self._ready else None
+
+    def update_gain(self, file_path, gain):
+        # Analysis can finish after the next track was already opened. It
+        # hasn't played yet, so the new gain applies from its first sample.
+        with self._lock:
+            if self._ready is not None and self._ready[0][1] == file_path:
+                source = self._ready[1]
+                source.gain = gain
+                source.reader.loudness.target = gain
+                source.reader.loudness.reset()
+
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+            self._pending_key = None
+            stale, self._ready = self._ready, None
+        if stale:
+            stale[1].close()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import threading
+
+SHUTDOWN_TIMEOUT = 5.0  # Seconds shutdown() waits for cancelled loads and running file-system calls
+
+
+class LoadTask:
+    # Handle for one submitted load; safe to use from the GUI thread.
+    def __init__(self, future, description):
+        self.description = description
+        self._future = future
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    def cancel(self):
+        # Cancelling the concurrent future cancels the task inside the loop
+        self._future.cancel()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+
+class BackgroundLoader:
+    # A single asyncio loop on a daemon thread, shared by every load for the
+    # whole session. Qt slots submit coroutines and return straight away.
+    # Blocking file-system calls go through run_io, which caps how many run
+    # at once so a huge drop can't saturate the disk (or a NAS).
+    def __init__(self, max_concurrent_io=16):
+        self.loop = asyncio.new_event_loop()
+        self._io_slots = asyncio.Semaphore(max_concurrent_io)
+        self._tasks = set()
+        self._thread = threading.Thread(target=self._run, name="loader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        loop = self.loop
+        try:
+            loop.run_forever()
+            # Stopped by shutdown(): let cancelled loads unwind, wait for the
+            # file-system calls still on the executor, then close the loop
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            loop.close()
+
+    def submit(self, coro, description="load"):
+        future = asyncio.run_coroutine_threadsafe(self._guard(coro, description), self.loop)
+        task = LoadTask(future, description)
+        self._tasks.add(task)
+        future.add_done_callback(lambda _: self._tasks.discard(task))
+        return task
+
+    async def _guard(self, coro, description):
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            logging.info(f"Cancelled {description}")
+            raise
+        except Exception as e:
+            logging.exception(f"Error during {description}: {e}")
+            raise
+
+    @property
+    def busy(self):
+        return bool(self._tasks)
+
+    async def run_io(self, func, *args):
+        async with self._io_slots:
+            return await self.loop.run_in_executor(None, func, *args)
+
+    def cancel_all(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def shutdown(self):
+        if not self._thread.is_alive():
+            return
+        self.cancel_all()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(SHUTDOWN_TIMEOUT)
+        if self._thread.is_alive():
+            logging.warning("Loader thread did not stop in time")
@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+import types
+
+# PortAudio's values, for machines where PyAudio itself isn't installed
+PA_CONSTANTS = {
+    "paInt16": 8,
+    "paContinue": 0, "paComplete": 1, "paAbort": 2,
+    "paInputUnderflow": 1, "paInputOverflow": 2,
+    "paOutputUnderflow": 4, "paOutputOverflow": 8, "paPrimingOutput": 16,
+}
+
+
+class FakeStream:
+    # Stands in for a PyAudio output stream. Instead of waiting for a device
+    # it calls stream_callback back to back, either on its own thread
+    # (autorun) or when the benchmark calls pump(), and throws the audio away.
+    def __init__(self, rate, channels, format=None, output=True, stream_callback=None,
+                 frames_per_buffer=1024, autorun=True, **kwargs):
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.autorun = autorun
+        self.buffers = 0
+        self.frames = 0
+        self.opened_at = time.perf_counter()
+        self.first_buffer_at = None
+        self.first_buffer = threading.Event()
+        self.finished = threading.Event()
+        self._callback = stream_callback
+        self._active = False
+        self._thread = None
+
+    def pump(self, count=None):
+        # Calls the callback up to count times on this thread; returns False
+        # once the callback has asked for the stream to stop.
+        keep_going = PA_CONSTANTS["paContinue"]
+        done = 0
+        while count is None or done < count:
+            data, flag = self._callback(None, self.frames_per_buffer, {}, 0)
+            done += 1
+            self.buffers += 1
+            self.frames += len(data) // (2 * self.channels)
+            if self.first_buffer_at is None:
+                self.first_buffer_at = time.perf_counter()
+                self.first_buffer.set()
+            if flag != keep_going:
+                self._active = False
+                self.finished.set()
+                return False
+            if self.autorun and not self._active:
+                break
+        return True
+
+    def start_stream(self):
+        self._active = True
+        if self.autorun:
+            self._thread = threading.Thread(target=self.pump, name="fake-audio", daemon=True)
+            self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+    def is_active(self):
+        return self._active
+
+    def is_stopped(self):
+        return not self._active
+
+
+class FakePyAudio:
+    autorun = True  # Set to False to drive streams by hand with pump()
+
+    def __init__(self):
+        self.streams = []
+
+    def open(self, **kwargs):
+        stream = FakeStream(autorun=self.autorun, **kwargs)
+        self.streams.append(stream)
+        return stream
+
+    def get_default_output_device_info(self):
+        return {"index": 0, "name": "fake", "defaultSampleRate": 44100.0, "maxOutputChannels": 8}
+
+    def get_device_count(self):
+        return 1
+
+    def get_device_info_by_index(self, index):
+        return self.get_default_output_device_info()
+
+    def terminate(self):
+        for stream in self.streams:
+            stream.stop_stream()
+
+
+def install():
+    # Must run before the player modules are imported. Uses the real pyaudio
+    # module for its constants when it is installed, but never opens a device.
+    try:
+        import pyaudio
+    except ImportError:
+        pyaudio = types.ModuleType("pyaudio")
+        pyaudio.__dict__.update(PA_CONSTANTS)
+        sys.modules["pyaudio"] = pyaudio
+    pyaudio.PyAudio = FakePyAudio
+    return pyaudio
@@ -0,0 +1,110 @@
+import os
+import random
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+# (seconds, channels, sample_rate, format)
+FIXTURE_SPECS = [
+    (5, 1, 22050, "wav"),
+    (5, 2, 44100, "flac"),
+    (30, 2, 44100, "wav"),
+    (30, 2, 48000, "flac"),
+    (30, 2, 44100, "mp3"),
+    (30, 6, 48000, "wav"),
+    (180, 2, 44100, "flac"),
+]
+QUICK_FIXTURE_SPECS = [spec for spec in FIXTURE_SPECS if spec[0] <= 30]
+CHUNK_SECONDS = 10
+ENCODERS = {"flac": "flac", "mp3": "libmp3lame"}
+
+
+def write_wav(path, seconds, channels, sample_rate):
+    # A different tone per channel at -6 dBFS, written in chunks so long
+    # fixtures don't need to fit in memory.
+    frequencies = 220.0 * (1 + np.arange(channels))
+    with wave.open(path, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        total = int(seconds * sample_rate)
+        for start in range(0, total, CHUNK_SECONDS * sample_rate):
+            t = np.arange(start, min(start + CHUNK_SECONDS * sample_rate, total)) / sample_rate
+            tones = 0.5 * np.sin(2 * np.pi * t[:, None] * frequencies[None, :])
+            out.writeframes((tones * 32767).astype("<i2").tobytes())
+
+
+def write_encoded(path, seconds, channels, sample_rate, fmt):
+    wav_path = path + ".tmp.wav"
+    write_wav(wav_path, seconds, channels, sample_rate)
+    try:
+        subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", wav_path, "-c:a", ENCODERS[fmt], path],
+                       check=True)
+    finally:
+        os.remove(wav_path)
+
+
+def build_fixtures(directory, specs=FIXTURE_SPECS):
+    # Returns one dict per fixture. FLAC and MP3 need ffmpeg, which the
+    # player needs anyway; without it only the WAV fixtures are built.
+    have_ffmpeg = shutil.which("ffmpeg") is not None
+    fixtures = []
+    for seconds, channels, sample_rate, fmt in specs:
+        if fmt != "wav" and not have_ffmpeg:
+            continue
+        name = f"{seconds}s_{channels}ch_{sample_rate}.{fmt}"
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            if fmt == "wav":
+                write_wav(path, seconds, channels, sample_rate)
+            else:
+                write_encoded(path, seconds, channels, sample_rate, fmt)
+        fixtures.append({"name": name, "path": path, "format": fmt, "seconds": seconds,
+                         "channels": channels, "sample_rate": sample_rate})
+    return fixtures
+
+
+def build_playlist_tree(directory, count, per_folder=1000):
+    # count empty .wav files spread over folders, plus an extended .m3u and
+    # a .pls listing them by relative path. Enough for the loaders, which
+    # only look at names and existence.
+    paths = []
+    for index in range(count):
+        folder = os.path.join(directory, f"folder{index // per_folder:04d}")
+        if index % per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"track{index:06d}.wav")
+        open(path, "wb").close()
+        paths.append(path)
+    relative = [os.path.relpath(path, directory) for path in paths]
+    m3u_path = os.path.join(directory, "playlist.m3u")
+    with open(m3u_path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        f.writelines(f"#EXTINF:180,Track {index}\n{path}\n" for index, path in enumerate(relative))
+    pls_path = os.path.join(directory, "playlist.pls")
+    with open(pls_path, "w", encoding="utf-8") as f:
+        f.write("[playlist]\n")
+        f.writelines(f"File{index}={path}\nTitle{index}=Track {index}\nLength{index}=180\n"
+                     for index, path in enumerate(relative, 1))
+        f.write(f"NumberOfEntries={count}\nVersion=2\n")
+    return paths, m3u_path, pls_path
+
+
+def build_tag_corpus(count, seed=1):
+    # count (path, title, artist, album) rows of made-up words, with
+    # artists and albums shared between tracks the way a library has them.
+    # No files: the search index only ever sees the strings.
+    rng = random.Random(seed)
+    syllables = ("ka", "lo", "mi", "ne", "ra", "su", "to", "vi", "be", "da", "go", "hu", "je", "pa", "ri", "te")
+    words = sorted({"".join(rng.choices(syllables, k=rng.randint(1, 4))) for _ in range(20000)})
+    artists = [" ".join(rng.choices(words, k=2)).title() for _ in range(max(1, count // 50))]
+    albums = [(rng.choice(artists), " ".join(rng.choices(words, k=rng.randint(1, 3))).title())
+              for _ in range(max(1, count // 12))]
+    rows = []
+    for index in range(count):
+        artist, album = albums[index % len(albums)]
+        title = " ".join(rng.choices(words, k=rng.randint(1, 5))).title()
+        rows.append((f"/music/{artist}/{album}/{index % 12 + 1:02d} {title}.flac", title, artist, album))
+    return rows
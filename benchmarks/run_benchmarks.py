@@ -0,0 +1,541 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks import fake_pyaudio
+
+fake_pyaudio.install()  # Before the engine imports pyaudio
+
+from benchmarks.fixtures import (FIXTURE_SPECS, QUICK_FIXTURE_SPECS, build_fixtures, build_playlist_tree,  # noqa: E402
+                                 build_tag_corpus)
+from audio_output import NullOutput, WavFileOutput  # noqa: E402
+from audio_stream import MappedPCMSource, StreamingSource  # noqa: E402
+from level_meter import SampleRing  # noqa: E402
+from player_engine import PlayerEngine  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+from shuffle_order import ShuffleOrder  # noqa: E402
+from tag_reader import read_tags  # noqa: E402
+
+PLAYLIST_SIZES = (10_000, 100_000)
+QUICK_PLAYLIST_SIZES = (10_000,)
+ALLOCATION_BUFFERS = 40  # Buffers measured per fixture for allocations
+SEEK_POINTS = (0.1, 0.5, 0.9, 0.25, 0.75)  # Fractions of the track, in seek order
+DSP_BUFFER_FRAMES = (64, 256, 1024)
+DSP_OUTPUT_RATE = 48000
+DSP_EQ_BANDS = [("lowshelf", 120, 3.0, 0.7), ("peak", 1000, -2.0, 1.0), ("highshelf", 8000, 2.0, 0.7)]
+SHUFFLE_APPEND = 1000  # Entries appended to a shuffled playlist
+SHUFFLE_STEPS = 100_000  # next/previous lookups timed per playlist size
+TAG_READS = 200  # read_tags() calls timed per fixture
+SEARCH_BATCH = 500  # Tracks indexed per batch, like a folder scan hands them over
+SEARCH_QUERIES = ("k", "ka", "kal", "kalo", "ka lo", "kalo mi ne", "lo ra su te", "zz")
+SEARCH_REPEATS = 5
+SECTIONS = ("first_buffer", "callback", "track_switch", "seek", "dsp", "output", "playlist_load", "shuffle",
+            "search")
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KiB on Linux
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def new_engine(workdir, name, manual_pump=False):
+    # Each engine gets its own analysis database so runs don't share state
+    # with each other or with the user's library.
+    engine = PlayerEngine(analysis_db_path=os.path.join(workdir, f"{name}.sqlite3"))
+    if manual_pump:
+        engine.output.instance().autorun = False
+    return engine
+
+
+def wait_for(engine, condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark step did not finish")
+        engine.process_events(timeout=0.01)
+
+
+def load_single(engine, path):
+    engine.clear_playlist()
+    engine.playlist.extend([path])
+
+
+def bench_first_buffer(workdir, fixtures, args):
+    # play_current_track() until the first buffer comes out of the callback:
+    # "cold" has nothing cached, "cached" replays it from the decoded cache.
+    # "mapped" plays 16-bit WAV straight off a memory map, everything else
+    # streams as usual. Without ffmpeg only "mapped" can run.
+    rows = []
+    modes = ("mapped", "streaming", "full")
+    if shutil.which("ffmpeg") is None:
+        print("first_buffer: ffmpeg not found, skipping the streaming and full modes", file=sys.stderr)
+        modes = ("mapped",)
+    for decode in modes:
+        engine = new_engine(workdir, f"first_buffer_{decode}", manual_pump=True)
+        engine.memory_map_pcm = decode == "mapped"
+        engine.streaming_decode = decode != "full"
+        for fixture in fixtures:
+            load_single(engine, fixture["path"])
+            row = {"fixture": fixture["name"], "decode": decode}
+            for run in ("cold", "cached"):
+                cached_entries = engine.audio_cache.stats()["entries"]
+                started = time.perf_counter()
+                engine.play_current_track()
+                stream = engine.output.stream
+                stream.pump(1)
+                row[f"{run}_ms"] = ms(time.perf_counter() - started)
+                play_out(engine, stream, cached_entries)
+            rows.append(row)
+        engine.shutdown()
+    return rows
+
+
+def play_out(engine, stream, cached_entries):
+    # Consumes the rest of the track without closing the source, so a
+    # streamed decode gets to hand its capture to the cache, then stops.
+    while stream.pump(1024):
+        pass
+    if isinstance(engine.current_source, StreamingSource):
+        wait_for(engine, lambda: engine.audio_cache.stats()["entries"] > cached_entries, timeout=10)
+    engine.stop()
+    engine.process_events(timeout=0)
+
+
+def bench_callback(workdir, fixtures, args):
+    # audio_callback driven back to back on one thread from the decoded
+    # cache, so only the render path is measured. Each fixture is replayed
+    # with a level meter attached to show what feeding its ring costs.
+    rows = []
+    engine = new_engine(workdir, "callback", manual_pump=True)
+    engine.streaming_decode = False
+    for fixture in fixtures:
+        load_single(engine, fixture["path"])
+        engine.play_current_track()
+        stream = engine.output.stream
+        engine.playback_stats.reset()
+        started = time.perf_counter()
+        stream.pump()
+        elapsed = time.perf_counter() - started
+        stats = engine.playback_stats.snapshot()
+        row = {
+            "fixture": fixture["name"],
+            "frames_per_buffer": stream.frames_per_buffer,
+            "buffers": stream.buffers,
+            "buffers_per_second": round(stream.buffers / elapsed),
+            "realtime_factor": round(stream.frames / fixture["sample_rate"] / elapsed, 1),
+            "callback_us_p50": stats["callback_us_p50"],
+            "callback_us_p99": stats["callback_us_p99"],
+            "callback_us_max": stats["callback_us_max"],
+        }
+        engine.stop()
+        row.update(measure_allocations(engine))
+
+        engine.attach_meter(SampleRing())
+        engine.play_current_track()
+        engine.playback_stats.reset()
+        engine.output.stream.pump()
+        stats = engine.playback_stats.snapshot()
+        row["meter_callback_us_p50"] = stats["callback_us_p50"]
+        row["meter_callback_us_p99"] = stats["callback_us_p99"]
+        engine.stop()
+        row["meter_extra_bytes_per_buffer"] = measure_allocations(engine)["extra_bytes_per_buffer"]
+        engine.attach_meter(None)
+        rows.append(row)
+    engine.shutdown()
+    return rows
+
+
+def measure_allocations(engine):
+    # Replays the cached track. Retained blocks show leaks; the traced peak
+    # per buffer is everything alive at once during one callback, which
+    # includes the bytes object handed back to PyAudio.
+    engine.play_current_track()
+    stream = engine.output.stream
+    stream.pump(8)  # Warm-up: first-buffer work and ramp buffers
+    output_bytes = stream.frames_per_buffer * stream.channels * 2
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    stream.pump(ALLOCATION_BUFFERS)
+    gc.collect()
+    retained = sys.getallocatedblocks() - blocks_before
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_BUFFERS):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            if not stream.pump(1):
+                break
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    engine.stop()
+    return {
+        "output_bytes_per_buffer": output_bytes,
+        "traced_peak_bytes_per_buffer": statistics.median(peaks) if peaks else None,
+        "extra_bytes_per_buffer": statistics.median(peaks) - output_bytes if peaks else None,
+        "retained_blocks_per_buffer": round(retained / ALLOCATION_BUFFERS, 2),
+    }
+
+
+def bench_track_switch(workdir, fixtures, args):
+    return {"gapless": bench_gapless_switch(workdir, fixtures),
+            "skip": bench_skip(workdir, fixtures)}
+
+
+def bench_gapless_switch(workdir, fixtures):
+    # Tracks sharing the largest (rate, channels) group play back to back on
+    # one stream. Reports the in-callback hand-over and the whole callback
+    # that crossed the track boundary.
+    groups = defaultdict(list)
+    for fixture in fixtures:
+        groups[(fixture["sample_rate"], fixture["channels"])].append(fixture)
+    group = max(groups.values(), key=len)
+    if len(group) < 2:
+        return None
+    engine = new_engine(workdir, "gapless", manual_pump=True)
+    engine.playlist.extend(fixture["path"] for fixture in group)
+    switch_ns = []
+    switch_to_prefetched = engine.switch_to_prefetched
+
+    def timed_switch():
+        started = time.perf_counter_ns()
+        switched = switch_to_prefetched()
+        switch_ns.append(time.perf_counter_ns() - started)
+        return switched
+
+    engine.switch_to_prefetched = timed_switch
+    engine.play_current_track()
+    stream = engine.output.stream
+    boundary_us = []
+    for next_index in range(1, len(group)):
+        wait_for(engine, lambda: engine.prefetcher.ready_key == (next_index, group[next_index]["path"]))
+        while engine.current_track_index != next_index:
+            started = time.perf_counter_ns()
+            stream.pump(1)
+            elapsed = time.perf_counter_ns() - started
+        boundary_us.append(round(elapsed / 1000, 1))
+        engine.process_events()
+    engine.shutdown()
+    return {
+        "tracks": [fixture["name"] for fixture in group],
+        "streams_opened": engine.output.streams_opened,
+        "handover_us": [round(ns / 1000, 1) for ns in switch_ns],
+        "boundary_callback_us": boundary_us,
+    }
+
+
+def bench_skip(workdir, fixtures):
+    # next_track()/previous_track() until the first buffer of the new track.
+    # Next finds the track prefetched; previous has to open it on the spot.
+    engine = new_engine(workdir, "skip", manual_pump=True)
+    engine.set_repeat_mode("all")  # The last track gets a prefetched successor too
+    engine.playlist.extend(fixture["path"] for fixture in fixtures)
+    count = len(fixtures)
+    results = {}
+    for run in ("uncached", "cached"):
+        if run == "cached":
+            # Fully decode every track so this pass only hits the cache
+            engine.streaming_decode = False
+            for index in range(count):
+                engine.current_track_index = index
+                engine.play_current_track()
+            engine.streaming_decode = True
+        engine.current_track_index = 0
+        engine.play_current_track()
+        for label, step, offset in (("next", engine.next_track, 1), ("previous", engine.previous_track, -1)):
+            latencies = []
+            for _ in range(count):
+                target = (engine.current_track_index + offset) % count
+                if label == "next":
+                    wait_for(engine, lambda: engine.prefetcher.ready_key == (target, engine.playlist[target]))
+                if run == "uncached":
+                    engine.audio_cache.clear()
+                started = time.perf_counter()
+                step()
+                engine.output.stream.pump(1)
+                latencies.append(time.perf_counter() - started)
+                engine.process_events(timeout=0)
+            results[f"{label}_{run}_ms"] = {"median": ms(statistics.median(latencies)),
+                                            "max": ms(max(latencies))}
+    engine.shutdown()
+    return results
+
+
+def bench_seek(workdir, fixtures, args):
+    # seek() until the first buffer at the new position, with nothing in the
+    # decoded cache. Waits for the track's analysis and seek index first, so
+    # this is a seek into a track that has been playing for a while.
+    rows = []
+    engine = new_engine(workdir, "seek", manual_pump=True)
+    engine.audio_cache.resize(0)
+    for fixture in fixtures:
+        path = fixture["path"]
+        load_single(engine, path)
+        engine.play_current_track()
+        stream = engine.output.stream
+        stream.pump(1)
+        wait_for(engine, lambda: engine.analysis.lookup(path) is not None)
+        if isinstance(engine.current_source, MappedPCMSource):
+            method = "mapped"
+        else:
+            method = "index" if engine.seek_indexes.get(path, wait=True) else "ffmpeg"
+        latencies = []
+        for fraction in SEEK_POINTS:
+            started = time.perf_counter()
+            engine.seek(fixture["seconds"] * fraction)
+            stream.pump(1)
+            latencies.append(time.perf_counter() - started)
+            engine.process_events(timeout=0)
+        rows.append({"fixture": fixture["name"], "method": method,
+                     "median_ms": ms(statistics.median(latencies)), "max_ms": ms(max(latencies))})
+        engine.stop()
+    engine.shutdown()
+    return rows
+
+
+def bench_dsp(workdir, fixtures, args):
+    # The float DSP chain at small buffer sizes with every stage busy: a
+    # 44.1 kHz stereo track resampled to 48 kHz, crossfaded into a 48 kHz
+    # one, through a three-band EQ and a volume below full. Reports the
+    # callback against its deadline and what each stage cost on its own.
+    first = next((f for f in fixtures if (f["sample_rate"], f["channels"]) == (44100, 2)), None)
+    second = next((f for f in fixtures if (f["sample_rate"], f["channels"]) == (DSP_OUTPUT_RATE, 2)), None)
+    if first is None or second is None:
+        return None
+    rows = []
+    for frames in DSP_BUFFER_FRAMES:
+        engine = new_engine(workdir, f"dsp_{frames}", manual_pump=True)
+        engine.set_output_rate(DSP_OUTPUT_RATE)
+        engine.set_crossfade(2.0)
+        engine.set_eq(DSP_EQ_BANDS)
+        engine.set_volume(0.8)
+        engine.playlist.extend([first["path"], second["path"]])
+        engine.play_current_track()
+        stream = engine.output.stream
+        stream.frames_per_buffer = frames
+        wait_for(engine, lambda: engine.prefetcher.ready_key == (1, second["path"]))
+        engine.playback_stats.reset()
+        engine.dsp.reset_costs()
+        stream.pump()
+        stats = engine.playback_stats.snapshot()
+        costs = engine.stats()["dsp"]
+        rows.append({
+            "tracks": [first["name"], second["name"]],
+            "frames_per_buffer": frames,
+            "deadline_us": round(frames / DSP_OUTPUT_RATE * 1_000_000),
+            "streams_opened": engine.output.streams_opened,
+            "callback_us_p50": stats["callback_us_p50"],
+            "callback_us_p99": stats["callback_us_p99"],
+            "callback_us_max": stats["callback_us_max"],
+            "stages": {name: {"us_mean": cost["us_mean"], "load": cost["load"]}
+                       for name, cost in costs.items() if cost["calls"]},
+        })
+        engine.shutdown()
+    return rows
+
+
+def bench_output(workdir, fixtures, args):
+    # Every fixture as one playlist, rendered through the null and WAV sinks
+    # as fast as they go, at each file's own rate and at a fixed 48 kHz.
+    # The stream is only reopened when the format changes, so a fixed rate
+    # leaves just the channel count changes.
+    rows = []
+    audio_seconds = sum(fixture["seconds"] for fixture in fixtures)
+    for sink in ("null", "wav"):
+        for output_rate in (None, DSP_OUTPUT_RATE):
+            name = f"output_{sink}_{output_rate or 'file'}"
+            engine = new_engine(workdir, name)
+            output = NullOutput() if sink == "null" else WavFileOutput(os.path.join(workdir, f"{name}.wav"))
+            engine.set_output(output)
+            engine.set_output_rate(output_rate)
+            engine.playlist.extend(fixture["path"] for fixture in fixtures)
+            started = time.perf_counter()
+            engine.play_current_track()
+            wait_for(engine, lambda: engine.current_sound is None, timeout=600)
+            elapsed = time.perf_counter() - started
+            rows.append({
+                "sink": sink,
+                "output_rate": output_rate or "file",
+                "tracks": len(fixtures),
+                "audio_seconds": audio_seconds,
+                "seconds": round(elapsed, 3),
+                "realtime_factor": round(audio_seconds / elapsed, 1),
+                "streams_opened": output.streams_opened,
+            })
+            engine.shutdown()
+    return rows
+
+
+def bench_playlist_load(workdir, fixtures, args):
+    # An .m3u, a .pls, a folder tree and a flat list of paths, each with the
+    # same entries, loaded through add_files_async into an empty playlist.
+    # Playlist rows also time saving the result back out as extended M3U.
+    rows = []
+    for count in args.playlist_sizes:
+        tree = os.path.join(workdir, f"tree_{count}")
+        os.makedirs(tree)
+        paths, m3u_path, pls_path = build_playlist_tree(tree, count)
+        for source, inputs in (("m3u", [m3u_path]), ("pls", [pls_path]), ("folder", [tree]), ("files", paths)):
+            engine = new_engine(workdir, f"load_{source}_{count}")
+            started = time.perf_counter()
+            task = engine.load(inputs, f"{source} load", autoplay=False)
+            wait_for(engine, lambda: task.done and not engine.has_pending_events, timeout=600)
+            elapsed = time.perf_counter() - started
+            row = {"entries": count, "source": source, "loaded": len(engine.playlist),
+                   "seconds": round(elapsed, 3), "entries_per_second": round(count / elapsed)}
+            if source in ("m3u", "pls"):
+                started = time.perf_counter()
+                engine.save_playlist_to_file(os.path.join(workdir, f"saved_{count}.m3u"))
+                row["save_seconds"] = round(time.perf_counter() - started, 3)
+            rows.append(row)
+            engine.shutdown()
+        shutil.rmtree(tree)
+    return rows
+
+
+def bench_shuffle(workdir, fixtures, args):
+    # The shuffle order on its own, at playlist sizes: a full reshuffle,
+    # dealing appended entries into it, and next/previous lookups walking it.
+    rows = []
+    for count in args.playlist_sizes:
+        order = ShuffleOrder()
+        started = time.perf_counter()
+        order.reshuffle(count, first=count // 2, seed=1)
+        reshuffle = time.perf_counter() - started
+        started = time.perf_counter()
+        order.extend(SHUFFLE_APPEND, current=count // 2)
+        extend = time.perf_counter() - started
+        timings = {}
+        for label, step in (("next", 1), ("previous", -1)):
+            index = order.first()
+            started = time.perf_counter()
+            for _ in range(SHUFFLE_STEPS):
+                index = order.neighbour(index, step, wrap=True)
+            timings[label] = time.perf_counter() - started
+        rows.append({
+            "entries": count,
+            "reshuffle_ms": ms(reshuffle),
+            "extend_ms": ms(extend),
+            "appended": SHUFFLE_APPEND,
+            "next_us": round(timings["next"] / SHUFFLE_STEPS * 1e6, 3),
+            "previous_us": round(timings["previous"] / SHUFFLE_STEPS * 1e6, 3),
+            "valid": sorted(order.order) == list(range(count + SHUFFLE_APPEND)),
+        })
+    return rows
+
+
+def bench_search(workdir, fixtures, args):
+    # Header-only tag reads per fixture format, then the search index over
+    # made-up libraries: indexing batch by batch (titles, artists, albums
+    # and file names) and search-as-you-type queries on the result.
+    reads = []
+    for fixture in fixtures:
+        started = time.perf_counter()
+        for _ in range(TAG_READS):
+            tags = read_tags(fixture["path"])
+        elapsed = time.perf_counter() - started
+        reads.append({"fixture": fixture["name"], "us_per_file": round(elapsed / TAG_READS * 1e6, 1),
+                      "duration": round(tags.duration, 3) if tags.duration else None})
+    rows = []
+    for count in args.playlist_sizes:
+        corpus = build_tag_corpus(count)
+        index = SearchIndex()
+        started = time.perf_counter()
+        for start in range(0, count, SEARCH_BATCH):
+            for path, title, artist, album in corpus[start:start + SEARCH_BATCH]:
+                folder, name = os.path.split(path)
+                index.set(path, (os.path.splitext(name)[0], os.path.basename(folder), title, artist, album))
+            index.search("zz")  # A query between batches merges the new words in
+        indexing = time.perf_counter() - started
+        queries = {}
+        for query in SEARCH_QUERIES:
+            timings = []
+            for _ in range(SEARCH_REPEATS):
+                started = time.perf_counter()
+                found = index.search(query, 200)
+                timings.append(time.perf_counter() - started)
+            queries[query] = {"median_ms": ms(statistics.median(timings)), "max_ms": ms(max(timings)),
+                              "shown": len(found)}
+        rows.append({"tracks": count, "index_seconds": round(indexing, 3),
+                     "us_per_track": round(indexing / count * 1e6, 1), "queries": queries})
+    return {"tag_reads": reads, "index": rows}
+
+
+BENCHMARKS = {
+    "first_buffer": bench_first_buffer,
+    "callback": bench_callback,
+    "track_switch": bench_track_switch,
+    "seek": bench_seek,
+    "dsp": bench_dsp,
+    "output": bench_output,
+    "playlist_load": bench_playlist_load,
+    "shuffle": bench_shuffle,
+    "search": bench_search,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="KtiseosNyx Player benchmarks (no audio device needed)")
+    parser.add_argument("--quick", action="store_true",
+                        help="short fixtures and only the 10k playlist")
+    parser.add_argument("--only", choices=SECTIONS, action="append",
+                        help="run only this section (repeatable)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--fixtures-dir", help="reuse generated audio fixtures from this folder")
+    args = parser.parse_args(argv)
+    args.playlist_sizes = QUICK_PLAYLIST_SIZES if args.quick else PLAYLIST_SIZES
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "benchmarks": {},
+        "peak_rss_mb": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="ktiseosnyx-bench-") as workdir:
+        fixtures_dir = args.fixtures_dir or os.path.join(workdir, "fixtures")
+        os.makedirs(fixtures_dir, exist_ok=True)
+        fixtures = build_fixtures(fixtures_dir, QUICK_FIXTURE_SPECS if args.quick else FIXTURE_SPECS)
+        results["meta"]["fixtures"] = [{key: value for key, value in fixture.items() if key != "path"}
+                                       for fixture in fixtures]
+        for name in args.only or SECTIONS:
+            started = time.perf_counter()
+            results["benchmarks"][name] = BENCHMARKS[name](workdir, fixtures, args)
+            results["peak_rss_mb"][name] = peak_rss_mb()  # Cumulative high-water mark
+            print(f"{name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,533 @@
+import math
+import time
+from functools import lru_cache
+
+np = None  # numpy; imported by the first reserve() to keep startup light
+
+RESERVE_FRAMES = 4096  # Block size everything is allocated for up front; grows if the host asks for more
+LOUDNESS_RAMP_SECONDS = 0.5  # A track's loudness gain changing mid-play (analysis finished) glides over this
+EQ_BLOCK_FRAMES = 128  # Frames per matrix product in the EQ
+EQ_KINDS = ("peak", "lowshelf", "highshelf")
+RESAMPLE_TAPS = 64
+RESAMPLE_MAX_PHASES = 1024  # Ratios needing more phases round to the nearest of these
+RESAMPLE_ROLLOFF = 0.95  # Passband edge as a fraction of the lower Nyquist frequency
+RESAMPLE_KAISER_BETA = 8.6  # About 80 dB stopband
+RESAMPLE_BLOCK_FRAMES = 512  # Output frames per gather, bounds the work buffers
+
+
+def _import_numpy():
+    global np
+    import numpy as np
+
+
+class StageCost:
+    # Time one stage spends on the audio thread against the length of audio
+    # it processed; load 0.05 means 5% of real time. Written by the audio
+    # thread with plain stores only, like PlaybackStats.
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.audio_ns = 0
+
+    def record(self, elapsed_ns, frames, sample_rate):
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.audio_ns += frames * 1_000_000_000 // sample_rate
+
+    def snapshot(self):
+        calls, total_ns, audio_ns = self.calls, self.total_ns, self.audio_ns
+        return {
+            "calls": calls,
+            "us_mean": round(total_ns / calls / 1000, 1) if calls else 0.0,
+            "us_max": self.max_ns // 1000,
+            "load": round(total_ns / audio_ns, 4) if audio_ns else 0.0,
+        }
+
+
+class GainStage:
+    # Gain on float32 blocks. The applied gain ramps linearly from the last
+    # value towards target (full scale in ramp_seconds at most), so slider
+    # moves don't click.
+    name = "gain"
+
+    def __init__(self, ramp_seconds=0.02):
+        self.ramp_seconds = ramp_seconds
+        self.current = 1.0
+        self.target = 1.0  # Set from any thread, read once per block
+        self.sample_rate = 44100
+        self._ramp = self._steps = ()
+
+    @property
+    def active(self):
+        return not self.current == self.target == 1.0
+
+    def reserve(self, frames, channels, sample_rate):
+        _import_numpy()
+        self.sample_rate = sample_rate
+        self._ramp = np.empty(frames, dtype=np.float32)
+        self._steps = np.arange(1, frames + 1, dtype=np.float32)
+
+    def reset(self):
+        self.current = self.target
+
+    def process(self, block):
+        frames = len(block)
+        start, target = self.current, self.target
+        if start == target:
+            np.multiply(block, target, out=block)
+            return
+        max_step = max(abs(start), abs(target), 1.0) * frames / (self.sample_rate * self.ramp_seconds)
+        if abs(target - start) <= max_step:
+            end = target
+        else:
+            end = start + math.copysign(max_step, target - start)
+        ramp = self._ramp[:frames]
+        np.multiply(self._steps[:frames], (end - start) / frames, out=ramp)
+        ramp += start
+        block *= ramp[:, None]
+        self.current = end
+
+
+def biquad_coefficients(kind, frequency, gain_db, q, sample_rate):
+    # (b0, b1, b2), (a1, a2) normalised by a0, from the RBJ audio EQ cookbook
+    frequency = min(max(frequency, 1.0), sample_rate * 0.49)
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * frequency / sample_rate
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    if kind == "peak":
+        b = (1 + alpha * a, -2 * cos_w0, 1 - alpha * a)
+        den = (1 + alpha / a, -2 * cos_w0, 1 - alpha / a)
+    elif kind in ("lowshelf", "highshelf"):
+        sign = 1 if kind == "lowshelf" else -1
+        shelf = 2 * math.sqrt(a) * alpha
+        b = (a * ((a + 1) - sign * (a - 1) * cos_w0 + shelf),
+             sign * 2 * a * ((a - 1) - sign * (a + 1) * cos_w0),
+             a * ((a + 1) - sign * (a - 1) * cos_w0 - shelf))
+        den = ((a + 1) + sign * (a - 1) * cos_w0 + shelf,
+               -sign * 2 * ((a - 1) + sign * (a + 1) * cos_w0),
+               (a + 1) + sign * (a - 1) * cos_w0 - shelf)
+    else:
+        raise ValueError(f"Unknown EQ band kind: {kind}")
+    return tuple(c / den[0] for c in b), (den[1] / den[0], den[2] / den[0])
+
+
+def _run_biquad(b, a, x, state):
+    # Reference direct form I, one sample at a time; only used to build the
+    # block matrices. state is (x[-1], x[-2], y[-1], y[-2]).
+    x1, x2, y1, y2 = state
+    y = []
+    for sample in x:
+        out = b[0] * sample + b[1] * x1 + b[2] * x2 - a[0] * y1 - a[1] * y2
+        x1, x2, y1, y2 = sample, x1, out, y1
+        y.append(out)
+    return y
+
+
+def biquad_block_matrices(b, a, size):
+    # H (size x size) maps a block of input to its zero-state output: lower
+    # triangular Toeplitz of the impulse response. C (size x 4) maps the
+    # direct form I state carried in from the last block to its zero-input
+    # response. y = H @ x + C @ state is then exact for any block length up
+    # to size, using the top-left corner of both.
+    impulse = np.zeros(size)
+    impulse[0] = 1.0
+    h = np.array(_run_biquad(b, a, impulse, (0.0, 0.0, 0.0, 0.0)))
+    lags = np.arange(size)[:, None] - np.arange(size)[None, :]
+    matrix = np.where(lags >= 0, h[np.clip(lags, 0, None)], 0.0)
+    zeros = np.zeros(size)
+    state_response = np.array([_run_biquad(b, a, zeros, unit) for unit in np.eye(4)]).T
+    return matrix.astype(np.float32), state_response.astype(np.float32)
+
+
+class BiquadEQ:
+    # Peaking and shelving biquads in series. Biquads are recursive, so
+    # rather than a per-sample loop each band filters EQ_BLOCK_FRAMES at a
+    # time as two matrix products (see biquad_block_matrices): exact,
+    # vectorised over frames and channels, and allocation-free once designed.
+    # Bands are (kind, frequency, gain_db, q); set_bands() builds the
+    # matrices off the audio thread and swaps them in with one store.
+    name = "eq"
+
+    def __init__(self):
+        self.bands = ()
+        self._filters = ()  # (H, C, state) per band for the current format
+        self._format = None
+        self._work = self._scratch = ()
+
+    @property
+    def active(self):
+        return bool(self._filters)
+
+    def set_bands(self, bands):
+        for kind, frequency, gain_db, q in bands:
+            if kind not in EQ_KINDS or frequency <= 0 or q <= 0:
+                raise ValueError(f"Bad EQ band: {(kind, frequency, gain_db, q)}")
+        self.bands = tuple(tuple(band) for band in bands)
+        if self._format is not None:
+            self._filters = self._design(*self._format)
+
+    def reserve(self, frames, channels, sample_rate):
+        _import_numpy()
+        if (sample_rate, channels) != self._format:
+            self._format = (sample_rate, channels)
+            self._work = np.empty((EQ_BLOCK_FRAMES, channels), dtype=np.float32)
+            self._scratch = np.empty((EQ_BLOCK_FRAMES, channels), dtype=np.float32)
+            self._filters = self._design(sample_rate, channels)
+
+    def reset(self):
+        for _, _, state in self._filters:
+            state[:] = 0
+
+    def _design(self, sample_rate, channels):
+        # The direct form I state is just the last two inputs and outputs,
+        # so it carries over unchanged when the coefficients change.
+        previous = self._filters
+        filters = []
+        for kind, frequency, gain_db, q in self.bands:
+            if gain_db == 0:
+                continue
+            index = len(filters)
+            b, a = biquad_coefficients(kind, frequency, gain_db, q, sample_rate)
+            matrix, state_response = biquad_block_matrices(b, a, EQ_BLOCK_FRAMES)
+            state = np.zeros((4, channels), dtype=np.float32)
+            if index < len(previous) and previous[index][2].shape == state.shape:
+                state[:] = previous[index][2]
+            filters.append((matrix, state_response, state))
+        return tuple(filters)
+
+    def process(self, block):
+        for matrix, state_response, state in self._filters:
+            for start in range(0, len(block), EQ_BLOCK_FRAMES):
+                x = block[start:start + EQ_BLOCK_FRAMES]
+                n = len(x)
+                y = self._work[:n]
+                np.matmul(matrix[:n, :n], x, out=y)
+                scratch = self._scratch[:n]
+                np.matmul(state_response[:n], state, out=scratch)
+                y += scratch
+                if n >= 2:
+                    state[0], state[1], state[2], state[3] = x[n - 1], x[n - 2], y[n - 1], y[n - 2]
+                else:
+                    state[1], state[3] = state[0], state[2]
+                    state[0], state[2] = x[0], y[0]
+                np.copyto(x, y)
+
+
+@lru_cache(maxsize=8)
+def resample_kernel(up, down, taps, phases):
+    # Kaiser-windowed sinc, one row per fractional output position. Row p,
+    # tap k weights the input frame k - (taps // 2 - 1) away from the output
+    # position's integer part. Each row sums to 1.
+    _import_numpy()
+    cutoff = min(1.0, up / down) * RESAMPLE_ROLLOFF
+    offsets = np.arange(taps) - (taps // 2 - 1)
+    t = offsets[None, :] - (np.arange(phases) / phases)[:, None]
+    window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1 - (t / (taps / 2)) ** 2, 0, None)))
+    kernel = cutoff * np.sinc(cutoff * t) * window
+    kernel /= kernel.sum(axis=1, keepdims=True)
+    return kernel.astype(np.float32)
+
+
+class Resampler:
+    # Polyphase windowed-sinc rate conversion for one stream of float32
+    # frames, in_rate -> out_rate = up/down in lowest terms. Output n sits at
+    # input position n * down / up, tracked exactly in integers. Inputs are
+    # appended with input_space()/commit(); process() turns as many as it can
+    # into outputs with one gather and one batched dot product per
+    # RESAMPLE_BLOCK_FRAMES.
+    # Output 0 lines up with input 0: the history starts as zeros.
+    def __init__(self, in_rate, out_rate, channels, max_frames=RESERVE_FRAMES, taps=RESAMPLE_TAPS):
+        _import_numpy()
+        divisor = math.gcd(in_rate, out_rate)
+        self.up, self.down = out_rate // divisor, in_rate // divisor
+        self.taps = taps
+        self.half = taps // 2 - 1
+        self.phases = min(self.up, RESAMPLE_MAX_PHASES)
+        self.channels = channels
+        self._kernel = resample_kernel(self.up, self.down, taps, self.phases)
+        self._offsets = np.arange(taps) - self.half
+        self._index = np.empty(RESAMPLE_BLOCK_FRAMES, dtype=np.intp)
+        self._phase = np.empty(RESAMPLE_BLOCK_FRAMES, dtype=np.intp)
+        self._rows = np.empty((RESAMPLE_BLOCK_FRAMES, taps), dtype=np.intp)
+        self._weights = np.empty((RESAMPLE_BLOCK_FRAMES, taps), dtype=np.float32)
+        self._gathered = np.empty((RESAMPLE_BLOCK_FRAMES, taps, channels), dtype=np.float32)
+        self._steps = np.arange(RESAMPLE_BLOCK_FRAMES, dtype=np.intp)
+        self.reserve(max_frames)
+        self.reset()
+
+    def reserve(self, frames):
+        # Keeps whatever input is already buffered
+        self.max_input = -(-frames * self.down // self.up) + self.taps + 2
+        buffer = np.zeros((2 * (self.max_input + self.taps), self.channels), dtype=np.float32)
+        if hasattr(self, "_buffer"):
+            self._compact()
+            buffer[:self._filled] = self._buffer[:self._filled]
+        self._buffer = buffer
+
+    def reset(self):
+        self._buffer[:self.half] = 0
+        self._filled = self.half  # Rows of _buffer holding input
+        self._pos = self.half  # Row of the next output's integer position
+        self._rem = 0  # Its fractional part, in 1/up steps
+        self.frames_in = 0  # Input committed, not counting padding
+
+    def input_needed(self, frames):
+        # Input frames still missing for the next `frames` outputs
+        last = self._pos + (self._rem + (frames - 1) * self.down) // self.up
+        return max(0, last + self.taps - self.half - self._filled)
+
+    def input_space(self, frames):
+        if self._filled + frames > len(self._buffer):
+            self._compact()
+        return self._buffer[self._filled:self._filled + frames]
+
+    def commit(self, frames):
+        self._filled += frames
+        self.frames_in += frames
+
+    def pad(self, frames):
+        # Silence after the last input, so the tail can be flushed out
+        self.input_space(frames)[:] = 0
+        self._filled += frames
+
+    def available(self):
+        # Outputs that can be produced from the input committed so far
+        room = self._filled - self.taps + self.half - self._pos
+        if room < 0:
+            return 0
+        return ((room + 1) * self.up - 1 - self._rem) // self.down + 1
+
+    def process(self, out):
+        # Fills out (frames, channels) completely; the caller makes sure
+        # available() covers it.
+        up, down = self.up, self.down
+        for start in range(0, len(out), RESAMPLE_BLOCK_FRAMES):
+            target = out[start:start + RESAMPLE_BLOCK_FRAMES]
+            n = len(target)
+            index, phase = self._index[:n], self._phase[:n]
+            np.multiply(self._steps[:n], down, out=index)
+            index += self._rem
+            np.remainder(index, up, out=phase)
+            if self.phases != up:
+                phase *= self.phases
+                phase //= up
+            index //= up
+            index += self._pos
+            rows = self._rows[:n]
+            np.add(index[:, None], self._offsets[None, :], out=rows)
+            gathered = self._gathered[:n]
+            np.take(self._buffer, rows, axis=0, out=gathered, mode="clip")  # "raise" would buffer
+            weights = self._weights[:n]
+            np.take(self._kernel, phase, axis=0, out=weights, mode="clip")
+            np.matmul(weights[:, None, :], gathered, out=target[:, None, :])
+            advance = self._rem + n * down
+            self._pos += advance // up
+            self._rem = advance % up
+
+    def _compact(self):
+        drop = self._pos - self.half
+        np.copyto(self._buffer[:self._filled - drop], self._buffer[drop:self._filled])
+        self._filled -= drop
+        self._pos -= drop
+
+
+class SourceReader:
+    # Reads a PCM source as float32 frames at the output stream's rate, with
+    # the track's loudness gain applied, resampling when the rates differ.
+    # Built next to the source, off the audio thread, so that thread only
+    # ever calls read(). Setting loudness.target changes the gain smoothly.
+    def __init__(self, source, output_rate, max_frames=RESERVE_FRAMES):
+        _import_numpy()
+        self.source = source
+        self.output_rate = output_rate
+        self.channels = source.channels
+        self.resampler = (Resampler(source.sample_rate, output_rate, source.channels, max_frames)
+                          if source.sample_rate != output_rate else None)
+        self.frames_out = 0
+        self._total_out = None  # Known once the source has run dry
+        self.loudness = GainStage(LOUDNESS_RAMP_SECONDS)
+        self.loudness.current = self.loudness.target = source.gain
+        self.reserve(max_frames)
+
+    def reserve(self, frames):
+        self.max_frames = frames
+        if self.resampler is not None:
+            self.resampler.reserve(frames)
+            frames = self.resampler.max_input
+        self.loudness.reserve(frames, self.channels, self.source.sample_rate)
+        self._bytes = bytearray(frames * self.channels * 2)
+        self._view = memoryview(self._bytes)
+        self._samples = np.frombuffer(self._bytes, dtype=np.int16).reshape(-1, self.channels)
+
+    @property
+    def exhausted(self):
+        if self.resampler is None:
+            return self.source.exhausted
+        return self._total_out is not None and self.frames_out >= self._total_out
+
+    @property
+    def remaining_frames(self):
+        # At the output rate; an estimate for sources that don't know their
+        # exact length up front
+        remaining = self.source.remaining_frames
+        if self.resampler is None:
+            return remaining
+        return remaining * self.resampler.up // self.resampler.down + self.resampler.available()
+
+    def input_wanted(self, frames):
+        # Source frames the next read() of `frames` would use
+        if self.resampler is None:
+            return frames
+        return self.resampler.input_needed(frames)
+
+    def read(self, out):
+        # Fills the start of out (frames, channels); returns the frame count.
+        # Short only if the source is behind or finished.
+        if len(out) > self.max_frames:
+            self.reserve(len(out))  # Only if the host asks for a bigger buffer
+        resampler = self.resampler
+        if resampler is None:
+            return self._convert(out)
+        wanted = len(out)
+        if self._total_out is None:
+            needed = resampler.input_needed(wanted)
+            while needed > 0:
+                count = self._convert(resampler.input_space(needed))
+                if not count:
+                    break
+                resampler.commit(count)
+                needed -= count
+            if self.source.exhausted:
+                self._total_out = -(-resampler.frames_in * resampler.up // resampler.down)
+                resampler.pad(resampler.taps)
+        count = min(wanted, resampler.available())
+        if self._total_out is not None:
+            count = min(count, self._total_out - self.frames_out)
+        if count > 0:
+            resampler.process(out[:count])
+            self.frames_out += count
+        return max(count, 0)
+
+    def _convert(self, out):
+        # int16 from the source straight into out as float32 * gain
+        frames = min(len(out), len(self._samples))
+        count = self.source.read_into(self._view[:frames * self.channels * 2]) // (self.channels * 2)
+        out = out[:count]
+        np.copyto(out, self._samples[:count])  # Multiplying int16 directly would go through float64
+        loudness = self.loudness
+        if loudness.current == loudness.target:
+            out *= loudness.target / 32768
+        else:
+            out *= 1 / 32768
+            loudness.process(out)
+        return count
+
+
+class Crossfade:
+    # Equal-power crossfade. While active, the block coming in holds the new
+    # track and the outgoing one is read from its own SourceReader and mixed
+    # underneath, sin/cos weighted over `length` frames. Goes inactive (and
+    # lets go of the reader) once the fade is over or the old track runs out.
+    name = "crossfade"
+
+    def __init__(self):
+        self.reader = None
+        self.position = 0
+        self.length = 1
+        self._other = self._fade_in = self._fade_out = self._steps = ()
+
+    @property
+    def active(self):
+        return self.reader is not None
+
+    def reserve(self, frames, channels, sample_rate):
+        _import_numpy()
+        self._other = np.zeros((frames, channels), dtype=np.float32)
+        self._fade_in = np.empty(frames, dtype=np.float32)
+        self._fade_out = np.empty(frames, dtype=np.float32)
+        self._steps = np.arange(frames, dtype=np.float32)
+
+    def start(self, reader, length):
+        self.position = 0
+        self.length = max(1, length)
+        self.reader = reader
+
+    def reset(self):
+        self.reader = None
+
+    def process(self, block):
+        frames = len(block)
+        if frames > len(self._steps):
+            self.reserve(frames, block.shape[1], 0)  # Only if the host asks for a bigger buffer
+        other = self._other[:frames]
+        count = self.reader.read(other)
+        other[count:] = 0
+        fade_in, fade_out = self._fade_in[:frames], self._fade_out[:frames]
+        np.add(self._steps[:frames], self.position, out=fade_in)
+        np.minimum(fade_in, self.length, out=fade_in)
+        fade_in *= math.pi / 2 / self.length
+        np.cos(fade_in, out=fade_out)
+        np.sin(fade_in, out=fade_in)
+        block *= fade_in[:, None]
+        other *= fade_out[:, None]
+        block += other
+        self.position += frames
+        if self.position >= self.length or self.reader.exhausted:
+            self.reader = None
+
+
+def to_int16(block, out):
+    # Full-scale float32 frames into int16, rounded and clipped; block is
+    # used as scratch
+    np.multiply(block, 32768, out=block)
+    np.rint(block, out=block)
+    np.clip(block, -32768, 32767, out=block)
+    np.copyto(out, block, casting="unsafe")
+
+
+class DSPChain:
+    # Runs its stages in order over a float32 (frames, channels) block, each
+    # on the whole block at once. Stages that would do nothing are skipped.
+    # costs has a StageCost per stage plus any extra names, for work the
+    # engine does outside the chain (reading and resampling the source).
+    def __init__(self, stages, extra_costs=()):
+        self.stages = tuple(stages)
+        self.costs = {name: StageCost(name) for name in
+                      tuple(extra_costs) + tuple(stage.name for stage in self.stages)}
+        self._stage_costs = tuple(self.costs[stage.name] for stage in self.stages)
+        self.sample_rate = 44100
+
+    def reserve(self, frames, channels, sample_rate):
+        self.sample_rate = sample_rate
+        for stage in self.stages:
+            stage.reserve(frames, channels, sample_rate)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, block):
+        for stage, cost in zip(self.stages, self._stage_costs):
+            if stage.active:
+                started = time.perf_counter_ns()
+                stage.process(block)
+                cost.record(time.perf_counter_ns() - started, len(block), self.sample_rate)
+
+    def record(self, name, started_ns, frames):
+        # For work done outside process(), timed by the caller
+        self.costs[name].record(time.perf_counter_ns() - started_ns, frames, self.sample_rate)
+
+    def reset_costs(self):
+        for cost in self.costs.values():
+            cost.reset()
+
+    def cost_snapshot(self):
+        return {name: cost.snapshot() for name, cost in self.costs.items()}
@@ -0,0 +1,116 @@
+from collections import namedtuple
+
+import numpy as np
+
+RING_FRAMES = 16384  # About 0.35 s at 48 kHz; must exceed one callback block
+MAX_CHANNELS = 8
+FFT_FRAMES = 2048
+SPECTRUM_BANDS = 24
+LOWEST_BAND_HZ = 40.0
+SILENCE_DB = -90.0
+
+# Per channel rms/peak in dBFS, and the spectrum as SPECTRUM_BANDS values in
+# dB relative to a full-scale sine
+MeterReading = namedtuple("MeterReading", "rms_db peak_db bands_db")
+
+
+class SampleRing:
+    # Single-producer/single-consumer ring of the int16 samples just played.
+    # The audio callback is the only writer: write() is at most two slice
+    # copies into memory allocated up front, then one attribute store that
+    # publishes them. The reader never blocks the writer; it copies the
+    # newest samples and checks afterwards whether the writer lapped it
+    # during the copy, in which case that reading is dropped.
+    def __init__(self, frames=RING_FRAMES, max_channels=MAX_CHANNELS):
+        self._buffer = np.zeros(frames * max_channels, dtype=np.int16)
+        self.frames = frames
+        self.size = frames
+        self.channels = 1
+        self.sample_rate = 0
+        self.written = 0  # Samples written since configure(), never wraps
+
+    def configure(self, sample_rate, channels):
+        # Owner thread, while no stream is running
+        self.channels = channels
+        self.size = self.frames * channels
+        self.written = 0
+        self.sample_rate = sample_rate
+
+    def write(self, samples):
+        # Audio thread. samples is a whole number of frames.
+        count = len(samples)
+        if count > self.size:
+            samples = samples[count - self.size:]
+        size = self.size
+        start = (self.written + count - len(samples)) % size
+        first = min(len(samples), size - start)
+        self._buffer[start:start + first] = samples[:first]
+        if first < len(samples):
+            self._buffer[:len(samples) - first] = samples[first:]
+        self.written += count
+
+    def read_latest(self, out):
+        # Copies the newest len(out) samples into out. False if there aren't
+        # that many yet or the writer overwrote them mid-copy.
+        count, size = len(out), self.size
+        end = self.written
+        if end < count or count > size:
+            return False
+        start = (end - count) % size
+        first = min(count, size - start)
+        out[:first] = self._buffer[start:start + first]
+        if first < count:
+            out[first:] = self._buffer[:count - first]
+        return self.written - end <= size - count
+
+
+class LevelMeter:
+    # Reads the ring on the GUI thread: rms and peak per channel plus a
+    # log-spaced spectrum from a Hann-windowed FFT of the channel mix.
+    def __init__(self, ring, fft_frames=FFT_FRAMES, bands=SPECTRUM_BANDS):
+        self.ring = ring
+        self.fft_frames = fft_frames
+        self.bands = bands
+        self.dropped = 0  # Readings skipped because the writer lapped us
+        self._window = np.hanning(fft_frames).astype(np.float32)
+        # A full-scale sine puts sum(window) / 2 into its bin, and its energy
+        # is spread over the window's noise bandwidth (1.5 bins for Hann)
+        self._reference = float(self._window.sum()) / 2
+        self._bandwidth = fft_frames * float(np.sum(self._window ** 2)) / float(self._window.sum()) ** 2
+        self._scratch = None
+        self._band_starts = None
+        self._format = None
+        self._last_written = -1
+
+    def read(self):
+        # None when nothing new has been played since the last reading
+        ring = self.ring
+        if not ring.sample_rate or ring.written == self._last_written:
+            return None
+        channels = ring.channels
+        if self._format != (ring.sample_rate, channels):
+            self._prepare(ring.sample_rate, channels)
+        self._last_written = ring.written
+        if not ring.read_latest(self._scratch):
+            self.dropped += 1
+            return None
+        frames = self._scratch.reshape(-1, channels).astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(frames * frames, axis=0))
+        peak = np.abs(frames).max(axis=0)
+        magnitudes = np.abs(np.fft.rfft(frames.mean(axis=1) * self._window)) / self._reference
+        energy = np.add.reduceat(magnitudes * magnitudes, self._band_starts)[:self.bands] / self._bandwidth
+        return MeterReading(to_db(rms), to_db(peak), to_db(np.sqrt(energy)))
+
+    def _prepare(self, sample_rate, channels):
+        self._format = (sample_rate, channels)
+        self._scratch = np.zeros(self.fft_frames * channels, dtype=np.int16)
+        # Band edges spaced evenly in log frequency from LOWEST_BAND_HZ to
+        # Nyquist; low bands narrower than one bin still get a bin each
+        bin_hz = sample_rate / self.fft_frames
+        edges = np.geomspace(LOWEST_BAND_HZ, sample_rate / 2, self.bands + 1)
+        starts = np.maximum(np.round(edges[:-1] / bin_hz).astype(int), np.arange(1, self.bands + 1))
+        self._band_starts = np.append(starts, self.fft_frames // 2)
+
+
+def to_db(values):
+    return np.maximum(20 * np.log10(np.maximum(values, 1e-9)), SILENCE_DB)
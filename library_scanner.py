@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+AUDIO_EXTENSIONS = frozenset({".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac"})
+
+
+def is_audio_file(path, extensions=AUDIO_EXTENSIONS):
+    return os.path.splitext(path)[1].lower() in extensions
+
+
+class ScanJob:
+    # One recursive walk. Every directory is its own pool task, so large
+    # trees (and slow network shares) are listed in parallel. Results are
+    # handed out in batches through on_batch(paths), from pool threads, and
+    # files gone since the last scan through on_removed(paths).
+    def __init__(self, scanner, root, on_batch, on_progress, incremental, on_removed=None):
+        self.root = root
+        self.future = Future()
+        self.files_found = 0
+        self.dirs_scanned = 0
+        self._scanner = scanner
+        self._on_batch = on_batch
+        self._on_progress = on_progress
+        self._on_removed = on_removed
+        self._incremental = incremental
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._batch = []
+        self._cancelled = threading.Event()
+        self._last_progress = 0.0
+
+    def start(self):
+        self._submit(self.root)
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _submit(self, path):
+        with self._lock:
+            self._pending += 1
+        self._scanner._executor.submit(self._visit, path)
+
+    def _visit(self, path):
+        try:
+            if not self._cancelled.is_set():
+                files, subdirs, removed = self._scanner._list_dir(path, self._incremental)
+                for subdir in subdirs:
+                    self._submit(subdir)
+                self._add(files)
+                if removed and self._on_removed:
+                    self._on_removed(removed)
+        except Exception as e:
+            logging.warning(f"Scanning {path} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.dirs_scanned += 1
+                done = self._pending == 0
+            if done:
+                self._finish()
+            else:
+                self._report_progress()
+
+    def _add(self, files):
+        if not files:
+            return
+        with self._lock:
+            self.files_found += len(files)
+            self._batch.extend(files)
+            if len(self._batch) < self._scanner.batch_size:
+                return
+            batch, self._batch = self._batch, []
+        self._on_batch(batch)
+
+    def _report_progress(self):
+        # Throttled so a tree with thousands of folders doesn't flood the UI
+        if self._on_progress is None:
+            return
+        now = time.monotonic()
+        if now - self._last_progress >= 0.1:
+            self._last_progress = now
+            self._on_progress(self.dirs_scanned, self.files_found)
+
+    def _finish(self):
+        with self._lock:
+            batch, self._batch = self._batch, []
+        try:
+            if batch and not self._cancelled.is_set():
+                self._on_batch(batch)
+            if self._on_progress:
+                self._on_progress(self.dirs_scanned, self.files_found)
+        finally:
+            self.future.set_result(self.files_found)
+
+
+class LibraryScanner:
+    # Keeps the last listing of every directory it has seen. An incremental
+    # scan re-lists only directories whose mtime changed (adding or removing
+    # an entry bumps it) and reports only their files; unchanged directories
+    # are merely stat'ed so their subfolders can still be visited. Files a
+    # re-listed directory no longer has, and everything under directories
+    # that are gone, are reported as removed.
+    def __init__(self, max_workers=None, batch_size=500, extensions=AUDIO_EXTENSIONS):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)  # I/O bound, NAS friendly
+        self.batch_size = batch_size
+        self.extensions = extensions
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scanner")
+        self._dir_state = {}  # path -> (mtime_ns, subdirs, files)
+        self._state_lock = threading.Lock()
+
+    def scan(self, root, on_batch, on_progress=None, incremental=False, on_removed=None):
+        return ScanJob(self, os.path.abspath(root), on_batch, on_progress, incremental, on_removed).start()
+
+    def reset(self):
+        # Forget every listing, so the next incremental scan lists everything
+        with self._state_lock:
+            self._dir_state.clear()
+
+    def _forget(self, path):
+        # Drops the state of path and the directories under it; returns the
+        # files they held. Called with the state lock held.
+        files = []
+        stack = [path]
+        while stack:
+            state = self._dir_state.pop(stack.pop(), None)
+            if state is not None:
+                stack.extend(state[1])
+                files.extend(state[2])
+        return files
+
+    def _list_dir(self, path, incremental):
+        # (files to report, subdirectories to visit, files gone since last time)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._state_lock:
+                removed = self._forget(path)
+            if not removed:
+                raise
+            return [], [], removed
+        with self._state_lock:
+            state = self._dir_state.get(path)
+        if incremental and state and state[0] == mtime:
+            return [], state[1], []
+
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file() and is_audio_file(entry.name, self.extensions):
+                        files.append(entry.path)
+                except OSError:
+                    continue
+        files.sort()
+        subdirs.sort()
+        removed = []
+        with self._state_lock:
+            if state:
+                removed = sorted(set(state[2]).difference(files))
+                for subdir in set(state[1]).difference(subdirs):
+                    removed += self._forget(subdir)
+            self._dir_state[path] = (mtime, subdirs, files)
+        return files, subdirs, removed
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,87 @@
+import pyaudio
+
+HISTOGRAM_BUCKETS = 24  # bucket i holds callbacks that took [2**(i-1), 2**i) microseconds
+
+
+class PlaybackStats:
+    # Counters for the real-time path. Only the audio thread writes and it
+    # only does integer/float stores and list item increments, so there are
+    # no locks; readers take a snapshot and may see a value one callback old.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.callbacks = 0
+        self.output_underflows = 0
+        self.output_overflows = 0
+        self.input_underflows = 0
+        self.input_overflows = 0
+        self.priming_output = 0
+        self.late_callbacks = 0  # took longer than the audio they produced
+        self.max_callback_us = 0
+        self.callback_histogram = [0] * HISTOGRAM_BUCKETS
+        self.buffer_fill = 0.0
+        self.lead_seconds = 0.0
+        self.min_lead_seconds = None
+
+    def record_status(self, status):
+        if status & pyaudio.paOutputUnderflow:
+            self.output_underflows += 1
+        if status & pyaudio.paOutputOverflow:
+            self.output_overflows += 1
+        if status & pyaudio.paInputUnderflow:
+            self.input_underflows += 1
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if status & pyaudio.paPrimingOutput:
+            self.priming_output += 1
+
+    def record_callback(self, elapsed_ns, frame_count, sample_rate, source):
+        elapsed_us = elapsed_ns // 1000
+        self.callbacks += 1
+        self.callback_histogram[min(elapsed_us.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        if elapsed_us > self.max_callback_us:
+            self.max_callback_us = elapsed_us
+        if sample_rate and elapsed_ns * sample_rate > frame_count * 1_000_000_000:
+            self.late_callbacks += 1
+        if source is not None:
+            self.buffer_fill = source.buffer_fill
+            self.lead_seconds = source.buffered_bytes / (source.frame_size * source.sample_rate)
+            if self.min_lead_seconds is None or self.lead_seconds < self.min_lead_seconds:
+                self.min_lead_seconds = self.lead_seconds
+
+    def percentile_us(self, fraction):
+        # Upper bound of the histogram bucket holding the given percentile
+        histogram = list(self.callback_histogram)
+        target = fraction * sum(histogram)
+        running = 0
+        for bucket, count in enumerate(histogram):
+            running += count
+            if count and running >= target:
+                return 1 << bucket
+        return 0
+
+    def snapshot(self):
+        return {
+            "callbacks": self.callbacks,
+            "output_underflows": self.output_underflows,
+            "output_overflows": self.output_overflows,
+            "input_underflows": self.input_underflows,
+            "input_overflows": self.input_overflows,
+            "priming_output": self.priming_output,
+            "late_callbacks": self.late_callbacks,
+            "callback_us_p50": self.percentile_us(0.5),
+            "callback_us_p99": self.percentile_us(0.99),
+            "callback_us_max": self.max_callback_us,
+            "callback_histogram": list(self.callback_histogram),
+            "buffer_fill": round(self.buffer_fill, 3),
+            "lead_seconds": round(self.lead_seconds, 3),
+            "min_lead_seconds": round(self.min_lead_seconds or 0.0, 3),
+        }
+
+    def log_line(self):
+        s = self.snapshot()
+        return (f"Playback: {s['callbacks']} callbacks, {s['output_underflows']} underflows, "
+                f"{s['output_overflows']} overflows, {s['late_callbacks']} late, "
+                f"callback p50<{s['callback_us_p50']}us p99<{s['callback_us_p99']}us max {s['callback_us_max']}us, "
+                f"buffer {s['buffer_fill']:.0%}, lead {s['lead_seconds']:.2f}s (min {s['min_lead_seconds']:.2f}s)")
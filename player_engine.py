@@ -0,0 +1,1005 @@
+import asyncio
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from functools import partial
+
+import pyaudio
+
+from audio_cache import DecodedAudioCache, cache_key
+from audio_output import PyAudioOutput
+from audio_stream import (SAMPLE_WIDTH, MappedPCMSource, PCMBufferSource, StreamingSource, TrackPrefetcher,
+                          read_wav_layout)
+from background_loader import BackgroundLoader
+from dsp import RESERVE_FRAMES, BiquadEQ, Crossfade, DSPChain, GainStage, SourceReader, to_int16
+from library_scanner import LibraryScanner
+from playback_stats import PlaybackStats
+from playlist_io import existing_entries, is_playlist, read_playlist, write_m3u
+from playlist_model import Playlist
+from search_index import SearchIndex
+from seek_index import SeekIndexCache
+from shuffle_order import ShuffleOrder
+from tag_reader import TagReader
+from track_analysis import (ANALYSIS_DB_PATH, TrackAnalysisStore, TrackAnalyzer, TrackInfo,
+                            gain_for_peak, pcm_peak)
+from waveform import WaveformBuilder, WaveformStore
+
+AUDIO_CACHE_BYTES = 512 * 1024 * 1024  # Budget for decoded PCM kept in memory
+STATS_LOG_INTERVAL = 10.0  # Seconds between playback stats log lines while playing
+OFFLINE_DECODE_TIMEOUT = 10.0  # How long an offline sink waits on a decoder before padding with silence
+REPEAT_MODES = ("off", "one", "all")
+MAX_CROSSFADE_SECONDS = 12.0
+
+
+class PlayerEngine:
+    # Everything needed to play a playlist, without any Qt: decoding,
+    # buffering, the output stream, navigation and loading. A view drives it
+    # through the public methods and listens for (event, value) pairs:
+    #   "state"    "playing", "paused" or "stopped"
+    #   "track"    index of the track now playing
+    #   "seek"     position in seconds the current track just jumped to
+    #   "analysis" path of a track whose peak/duration/waveform just became known
+    #   "tags"     paths of tracks whose tags were just read
+    #   "volume"   new volume, 0.0 - 1.0
+    #   "progress" status line while a load is running
+    #   "error"    message to show the user
+    # Engine methods and listeners belong to one owner thread. Work finishing
+    # on the audio, loader, scanner or analyzer threads is handed back through
+    # post(callable); the Qt view posts via a queued signal, and without a
+    # post hook callables wait in a queue for process_events().
+    def __init__(self, post=None, audio_cache_bytes=AUDIO_CACHE_BYTES, analysis_db_path=ANALYSIS_DB_PATH):
+        self._events = queue.SimpleQueue()
+        self.post = post or self._events.put
+        self._listeners = []
+
+        self.playlist = Playlist()
+        self.current_track_index = 0
+        self.current_track_path = None # Lets the index follow the track when the playlist is edited
+        self.current_sound = None # Output stream while a track is loaded, None when stopped
+        self.shuffled = False
+        self.shuffle = ShuffleOrder() # Play order while shuffled; the playlist itself is never reordered
+        self.repeat_mode = "off"
+        self.volume = 1.0
+        self.previous_volume = 1.0
+        self.audio_cache = DecodedAudioCache(audio_cache_bytes) # Decoded PCM by path/mtime/size
+        self.analysis = TrackAnalysisStore(analysis_db_path) # Persistent peak/duration/format per track
+        self.waveforms = WaveformStore(os.path.join(os.path.dirname(analysis_db_path), "peaks")) # Overview peak files
+        self.analyzer = TrackAnalyzer(
+            self.analysis, on_done=lambda path, info: self.post(partial(self.on_track_analyzed, path, info)),
+            waveforms=self.waveforms)
+        self.scanner = LibraryScanner()
+        self.loader = BackgroundLoader() # Long-lived loop that runs every file/folder/playlist load
+        self.library_roots = [] # Folders added this session, for rescans
+        self.extinf = {} # path -> (duration, title) from loaded playlists, kept for saving
+        self.tags = {} # path -> TrackTags, for tracks that have any
+        self.tag_reader = TagReader(self.analysis, on_done=self.on_tags_ready)
+        self.search_index = SearchIndex() # Words of every playlist entry's tags and names, filled by the tag pool
+        self.search_in_order = True # Search index order is still playlist order (only appends so far)
+        self.current_source = None # PCM source read by audio_callback
+        self.streaming_decode = True # Decode through an ffmpeg pipe instead of loading the whole file
+        self.memory_map_pcm = True # Play 16-bit PCM WAV straight from a memory map, no decoding
+        self.prefetcher = TrackPrefetcher(self.open_source) # Prepares the next track for gapless playback
+        self.seek_indexes = SeekIndexCache() # Restart points in compressed files, built per streamed track
+        self._seek_lock = threading.Lock()
+        self._pending_seek = None # (track index, source, frame) for the audio thread to switch to
+        self._end_signalled = False
+        self.current_sr = None # Rate of the open stream
+        self.current_frame = 0 # playback frame, at the stream's rate
+        self.channels = None # audio channels
+        self.format = None # pyaudio format
+        self.output_rate = None # Fixed stream rate every track is resampled to; None follows each file
+        self.crossfade_seconds = 0.0 # Overlap between consecutive tracks; 0 hands over gaplessly
+        self.crossfade = Crossfade()
+        self.eq = BiquadEQ()
+        self.output_gain = GainStage() # Volume, ramped on the audio thread
+        self.dsp = DSPChain([self.crossfade, self.eq, self.output_gain], extra_costs=("read", "resample"))
+        self._fading_source = None # Previous track, mixed under the current one during a crossfade
+        self.playback_stats = PlaybackStats() # Written by audio_callback, read by stats()
+        self._render_frames = RESERVE_FRAMES
+        self._render_buffer = None # Allocated for each stream format, see allocate_render_buffer()
+        self.meter_ring = None # SampleRing the callback copies output into while a meter is shown
+        self.output = PyAudioOutput() # Device or sink; keeps its stream open across tracks
+        self.playlist.add_listener(self.on_playlist_changed)
+
+    # --- Events ---
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, event, value=None):
+        for callback in self._listeners:
+            callback(event, value)
+
+    def process_events(self, timeout=None):
+        # Runs everything posted since the last call, waiting up to timeout
+        # for the first one. Only needed when no post hook was given.
+        try:
+            func = self._events.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        while True:
+            func()
+            try:
+                func = self._events.get_nowait()
+            except queue.Empty:
+                return True
+
+    @property
+    def has_pending_events(self):
+        return not self._events.empty()
+
+    @property
+    def state(self):
+        if self.current_sound is None:
+            return "stopped"
+        return "playing" if self.current_sound.is_active() else "paused"
+
+    @property
+    def position(self):
+        # Seconds into the current track, counting a seek the audio thread
+        # hasn't picked up yet
+        if not self.current_sr:
+            return 0.0
+        pending = self._pending_seek
+        if pending:
+            return pending[2] / pending[1].sample_rate
+        return self.current_frame / self.current_sr
+
+    @property
+    def duration(self):
+        source = self.current_source
+        return source.duration if source else 0.0
+
+    # --- Settings ---
+
+    def set_repeat_mode(self, mode):
+        if mode not in REPEAT_MODES:
+            raise ValueError(f"Unknown repeat mode: {mode}")
+        self.repeat_mode = mode
+        logging.info(f"Repeat mode set to: {mode}")
+        if self.current_sound:
+            self.schedule_prefetch()
+
+    def set_shuffle(self, enabled, seed=None):
+        # Shuffling only changes which track comes next: the playlist keeps
+        # its order and the current track keeps playing, first in the new order
+        self.shuffled = enabled
+        if enabled:
+            self.shuffle.reshuffle(len(self.playlist), self.current_track_index, seed)
+            logging.info(f"Shuffle on (seed {self.shuffle.seed}).")
+        else:
+            logging.info("Shuffle off.")
+        if self.current_sound:
+            self.schedule_prefetch()
+
+    def step_index(self, step):
+        # The playlist index step tracks from the current one, wrapping round
+        if self.shuffled:
+            return self.shuffle.neighbour(self.current_track_index, step, wrap=True)
+        return (self.current_track_index + step) % len(self.playlist)
+
+    def set_volume(self, volume):
+        # Only store the target volume.  audio_callback ramps towards it.
+        self.volume = max(0.0, min(1.0, float(volume)))
+        logging.debug(f"Volume set to: {self.volume}")
+        self._notify("volume", self.volume)
+
+    def set_eq(self, bands):
+        # (kind, frequency, gain_db, q) per band, kind one of dsp.EQ_KINDS;
+        # no bands turns the EQ off. Takes effect at the next buffer.
+        self.eq.set_bands(bands)
+        logging.info(f"EQ set to: {list(self.eq.bands)}")
+
+    def set_crossfade(self, seconds):
+        self.crossfade_seconds = max(0.0, min(MAX_CROSSFADE_SECONDS, float(seconds)))
+        logging.info(f"Crossfade set to: {self.crossfade_seconds:.1f}s")
+
+    def set_output_rate(self, rate):
+        # None opens each track's stream at the file's own rate. A fixed rate
+        # resamples everything to it, so tracks of any rate hand over (and
+        # crossfade) on one stream. Applies from the next track.
+        self.output_rate = int(rate) if rate else None
+        logging.info(f"Output rate set to: {self.output_rate or 'file rate'}")
+        self.prefetcher.cancel()
+        if self.current_sound:
+            self.schedule_prefetch()
+
+    def set_output(self, output):
+        # Switches device, latency profile or sink. Playback carries on from
+        # the same position on the new output.
+        playing, position = self.state == "playing", self.position
+        if self.current_sound:
+            self.stop()
+        self.output.shutdown()
+        self.output = output
+        logging.info(f"Output set to: {output.description}")
+        if playing:
+            self.play_current_track()
+            if position:
+                self.seek(position)
+
+    def toggle_mute(self):
+        if self.volume > 0.0:
+            # Mute: Store current volume and set to 0
+            self.previous_volume = self.volume
+            self.set_volume(0.0)
+            logging.debug("Muted")
+        else:
+            # Unmute: Restore previous volume
+            self.set_volume(self.previous_volume)
+            logging.debug("Unmuted")
+
+    # --- Playlist and loading ---
+
+    def clear_playlist(self):
+        if self.current_sound:
+            self.stop()
+        self.prefetcher.cancel()
+        self.current_track_index = 0
+        self.current_track_path = None
+        self.tag_reader.cancel()
+        self.playlist.clear()
+        self.extinf.clear()
+        self.tags.clear()
+        self.search_index.clear()
+        self.search_in_order = True
+        self.audio_cache.clear()
+        self.library_roots.clear()
+        self.scanner.reset() # Folders added again are listed in full
+        logging.info("Playlist cleared")
+
+    def load(self, paths, description="load", autoplay=True):
+        # Files, folders and .m3u/.m3u8/.pls playlists, in any mix
+        return self.loader.submit(self.add_files_async(paths, autoplay), description)
+
+    def scan_folder(self, folder_path, incremental=False):
+        return self.loader.submit(self.add_folder_to_playlist_async(folder_path, incremental),
+                                  f"scan of {folder_path}")
+
+    def rescan_library(self):
+        # Only folders whose mtime changed since the last scan are re-listed
+        for folder_path in self.library_roots:
+            self.scan_folder(folder_path, incremental=True)
+
+    def cancel_loading(self):
+        if not self.loader.busy:
+            return False
+        self.loader.cancel_all()
+        return True
+
+    def add_loaded_files(self, file_paths):
+        added = self.playlist.extend(file_paths)
+        self.search_index.reserve(added) # The tag pool's batches finish in any order
+        self.tag_reader.request(added)
+        logging.debug(f"Added {len(added)} files to the playlist")
+
+    def add_library_root(self, folder_path):
+        if folder_path not in self.library_roots:
+            self.library_roots.append(folder_path)
+
+    def remove_missing_files(self, file_paths):
+        # Files a rescan found gone from disk
+        indices = [index for path in file_paths if (index := self.playlist.index_of(path)) >= 0]
+        removed = self.playlist.remove_indices(indices)
+        for path in removed:
+            self.tags.pop(path, None)
+            self.extinf.pop(path, None)
+        if removed:
+            logging.info(f"Removed {len(removed)} missing files from the playlist")
+
+    def add_loaded_entries(self, entries):
+        # Playlist entries, with whatever #EXTINF/PLS said about them
+        for entry in entries:
+            if (entry.duration is not None or entry.title) and entry.path not in self.extinf:
+                self.extinf[entry.path] = (entry.duration, entry.title)
+        self.add_loaded_files([entry.path for entry in entries])
+
+    def on_tags_ready(self, results):
+        # Runs on the tag pool, a batch at a time. Indexing there keeps a
+        # 100k-entry load from spending seconds on the owner thread; the
+        # index has its own lock, and #EXTINF titles are in place before a
+        # path is handed to the pool.
+        for path, tags in results:
+            folder, name = os.path.split(path)
+            extinf = self.extinf.get(path)
+            self.search_index.set(path, (os.path.splitext(name)[0], os.path.basename(folder),
+                                         extinf and extinf[1], tags.title, tags.artist, tags.album))
+        self.post(partial(self.on_tags_read, results))
+
+    def on_tags_read(self, results):
+        read = []
+        for path, tags in results:
+            if path not in self.playlist:
+                continue  # Cleared (or removed) while its batch was out
+            if any(tags):
+                self.tags[path] = tags
+            read.append(path)
+        if read:
+            self._notify("tags", read)
+
+    def display_name(self, path):
+        # "Artist - Title" from the tags, else the #EXTINF title, else the file name
+        tags = self.tags.get(path)
+        if tags and tags.title:
+            return f"{tags.artist} - {tags.title}" if tags.artist else tags.title
+        extinf = self.extinf.get(path)
+        if extinf and extinf[1]:
+            return extinf[1]
+        return os.path.basename(path)
+
+    def search(self, query, limit=None):
+        # (playlist index, path) of up to limit entries matching query, in
+        # playlist order
+        if not self.search_in_order:
+            # Entries were moved or inserted mid-list: sort every match
+            found = [(index, path) for path in self.search_index.search(query)
+                     if (index := self.playlist.index_of(path)) >= 0]
+            return heapq.nsmallest(limit, found) if limit is not None else sorted(found)
+        paths = self.search_index.search(query, limit)
+        results = [(index, path) for path in paths if (index := self.playlist.index_of(path)) >= 0]
+        if len(results) < len(paths):
+            # Some matches have been removed from the playlist since
+            results = [(index, path) for path in self.search_index.search(query)
+                       if (index := self.playlist.index_of(path)) >= 0][:limit]
+        return results
+
+    def on_load_finished(self, autoplay):
+        # Only starts playback when nothing is playing (or paused), so adding
+        # files mid-track doesn't restart it
+        if autoplay and self.playlist and self.current_sound is None:
+            self.play_current_track()
+
+    def on_playlist_changed(self, change):
+        # Called once per playlist batch, however many entries it touched
+        appended_after_current = change.kind == "insert" and change.start > self.current_track_index
+        if change.kind == "move" or change.kind == "insert" and change.start + change.count < len(self.playlist):
+            self.search_in_order = False
+        if self.current_track_path is not None and not appended_after_current:
+            index = self.playlist.index_of(self.current_track_path)
+            if index >= 0:
+                self.current_track_index = index
+        if self.shuffled:
+            self.update_shuffle(change)
+        if self.current_sound:
+            self.schedule_prefetch()  # The track after the current one may have changed
+
+    def update_shuffle(self, change):
+        # Appended tracks are dealt into the rest of the order; anything else
+        # moves indices around, so the order starts over from the current track
+        if change.kind == "insert" and change.start == len(self.shuffle):
+            self.shuffle.extend(change.count, self.current_track_index)
+            if change.start == 0 and self.current_sound is None:
+                self.current_track_index = self.shuffle.first()
+        else:
+            self.shuffle.reshuffle(len(self.playlist), self.current_track_index)
+
+    def save_playlist_to_file(self, file_path):
+        # Extended M3U: analysed durations first, then the tags, then
+        # whatever the playlist the track came from said
+        try:
+            paths = list(self.playlist)
+            durations = {path: info[0] for path, info in self.extinf.items() if info[0] is not None}
+            durations.update((path, tags.duration) for path, tags in self.tags.items() if tags.duration)
+            durations.update(self.analysis.durations(paths))
+            titles = {path: info[1] for path, info in self.extinf.items() if info[1]}
+            titles.update((path, self.display_name(path)) for path, tags in self.tags.items() if tags.title)
+            write_m3u(file_path, paths, durations, titles)
+            logging.info(f"Playlist saved to {file_path} ({len(paths)} entries)")
+            return True
+        except Exception as e:
+            logging.exception(f"Error saving playlist to {file_path}: {e}")
+            self._notify("error", f"Error saving playlist: {e}")
+            return False
+
+    # The coroutines below run on the loader's event loop, not the owner
+    # thread. They never touch the playlist; results are posted back.
+
+    def _post_files(self, file_paths):
+        self.post(partial(self.add_loaded_files, file_paths))
+
+    def _post_event(self, event, value=None):
+        self.post(partial(self._notify, event, value))
+
+    async def add_files_async(self, file_paths, autoplay=True):
+        logging.debug(f"add_files_async called with: {file_paths}")
+        is_dir = await asyncio.gather(*(self.loader.run_io(os.path.isdir, path) for path in file_paths))
+        tasks = []
+        single_files = []
+        for path, path_is_dir in zip(file_paths, is_dir):
+            if is_playlist(path) and not path_is_dir:
+                tasks.append(self.load_playlist_from_file_async(path))
+            elif path_is_dir:
+                tasks.append(self.add_folder_to_playlist_async(path))
+            else:
+                single_files.append(path)
+
+        if single_files:
+            self._post_files(single_files)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Posted after every batch above, so the playlist is complete by
+            # the time the owner decides whether to start playing.
+            self.post(partial(self.on_load_finished, autoplay))
+
+    async def add_folder_to_playlist_async(self, folder_path, incremental=False):
+        logging.debug(f"add_folder_to_playlist_async called with: {folder_path}")
+        self.post(partial(self.add_library_root, folder_path))
+        name = os.path.basename(folder_path)
+        job = self.scanner.scan(
+            folder_path, self._post_files,
+            lambda dirs, files: self._post_event("progress", f"Scanning {name}: {files} files in {dirs} folders"),
+            incremental=incremental,
+            on_removed=lambda paths: self.post(partial(self.remove_missing_files, paths)))
+        try:
+            await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        logging.debug(f"  Found {job.files_found} audio files under {folder_path}")
+
+    async def load_playlist_from_file_async(self, file_path, chunk_size=2000, checks_in_flight=4):
+        # Parsing happens a chunk at a time on the I/O pool, and each chunk's
+        # existence checks are a single pool job. Up to checks_in_flight
+        # chunks are checked at once; results are posted in playlist order.
+        logging.debug(f"load_playlist_from_file_async called with: {file_path}")
+        name = os.path.basename(file_path)
+        chunks = read_playlist(file_path, chunk_size)
+        # A cancelled load stops waiting while a pool thread may still be
+        # inside next(), so the generator is closed on the pool too, once
+        # that thread has come out
+        reading = threading.Lock()
+
+        def next_chunk():
+            with reading:
+                return next(chunks, None)
+
+        def close_chunks():
+            with reading:
+                chunks.close()
+
+        pending = []
+        try:
+            while True:
+                item = await self.loader.run_io(next_chunk)
+                if item is None:
+                    break
+                chunk, fraction = item
+                pending.append((asyncio.ensure_future(self.loader.run_io(existing_entries, chunk)), fraction))
+                if len(pending) >= checks_in_flight:
+                    await self._post_checked(pending.pop(0), name)
+            while pending:
+                await self._post_checked(pending.pop(0), name)
+        except asyncio.CancelledError:
+            for future, _ in pending:
+                future.cancel()
+            raise
+        except Exception as e:
+            for future, _ in pending:
+                future.cancel()
+            logging.exception(f"Error loading playlist: {e}")
+            self._post_event("error", f"Error loading playlist: {e}")
+        finally:
+            self.loader.loop.run_in_executor(None, close_chunks)
+
+    async def _post_checked(self, item, name):
+        future, fraction = item
+        self.post(partial(self.add_loaded_entries, await future))
+        self._post_event("progress", f"Loading {name}: {fraction:.0%}")
+
+    # --- Transport ---
+
+    def play_current_track(self):
+        if self.current_sound:
+            self.stop()  # Stop and close any existing stream
+
+        if self.playlist:
+            if self.current_track_index >= len(self.playlist) or self.current_track_index < 0:
+                self.current_track_index = 0
+            try:
+                logging.debug(f"Trying to play: {self.playlist[self.current_track_index]}")
+                logging.debug(f"Audio cache: {self.audio_cache.stats()}")
+                file_path = self.playlist[self.current_track_index]
+                self.current_track_path = file_path
+
+                # Use the prefetched source if the worker already prepared this track
+                source = self.prefetcher.take(self.current_track_index, file_path)
+                if source is None:
+                    source = self.open_source(file_path)
+                self.current_source = source
+                self.current_sr = source.reader.output_rate
+                self.channels = source.channels
+                self.format = pyaudio.paInt16
+                self.current_frame = 0
+                self.allocate_render_buffer(max(self._render_frames, self.output.frames_per_buffer),
+                                            self.channels)
+                self.output_gain.target = self.volume
+                self.dsp.reset()  # A new track starts from silence, nothing to ramp from
+                if self.meter_ring is not None:
+                    self.meter_ring.configure(self.current_sr, self.channels)
+
+                # The stream from the last track is reused unless the format changed
+                self.current_sound = self.output.open(self.current_sr, self.channels, self.audio_callback)
+                self._end_signalled = False
+                self.current_sound.start_stream()
+                self._notify("track", self.current_track_index)
+                self._notify("state", "playing")
+                self.schedule_prefetch()
+
+            except Exception as e:
+                logging.exception(f"Error during playback setup: {e}")
+                if self.current_source:
+                    self.current_source.close()
+                    self.current_source = None
+                self.current_sound = None
+                self._notify("state", "stopped")
+                self._notify("error", f"Error playing file: {e}")
+
+    def play_track(self, index):
+        # Jumping to a track while shuffled plays it next in the order, so
+        # previous leads back to what was playing and not to its neighbours
+        if 0 <= index < len(self.playlist):
+            if self.shuffled and self.current_sound is not None:
+                self.shuffle.move_after(index, self.current_track_index)
+            self.current_track_index = index
+            self.play_current_track()
+
+    def play_pause(self):
+        if self.current_sound:
+            if self.current_sound.is_active():
+                self.current_sound.stop_stream()
+                self._notify("state", "paused")
+            else:
+                self.current_sound.start_stream()
+                self._notify("state", "playing")
+        elif self.playlist:
+            self.play_current_track()
+
+    def stop(self):
+        if self.current_sound:
+            self.output.stop()  # The stream stays open for the next track
+            self.current_sound = None
+        self.drop_pending_seek()
+        self.drop_crossfade()
+        if self.current_source:
+            self.current_source.close()
+            self.current_source = None
+        self.current_sr = None
+        self.current_frame = 0
+        self._notify("state", "stopped")
+
+    def next_track(self):
+        if self.playlist:
+            if self.repeat_mode != "one":
+                self.current_track_index = self.step_index(1)
+            self.play_current_track()
+
+    def previous_track(self):
+        if self.playlist:
+            if self.repeat_mode != "one":
+                self.current_track_index = self.step_index(-1)
+            self.play_current_track()
+
+    def seek(self, seconds):
+        # Jumps within the current track without touching the output stream:
+        # a source is opened at the target frame and the audio thread
+        # switches to it at its next buffer, the same way it hands over to a
+        # prefetched track.
+        if self.current_sound is None or self.current_source is None:
+            return False
+        index, file_path = self.current_track_index, self.current_track_path
+        sample_rate = self.current_source.sample_rate
+        frame = round(max(0.0, seconds) * sample_rate)
+        if self.current_source.duration:
+            frame = min(frame, int(self.current_source.duration * sample_rate))
+        try:
+            started = time.perf_counter()
+            source = self.open_source(file_path, start_frame=frame, output_rate=self.current_sr)
+        except Exception as e:
+            logging.exception(f"Error seeking in {file_path}: {e}")
+            self._notify("error", f"Error seeking: {e}")
+            return False
+        if source.channels != self.channels:
+            # The file was replaced since it started playing
+            source.close()
+            self.play_current_track()
+            return False
+        if self.current_sound.is_active():
+            with self._seek_lock:
+                stale, self._pending_seek = self._pending_seek, (index, source, frame)
+            if stale:
+                stale[1].close()
+        else:
+            # Paused: the callback isn't running, so switch here
+            self.drop_pending_seek()
+            self.drop_crossfade()
+            previous, self.current_source = self.current_source, source
+            self.current_frame = round(frame * self.current_sr / sample_rate)
+            previous.close()
+        logging.debug(f"Seek to {frame / sample_rate:.3f}s in {os.path.basename(file_path)}"
+                      f" took {(time.perf_counter() - started) * 1000:.1f}ms")
+        self._notify("seek", frame / sample_rate)
+        return True
+
+    def drop_pending_seek(self):
+        with self._seek_lock:
+            pending, self._pending_seek = self._pending_seek, None
+        if pending:
+            pending[1].close()
+
+    def drop_crossfade(self):
+        # Owner thread, while the callback isn't running
+        self.crossfade.reset()
+        fading, self._fading_source = self._fading_source, None
+        if fading:
+            fading.close()
+
+    def attach_meter(self, ring):
+        # Configured before it is published, so a running callback only ever
+        # sees a ring set up for the current format. None detaches.
+        if ring is not None and self.current_sr:
+            ring.configure(self.current_sr, self.channels)
+        self.meter_ring = ring
+
+    def shutdown(self):
+        self.stop()
+        self.prefetcher.shutdown()
+        self.seek_indexes.shutdown()
+        self.analyzer.shutdown()
+        self.tag_reader.shutdown()
+        self.scanner.shutdown()
+        self.loader.shutdown()
+        self.output.shutdown()
+
+    # --- Decoding and gapless hand-over ---
+
+    def open_source(self, file_path, start_frame=0, output_rate=None):
+        # Runs on the owner thread for the first track and for seeks, and on
+        # the prefetch worker for every track after it. Loudness is corrected
+        # on output with the stored peak instead of rescanning the track with
+        # normalize(). The source is read at output_rate, by default the
+        # engine's fixed rate or else the file's own.
+        key = cache_key(file_path)
+        info = self.analysis.get(key)
+        layout = read_wav_layout(file_path) if self.memory_map_pcm else None
+        mappable = layout is not None and layout.bits_per_sample == SAMPLE_WIDTH * 8
+        cached = None if mappable else self.audio_cache.get(key)
+        decoded = None # Whole track as PCM, so analysis needn't decode it again
+        waveform = None # Overview built by the streaming decode itself
+        if mappable:
+            # Already in the output format: nothing to decode and nothing to
+            # cache, the page cache holds it.
+            source = MappedPCMSource(file_path, layout)
+            source.seek(start_frame)
+        elif cached:
+            source = PCMBufferSource(cached.data, cached.sample_rate, cached.channels, file_path)
+            source.seek(start_frame)
+            decoded = (cached.data, cached.sample_rate, cached.channels)
+        elif self.streaming_decode:
+            # Start decoding in the background; only wait for the prebuffer.
+            # Tracks small enough for the cache are captured as they decode,
+            # and finish decoding even when skipped before the end.
+            # A track analysed before doesn't need probing again.
+            stream_format = (info.sample_rate, info.channels, info.duration) if info else None
+            if start_frame:
+                # Until the track's seek index is built, ffmpeg seeks itself
+                source = StreamingSource(file_path, start_frame=start_frame,
+                                         seek_index=self.seek_indexes.get(file_path),
+                                         stream_format=stream_format)
+            else:
+                def store(data):
+                    self.audio_cache.put(key, data, source.sample_rate, source.channels)
+                if info is not None and self.analyzer.needs(key, info):
+                    # Analysed before it had an overview: draw it from this
+                    # decode rather than running a second one
+                    waveform = WaveformBuilder(info.channels, int(info.duration * info.sample_rate))
+                source = StreamingSource(file_path, on_complete=store, stream_format=stream_format,
+                                         capture_limit=self.audio_cache.max_entry_bytes, waveform=waveform,
+                                         on_waveform=partial(self.store_waveform, file_path, key))
+                self.seek_indexes.prepare(file_path)
+            source.start()
+            source.wait_ready()
+        else:
+            # Load and prepare audio using Pydub
+            from pydub import AudioSegment
+            audio = AudioSegment.from_file(file_path)
+            audio = audio.set_sample_width(2)  # 16-bit
+            self.audio_cache.put(key, audio.raw_data, audio.frame_rate, audio.channels)
+            source = PCMBufferSource(audio.raw_data, audio.frame_rate, audio.channels, file_path)
+            source.seek(start_frame)
+            decoded = (audio.raw_data, audio.frame_rate, audio.channels)
+            if info is None:
+                # Already fully decoded, so the peak costs one pass over memory
+                info = TrackInfo(pcm_peak(audio.raw_data), audio.duration_seconds,
+                                 audio.frame_rate, audio.channels)
+                self.analysis.put(key, info)
+        if waveform is None and self.analyzer.needs(key, info):
+            self.analyzer.request(file_path, decoded)
+        if info is not None:
+            source.gain = gain_for_peak(info.peak)
+        # Float conversion, loudness gain and resampling for the audio thread
+        source.reader = SourceReader(source, output_rate or self.output_rate or source.sample_rate)
+        return source
+
+    def store_waveform(self, file_path, key, waveform, sample_rate):
+        # From a streamed decode's thread, once the whole track came through
+        self.waveforms.put(key, waveform.finish(sample_rate))
+        self._post_event("analysis", file_path)
+
+    def waveform(self, file_path):
+        # Overview of a track from its peak file, or None until analysed
+        try:
+            return self.waveforms.get(cache_key(file_path))
+        except OSError:
+            return None
+
+    def peek_next_index(self):
+        # The track playback continues with when the current one ends, or None
+        if not self.playlist:
+            return None
+        if self.repeat_mode == "one":
+            return self.current_track_index
+        if self.shuffled:
+            next_index = self.shuffle.neighbour(self.current_track_index, 1)
+            first = self.shuffle.first()
+        else:
+            next_index = self.current_track_index + 1
+            first = 0
+            if next_index >= len(self.playlist):
+                next_index = None
+        if next_index is not None:
+            return next_index
+        return first if self.repeat_mode == "all" else None
+
+    def schedule_prefetch(self):
+        next_index = self.peek_next_index()
+        if next_index is not None:
+            self.prefetcher.request(next_index, self.playlist[next_index])
+
+    def on_track_analyzed(self, file_path, info):
+        gain = gain_for_peak(info.peak)
+        source = self.current_source
+        if source is not None and source.file_path == file_path:
+            # First play of a new track: it started at unity, so ease into
+            # the corrected level instead of jumping
+            source.gain = gain
+            source.reader.loudness.target = gain
+        self.prefetcher.update_gain(file_path, gain)
+        self._notify("analysis", file_path)
+
+    def on_track_advanced(self, previous_source):
+        # previous_source is None when it is still fading out
+        if previous_source is not None:
+            previous_source.close()
+        self._notify("track", self.current_track_index)
+        self.schedule_prefetch()
+
+    def on_playback_ended(self, next_index):
+        # The callback ran out of audio without a usable prefetched source
+        # (not ready yet, different format, or end of playlist).
+        if next_index < 0:
+            self.current_track_index = 0
+            self.stop()
+        else:
+            self.current_track_index = next_index
+            self.play_current_track()
+
+    # --- Stats ---
+
+    def stats(self):
+        return {
+            "playback": self.playback_stats.snapshot(),
+            "dsp": self.dsp.cost_snapshot(),
+            "audio_cache": self.audio_cache.stats(),
+        }
+
+    def log_stats(self):
+        if self.current_sound and self.current_sound.is_active():
+            logging.info(self.playback_stats.log_line())
+            loads = ", ".join(f"{name} {cost['load']:.2%}" for name, cost in self.dsp.cost_snapshot().items()
+                              if cost["calls"])
+            logging.info(f"DSP load: {loads}")
+
+    # --- Audio thread ---
+
+    def allocate_render_buffer(self, frames, channels):
+        # Reused by every audio_callback for one stream format; only grows if
+        # the host asks for more frames than it has room for.
+        import numpy as np
+        self._render_frames = frames
+        self._render_buffer = bytearray(frames * channels * 2)
+        self._render_view = memoryview(self._render_buffer)
+        self._render_samples = np.frombuffer(self._render_buffer, dtype=np.int16)
+        self._render_out = self._render_samples.reshape(frames, channels)
+        self._mix_block = np.zeros((frames, channels), dtype=np.float32)
+        self.dsp.reserve(frames, channels, self.current_sr or 44100)
+
+    def audio_callback(self, in_data, frame_count, time_info, status):
+        started = time.perf_counter_ns()
+        if status:
+            # Underflow/overflow flags are counted, not fatal: one late
+            # buffer shouldn't end the track.
+            self.playback_stats.record_status(status)
+        result = self.render_block(frame_count)
+        self.playback_stats.record_callback(time.perf_counter_ns() - started, frame_count,
+                                            self.current_sr, self.current_source)
+        return result
+
+    def render_block(self, frame_count):
+        if frame_count > self._render_frames:
+            self.allocate_render_buffer(frame_count, self.channels)
+        if self._pending_seek is not None:
+            self.switch_to_seek()
+        if self.crossfade_seconds and self._fading_source is None:
+            self.start_crossfade()
+
+        # Fill the float block; a streaming source may return less than
+        # requested if the decoder is falling behind.
+        block = self._mix_block[:frame_count]
+        filled = self.render_from_source(block, 0)
+
+        # At the end of the track, carry on with the prefetched one in the same
+        # buffer so there is no gap between tracks. Sinks with no deadline
+        # wait for a decoder that has fallen behind instead of inserting silence.
+        while filled < frame_count:
+            if self.current_source.reader.exhausted:
+                if not self.switch_to_prefetched():
+                    break
+                self.current_frame = 0
+            elif self.output.realtime or not self.current_source.wait_for_data(
+                    self.current_source.reader.input_wanted(frame_count - filled), OFFLINE_DECODE_TIMEOUT):
+                break
+            filled = self.render_from_source(block, filled)
+        finished = filled < frame_count and self.current_source.reader.exhausted
+        if self._fading_source is not None and not self.output.realtime:
+            self._fading_source.wait_for_data(self._fading_source.reader.input_wanted(frame_count),
+                                              OFFLINE_DECODE_TIMEOUT)
+
+        # Pad with silence if we're near the end of the data
+        if filled < frame_count:
+            block[filled:] = 0
+
+        # Crossfade, EQ and volume, then back to int16 for the device
+        self.output_gain.target = self.volume
+        self.dsp.process(block)
+        if self._fading_source is not None and not self.crossfade.active:
+            self.post(self._fading_source.close)
+            self._fading_source = None
+        finished = finished and self._fading_source is None
+        to_int16(block, self._render_out[:frame_count])
+
+        # The last buffer only holds what was left, so sinks end exactly
+        # there; PortAudio pads it with silence.
+        chunk_size = (filled if finished else frame_count) * self.channels * 2  # 2 bytes per sample (int16)
+        meter_ring = self.meter_ring
+        if meter_ring is not None:
+            meter_ring.write(self._render_samples[:chunk_size // 2])
+
+        # PyAudio only accepts immutable bytes back, so this copy is the one
+        # allocation left per buffer.
+        return (bytes(self._render_view[:chunk_size]), pyaudio.paComplete if finished else pyaudio.paContinue)
+
+    def render_from_source(self, block, start):
+        # Reads the current track into block[start:] as float32 at the
+        # stream's rate, with its loudness correction applied
+        reader = self.current_source.reader
+        started = time.perf_counter_ns()
+        count = reader.read(block[start:])
+        self.dsp.record("read" if reader.resampler is None else "resample", started, count)
+        self.current_frame += count
+        return start + count
+
+    def take_prefetched(self):
+        # (index, source) of the track after this one; source is None unless
+        # the prefetcher has it ready for the open stream
+        next_index = self.peek_next_index()
+        if next_index is None:
+            return None, None
+        return next_index, self.prefetcher.take(next_index, self.playlist[next_index],
+                                                self.current_sr, self.channels)
+
+    def advance_to(self, index, source):
+        previous_source = self.current_source
+        self.current_source = source
+        self.current_track_index = index
+        self.current_track_path = self.playlist[index]
+        return previous_source
+
+    def switch_to_prefetched(self):
+        # Called from the audio thread. Never decodes or notifies listeners;
+        # anything that can't be done here is posted to the owner thread.
+        next_index, source = self.take_prefetched()
+        if source is None:
+            self.signal_playback_ended(-1 if next_index is None else next_index)
+            return False
+        previous_source = self.advance_to(next_index, source)
+        self.post(partial(self.on_track_advanced, previous_source))
+        return True
+
+    def start_crossfade(self):
+        # Audio thread. Once the current track is within the crossfade length
+        # of its end, the prefetched next track takes over as current_source
+        # and the old one carries on underneath it, fading out. Nothing
+        # happens if the next track isn't ready yet; it then follows
+        # gaplessly instead.
+        reader = self.current_source.reader
+        fade_frames = int(self.crossfade_seconds * self.current_sr)
+        remaining = reader.remaining_frames
+        if remaining > fade_frames or reader.exhausted:
+            return
+        next_index, source = self.take_prefetched()
+        if source is None:
+            return
+        self._fading_source = self.advance_to(next_index, source)
+        self.crossfade.start(reader, remaining)
+        self.current_frame = 0
+        self.post(partial(self.on_track_advanced, None))
+
+    def switch_to_seek(self):
+        with self._seek_lock:
+            pending, self._pending_seek = self._pending_seek, None
+        if pending is None:
+            return
+        index, source, frame = pending
+        if index != self.current_track_index:
+            # Playback already moved on to the next track
+            self.post(source.close)
+            return
+        if self._fading_source is not None:
+            self.crossfade.reset()
+            self.post(self._fading_source.close)
+            self._fading_source = None
+        previous_source = self.current_source
+        self.current_source = source
+        self.current_frame = round(frame * self.current_sr / source.sample_rate)
+        self.post(previous_source.close)
+
+    def signal_playback_ended(self, next_index):
+        if not self._end_signalled:
+            self._end_signalled = True
+            self.post(partial(self.on_playback_ended, next_index))
+
+
+def run_headless(paths, repeat_mode="off", volume=1.0, crossfade=0.0, output_rate=None, output=None,
+                 shuffle=False, seed=None):
+    # Plays everything in paths on the calling thread's event queue and
+    # returns once the playlist has finished (or on Ctrl+C). output is an
+    # AudioOutput, the default device if None; seed replays a shuffle order.
+    engine = PlayerEngine()
+    if output is not None:
+        engine.set_output(output)
+    engine.set_repeat_mode(repeat_mode)
+    engine.set_volume(volume)
+    engine.set_crossfade(crossfade)
+    engine.set_output_rate(output_rate)
+    if shuffle:
+        engine.set_shuffle(True, seed)
+
+    def report(event, value):
+        if event == "track":
+            info = engine.analysis.lookup(engine.current_track_path)
+            duration = f" ({int(info.duration) // 60}:{int(info.duration) % 60:02d})" if info else ""
+            logging.info(f"Now Playing: {engine.display_name(engine.current_track_path)}{duration}")
+        elif event == "progress":
+            logging.info(value)
+        elif event == "error":
+            logging.error(value)
+
+    engine.add_listener(report)
+    task = engine.load(paths, "command line load")
+    next_stats = time.monotonic() + STATS_LOG_INTERVAL
+    try:
+        while not task.done or engine.has_pending_events or engine.current_sound:
+            engine.process_events(timeout=0.5)
+            if time.monotonic() >= next_stats:
+                engine.log_stats()
+                next_stats += STATS_LOG_INTERVAL
+    except KeyboardInterrupt:
+        logging.info("Interrupted")
+    finally:
+        logging.info(engine.playback_stats.log_line())
+        engine.shutdown()
+    return 0 if engine.playlist else 1
@@ -0,0 +1,780 @@
+import time
+
+from PyQt6.QtWidgets import (QApplication, QWidget, QPushButton, QLabel,
+                             QHBoxLayout, QVBoxLayout, QSlider, QFileDialog,
+                             QMessageBox, QMenuBar, QMenu, QLineEdit, QListWidget,
+                             QListWidgetItem)
+from PyQt6.QtCore import Qt, QLineF, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QAction, QActionGroup, QColor, QKeySequence, QPainter, QPalette, QPixmap
+
+from player_engine import STATS_LOG_INTERVAL, PlayerEngine
+
+METER_FPS = 30
+METER_FLOOR_DB = -60.0  # Bottom of the meter scale
+METER_FALL_DB_PER_SECOND = 24.0  # Release of the bars and peak markers
+METER_PEAK_HOLD_SECONDS = 1.0
+SEARCH_RESULT_LIMIT = 200  # Matches listed under the search box
+
+ICON_NAMES = (
+    "mdi.play", "mdi.pause", "mdi.stop", "mdi.skip-previous", "mdi.skip-next",
+    "mdi.volume-high", "mdi.volume-off", "mdi.folder-open", "mdi.folder-refresh",
+    "mdi.file-music-outline", "mdi.playlist-music-outline", "mdi.playlist-remove",
+    "mdi.content-save", "mdi.cancel", "mdi.exit-to-app", "mdi.shuffle-variant",
+    "mdi.information-outline", "mdi.magnify",
+)
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+class IconCache:
+    # qtawesome takes a few hundred ms to import and renders a new QIcon on
+    # every icon() call. Widgets register the icon they want here; the whole
+    # set is built once, after the window's first paint, and toggles only
+    # swap prebuilt icons.
+    def __init__(self, names=ICON_NAMES):
+        self.names = names
+        self._icons = {}
+        self._targets = {}  # button or action -> icon name
+
+    @property
+    def ready(self):
+        return bool(self._icons)
+
+    def set_icon(self, target, name):
+        self._targets[target] = name
+        if name in self._icons:
+            target.setIcon(self._icons[name])
+
+    def build(self):
+        import qtawesome
+        self._icons = {name: qtawesome.icon(name) for name in self.names}
+        for target, name in self._targets.items():
+            target.setIcon(self._icons[name])
+
+
+class WaveformView(QWidget):
+    # Overview of the whole track with a playhead. The waveform is drawn into
+    # a pixmap once per track and size; position updates only blit it and
+    # draw the playhead line on top. Clicking seeks.
+    seek_requested = pyqtSignal(float)  # seconds
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(48)
+        self.waveform = None
+        self.position = 0.0
+        self.duration = 0.0
+        self._pixmap = None
+
+    def set_waveform(self, waveform):
+        if waveform is not self.waveform:
+            self.waveform = waveform
+            self._pixmap = None
+            self.update()
+
+    def set_position(self, position, duration):
+        if (position, duration) != (self.position, self.duration):
+            self.position, self.duration = position, duration
+            self.update()
+
+    def resizeEvent(self, event):
+        self._pixmap = None
+        super().resizeEvent(event)
+
+    def mousePressEvent(self, event):
+        if self.duration > 0 and event.button() == Qt.MouseButton.LeftButton:
+            fraction = min(max(event.position().x() / max(self.width(), 1), 0.0), 1.0)
+            self.seek_requested.emit(fraction * self.duration)
+
+    def paintEvent(self, event):
+        if self._pixmap is None:
+            self._pixmap = self.render_waveform()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._pixmap)
+        if self.duration > 0:
+            x = self.width() * min(self.position / self.duration, 1.0)
+            painter.setPen(self.palette().color(QPalette.ColorRole.Highlight))
+            painter.drawLine(QLineF(x, 0, x, self.height()))
+        painter.end()
+
+    def render_waveform(self):
+        width, height = max(self.width(), 1), self.height()
+        pixmap = QPixmap(width, height)
+        pixmap.fill(self.palette().color(QPalette.ColorRole.Base))
+        painter = QPainter(pixmap)
+        painter.setPen(self.palette().color(QPalette.ColorRole.Text))
+        middle = height / 2
+        if self.waveform is None:
+            painter.drawLine(QLineF(0, middle, width, middle))
+        else:
+            import numpy as np
+            mins, maxs = self.waveform.level_for(width)
+            if len(mins) > width:
+                starts = (np.arange(width) * len(mins)) // width
+                mins, maxs = np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+            else:
+                columns = (np.arange(width) * len(mins)) // width
+                mins, maxs = mins[columns], maxs[columns]
+            tops = middle - maxs.astype(np.float64) * (middle / 32768)
+            bottoms = middle - mins.astype(np.float64) * (middle / 32768)
+            painter.drawLines([QLineF(x + 0.5, top, x + 0.5, bottom)
+                               for x, (top, bottom) in enumerate(zip(tops.tolist(), bottoms.tolist()))])
+        painter.end()
+        return pixmap
+
+
+class MeterView(QWidget):
+    # Level bars per channel (rms filled, held peak as a marker) on the left
+    # and spectrum bands on the right. Only draws; readings come from the
+    # window's meter timer, and the bars fall back smoothly between them.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(40)
+        self.rms = []
+        self.peaks = []
+        self.held = []  # (dB, time it was reached)
+        self.bands = []
+        self._updated = None
+
+    def show_reading(self, reading, now):
+        # reading is a level_meter.MeterReading, or None to let the bars fall
+        fall = METER_FALL_DB_PER_SECOND * (now - self._updated if self._updated else 0.0)
+        self._updated = now
+        if reading is None:
+            self.rms = [max(v - fall, METER_FLOOR_DB) for v in self.rms]
+            self.peaks = [max(v - fall, METER_FLOOR_DB) for v in self.peaks]
+            self.bands = [max(v - fall, METER_FLOOR_DB) for v in self.bands]
+        else:
+            self.rms = self._fall_towards(self.rms, reading.rms_db.tolist(), fall)
+            self.peaks = self._fall_towards(self.peaks, reading.peak_db.tolist(), fall)
+            self.bands = self._fall_towards(self.bands, reading.bands_db.tolist(), fall)
+        if len(self.held) != len(self.peaks):
+            self.held = [(peak, now) for peak in self.peaks]
+        # Held peaks stay put for METER_PEAK_HOLD_SECONDS, then fall
+        self.held = [(peak, now) if peak >= held
+                     else (held, since) if now - since < METER_PEAK_HOLD_SECONDS
+                     else (max(held - fall, peak), since)
+                     for peak, (held, since) in zip(self.peaks, self.held)]
+        self.update()
+
+    def reset(self):
+        self.rms, self.peaks, self.held, self.bands = [], [], [], []
+        self._updated = None
+        self.update()
+
+    @staticmethod
+    def _fall_towards(shown, new, fall):
+        # Attack is instant, release is limited to the fall rate
+        if len(shown) != len(new):
+            return new
+        return [max(target, current - fall) for current, target in zip(shown, new)]
+
+    @staticmethod
+    def _fraction(db):
+        return min(max((db - METER_FLOOR_DB) / -METER_FLOOR_DB, 0.0), 1.0)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        palette = self.palette()
+        painter.fillRect(self.rect(), palette.color(QPalette.ColorRole.Base))
+        bar_color = palette.color(QPalette.ColorRole.Highlight)
+        hot_color = QColor(220, 60, 40)
+        levels_width = self.width() * 2 // 5
+        height = self.height()
+        if self.rms:
+            row = height / len(self.rms)
+            for channel, (rms, (held, _)) in enumerate(zip(self.rms, self.held)):
+                top = int(channel * row) + 1
+                bar_height = max(int(row) - 2, 1)
+                painter.fillRect(0, top, int(levels_width * self._fraction(rms)), bar_height, bar_color)
+                x = int(levels_width * self._fraction(held))
+                painter.fillRect(max(x - 2, 0), top, 2, bar_height, hot_color if held > -0.1 else bar_color)
+        if self.bands:
+            left = levels_width + 6
+            band_width = (self.width() - left) / len(self.bands)
+            for band, level in enumerate(self.bands):
+                bar = int(height * self._fraction(level))
+                painter.fillRect(int(left + band * band_width), height - bar,
+                                 max(int(band_width) - 1, 1), bar, bar_color)
+        painter.end()
+
+
+class KtiseosNyxPlayer(QWidget):
+    # A view over PlayerEngine: builds the widgets, forwards clicks and menu
+    # actions to the engine and redraws when the engine reports an event.
+    invoke = pyqtSignal(object)  # callable posted by the engine from any thread
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("KtiseosNyx Player")
+        self.setMinimumSize(250, 100)
+        self.icons = IconCache()
+        self.first_paint_time = None # perf_counter() of the first paint, for startup timing
+
+        # Queued even when emitted on the GUI thread, so engine callbacks
+        # always run in posting order and never re-enter a running slot.
+        self.invoke.connect(lambda func: func(), Qt.ConnectionType.QueuedConnection)
+        self.engine = PlayerEngine(post=self.invoke.emit)
+
+        self.init_ui()
+        self.create_menu_bar()
+
+        # Puts the normal status back once load progress stops arriving
+        self.load_status_timer = QTimer(self)
+        self.load_status_timer.setSingleShot(True)
+        self.load_status_timer.setInterval(1500)
+        self.load_status_timer.timeout.connect(self.update_status_label)
+
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(int(STATS_LOG_INTERVAL * 1000))
+        self.stats_timer.timeout.connect(self.engine.log_stats)
+        self.stats_timer.start()
+
+        # Moves the position slider along while a track plays
+        self.position_timer = QTimer(self)
+        self.position_timer.setInterval(250)
+        self.position_timer.timeout.connect(self.update_position)
+
+        # Reads the level meter at up to METER_FPS while a track plays
+        self.meter = None # level_meter.LevelMeter, created with the first playback
+        self.meter_timer = QTimer(self)
+        self.meter_timer.setInterval(1000 // METER_FPS)
+        self.meter_timer.timeout.connect(self.update_meter)
+        self._meter_resume_at = 0.0
+        self.meter_frames_dropped = 0
+
+        # Refreshes the search results while tags and playlist batches
+        # arrive, at most a few times a second
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.update_search_results)
+
+        self.engine.add_listener(self.on_engine_event)
+        self.engine.playlist.add_listener(self.on_playlist_changed)
+
+    def init_ui(self):
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
+
+        # --- Volume Controls (Slider and Mute Button) ---
+        volume_layout = QHBoxLayout()
+        self.volume_slider = QSlider(Qt.Orientation.Horizontal)
+        self.volume_slider.setMinimum(0)
+        self.volume_slider.setMaximum(100)
+        self.volume_slider.setValue(int(self.engine.volume * 100))
+        self.volume_slider.valueChanged.connect(self.set_volume)
+        volume_layout.addWidget(self.volume_slider)
+
+        self.mute_button = QPushButton()
+        self.icons.set_icon(self.mute_button, 'mdi.volume-high')
+        self.mute_button.setIconSize(QSize(24, 24))
+        self.mute_button.clicked.connect(self.engine.toggle_mute)
+        self.mute_button.setToolTip("Mute/Unmute")
+        self.mute_button.setFixedWidth(40)
+        volume_layout.addWidget(self.mute_button)
+
+        # --- Volume Level Label ---
+        self.volume_label = QLabel("100%")
+        self.volume_label.setFixedWidth(40)
+        self.volume_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        volume_layout.addWidget(self.volume_label)
+
+
+        main_layout.addLayout(volume_layout)
+
+        # --- Position Slider (milliseconds) ---
+        position_layout = QHBoxLayout()
+        self.position_label = QLabel(format_time(0))
+        self.position_label.setFixedWidth(40)
+        self.position_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        position_layout.addWidget(self.position_label)
+
+        self.position_slider = QSlider(Qt.Orientation.Horizontal)
+        self.position_slider.setEnabled(False)
+        self.position_slider.setSingleStep(5000)
+        self.position_slider.setPageStep(30000)
+        self.position_slider.valueChanged.connect(self.on_position_slider_changed)
+        self.position_slider.sliderReleased.connect(self.seek_to_slider)
+        position_layout.addWidget(self.position_slider)
+
+        self.duration_label = QLabel(format_time(0))
+        self.duration_label.setFixedWidth(40)
+        self.duration_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        position_layout.addWidget(self.duration_label)
+
+        main_layout.addLayout(position_layout)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch(1)
+
+        self.prev_button = QPushButton()
+        self.icons.set_icon(self.prev_button, 'mdi.skip-previous')
+        self.prev_button.setIconSize(QSize(24, 24))
+        self.prev_button.clicked.connect(self.engine.previous_track)
+        button_layout.addWidget(self.prev_button)
+
+        self.play_pause_button = QPushButton()
+        self.icons.set_icon(self.play_pause_button, 'mdi.play')
+        self.play_pause_button.setIconSize(QSize(24, 24))
+        self.play_pause_button.clicked.connect(self.engine.play_pause)
+        self.play_pause_button.setText("Play")
+        button_layout.addWidget(self.play_pause_button)
+
+        self.stop_button = QPushButton()
+        self.icons.set_icon(self.stop_button, 'mdi.stop')
+        self.stop_button.setIconSize(QSize(24, 24))
+        self.stop_button.clicked.connect(self.engine.stop)
+        button_layout.addWidget(self.stop_button)
+
+        self.next_button = QPushButton()
+        self.icons.set_icon(self.next_button, 'mdi.skip-next')
+        self.next_button.setIconSize(QSize(24, 24))
+        self.next_button.clicked.connect(self.engine.next_track)
+        button_layout.addWidget(self.next_button)
+
+        self.load_button = QPushButton("Load")
+        self.icons.set_icon(self.load_button, 'mdi.folder-open')
+        self.load_button.setIconSize(QSize(24,24))
+        self.load_button.clicked.connect(self.load_files)
+        button_layout.addWidget(self.load_button)
+        button_layout.addStretch(1)
+        main_layout.addLayout(button_layout)
+
+        # --- Waveform Overview ---
+        self.waveform_view = WaveformView()
+        self.waveform_view.seek_requested.connect(self.engine.seek)
+        main_layout.addWidget(self.waveform_view)
+
+        # --- Level Meter and Spectrum ---
+        self.meter_view = MeterView()
+        main_layout.addWidget(self.meter_view)
+
+        self.status_label = QLabel("No file loaded")
+        self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.status_label.setWordWrap(True)
+        self.status_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+
+        main_layout.addWidget(self.status_label)
+
+        # --- Playlist Search ---
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search the playlist")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.update_search_results)
+        self.search_box.returnPressed.connect(self.play_first_search_result)
+        main_layout.addWidget(self.search_box)
+
+        self.search_results = QListWidget()
+        self.search_results.setMaximumHeight(200)
+        self.search_results.itemActivated.connect(self.play_search_result)
+        self.search_results.hide()
+        main_layout.addWidget(self.search_results)
+
+        self.setAcceptDrops(True)
+
+    def create_menu_bar(self):
+        menu_bar = QMenuBar(self)
+
+        # --- File Menu ---
+        file_menu = QMenu("&File", self)
+        menu_bar.addMenu(file_menu)
+
+        # Open File(s)
+        open_action = QAction("&Open Files...", self)
+        self.icons.set_icon(open_action, 'mdi.file-music-outline')
+        open_action.setShortcut(QKeySequence.StandardKey.Open)
+        open_action.triggered.connect(self.load_files)
+        file_menu.addAction(open_action)
+
+        # Open Folder
+        open_folder_action = QAction("Open &Folder...", self)
+        self.icons.set_icon(open_folder_action, 'mdi.folder-open')
+        open_folder_action.setShortcut(QKeySequence("Ctrl+Shift+O"))
+        open_folder_action.triggered.connect(self.open_folder_dialog)
+        file_menu.addAction(open_folder_action)
+
+        # Rescan Folders
+        rescan_action = QAction("&Rescan Folders", self)
+        self.icons.set_icon(rescan_action, 'mdi.folder-refresh')
+        rescan_action.setShortcut(QKeySequence("F5"))
+        rescan_action.triggered.connect(self.engine.rescan_library)
+        file_menu.addAction(rescan_action)
+
+        # Cancel Loading
+        cancel_load_action = QAction("&Cancel Loading", self)
+        self.icons.set_icon(cancel_load_action, 'mdi.cancel')
+        cancel_load_action.setShortcut(QKeySequence("Esc"))
+        cancel_load_action.triggered.connect(self.cancel_loading)
+        file_menu.addAction(cancel_load_action)
+
+        # Load Playlist (M3U)
+        load_playlist_action = QAction("&Load Playlist...", self)
+        self.icons.set_icon(load_playlist_action, 'mdi.playlist-music-outline')
+        load_playlist_action.setShortcut(QKeySequence("Ctrl+L"))
+        load_playlist_action.triggered.connect(self.load_m3u_dialog)
+        file_menu.addAction(load_playlist_action)
+
+        # Save Playlist (M3U)
+        save_playlist_action = QAction("&Save Playlist...", self)
+        self.icons.set_icon(save_playlist_action, 'mdi.content-save')
+        save_playlist_action.setShortcut(QKeySequence.StandardKey.Save)
+        save_playlist_action.triggered.connect(self.save_playlist_dialog)
+        file_menu.addAction(save_playlist_action)
+
+        file_menu.addSeparator()
+
+        # Exit
+        exit_action = QAction("E&xit", self)
+        self.icons.set_icon(exit_action, 'mdi.exit-to-app')
+        exit_action.setShortcut(QKeySequence.StandardKey.Quit)
+        exit_action.triggered.connect(QApplication.instance().quit)
+        file_menu.addAction(exit_action)
+
+        # --- Edit Menu ---
+        edit_menu = QMenu("&Edit", self)
+        menu_bar.addMenu(edit_menu)
+
+        # Clear Playlist
+        clear_playlist_action = QAction("Clear Playlist", self)
+        self.icons.set_icon(clear_playlist_action, 'mdi.playlist-remove')
+        clear_playlist_action.setShortcut(QKeySequence("Ctrl+Shift+C"))
+        clear_playlist_action.triggered.connect(self.engine.clear_playlist)
+        edit_menu.addAction(clear_playlist_action)
+
+        # Search
+        find_action = QAction("&Find in Playlist", self)
+        self.icons.set_icon(find_action, 'mdi.magnify')
+        find_action.setShortcut(QKeySequence.StandardKey.Find)
+        find_action.triggered.connect(self.focus_search)
+        edit_menu.addAction(find_action)
+
+        # --- View Menu ---
+        view_menu = QMenu("&View", self)
+        menu_bar.addMenu(view_menu)
+        #Repeat mode submenu
+        repeat_menu = QMenu("&Repeat",self)
+        repeat_off = QAction("Off",self)
+        repeat_off.triggered.connect(lambda: self.engine.set_repeat_mode("off"))
+        repeat_menu.addAction(repeat_off)
+
+        repeat_one = QAction("Repeat One", self)
+        repeat_one.triggered.connect(lambda: self.engine.set_repeat_mode("one"))
+        repeat_menu.addAction(repeat_one)
+
+        repeat_all = QAction("Repeat All", self)
+        repeat_all.triggered.connect(lambda: self.engine.set_repeat_mode("all"))
+        repeat_menu.addAction(repeat_all)
+
+        view_menu.addMenu(repeat_menu)
+
+        # Shuffle
+        shuffle_action = QAction("&Shuffle", self, checkable=True)
+        self.icons.set_icon(shuffle_action, 'mdi.shuffle-variant')
+        shuffle_action.setShortcut(QKeySequence("Ctrl+Shift+S"))
+        shuffle_action.triggered.connect(self.toggle_shuffle)
+        view_menu.addAction(shuffle_action)
+
+        # Level meter
+        meter_action = QAction("Level &Meter", self, checkable=True)
+        meter_action.setChecked(True)
+        meter_action.triggered.connect(self.set_meter_visible)
+        view_menu.addAction(meter_action)
+
+        # Output device and latency profile, filled in when the menu opens:
+        # listing devices starts PortAudio, which is too slow for startup
+        self.output_menu = QMenu("Audio &Output", self)
+        self.output_menu.aboutToShow.connect(self.populate_output_menu)
+        view_menu.addMenu(self.output_menu)
+
+
+        # --- Window Menu ---
+        window_menu = QMenu("&Window", self)
+        menu_bar.addMenu(window_menu)
+
+        # --- Help Menu ---
+        help_menu = QMenu("&Help", self)
+        menu_bar.addMenu(help_menu)
+
+        # About
+        about_action = QAction("&About", self)
+        self.icons.set_icon(about_action, 'mdi.information-outline')
+        about_action.triggered.connect(self.show_about_dialog)
+        help_menu.addAction(about_action)
+
+        self.layout().setMenuBar(menu_bar)
+
+
+    def set_meter_visible(self, visible):
+        self.meter_view.setVisible(visible)
+        self.update_meter_timer(self.engine.state == "playing")
+
+    def update_meter_timer(self, playing):
+        # The callback only copies into the ring while a meter is on screen
+        active = playing and self.meter_view.isVisibleTo(self)
+        if active and self.meter is None:
+            from level_meter import LevelMeter, SampleRing  # numpy is loaded by now
+            self.meter = LevelMeter(SampleRing())
+        if active:
+            if self.engine.meter_ring is not self.meter.ring:
+                self.engine.attach_meter(self.meter.ring)
+            self.meter_timer.start()
+        else:
+            self.engine.attach_meter(None)
+            self.meter_timer.stop()
+            self.meter_view.reset()
+
+    def update_meter(self):
+        # Runs on a timer, so a slow machine sees fewer frames rather than a
+        # backlog: if the last reading took more than half a frame, the
+        # next ticks are skipped until twice that time has passed.
+        now = time.perf_counter()
+        if now < self._meter_resume_at:
+            self.meter_frames_dropped += 1
+            return
+        self.meter_view.show_reading(self.meter.read(), now)
+        cost = time.perf_counter() - now
+        if cost > self.meter_timer.interval() / 2000:
+            self._meter_resume_at = now + 2 * cost
+
+    def populate_output_menu(self):
+        from audio_output import OUTPUT_PROFILES, PyAudioOutput
+        menu = self.output_menu
+        menu.clear()
+        output = self.engine.output
+        current_device = getattr(output, "device", None)
+        devices = [(None, "System Default")]
+        if isinstance(output, PyAudioOutput):
+            devices += [(index, name) for index, name, _, _ in output.devices()]
+        device_group = QActionGroup(menu)
+        for device, name in devices:
+            action = QAction(name, menu, checkable=True)
+            action.setChecked(device == current_device)
+            action.triggered.connect(lambda checked, device=device: self.set_output(device=device))
+            device_group.addAction(action)
+            menu.addAction(action)
+        menu.addSeparator()
+        profile_group = QActionGroup(menu)
+        for profile, frames in OUTPUT_PROFILES.items():
+            action = QAction(f"{profile.replace('-', ' ').title()} ({frames} frames)", menu, checkable=True)
+            action.setChecked(profile == output.profile)
+            action.triggered.connect(lambda checked, profile=profile: self.set_output(profile=profile))
+            profile_group.addAction(action)
+            menu.addAction(action)
+
+    def set_output(self, **changes):
+        # A new device output with the current device/profile and the changes
+        from audio_output import PyAudioOutput
+        output = self.engine.output
+        settings = {"device": getattr(output, "device", None), "profile": output.profile}
+        settings.update(changes)
+        try:
+            self.engine.set_output(PyAudioOutput(**settings))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not switch the audio output: {e}")
+
+    def toggle_shuffle(self, checked):
+        self.engine.set_shuffle(checked)
+
+
+    def show_about_dialog(self):
+        QMessageBox.about(
+            self,
+            "About KtiseosNyx Player",
+            "A simple audio player built with PyQt6, pydub, and sounddevice.\n"
+            "By [Your Name/Your Organization]"
+        )
+
+    def open_folder_dialog(self):
+        folder_path = QFileDialog.getExistingDirectory(self, "Select Audio Folder")
+        if folder_path:
+            self.engine.scan_folder(folder_path)
+
+    def cancel_loading(self):
+        if self.engine.cancel_loading():
+            self.status_label.setText("Loading cancelled")
+            self.load_status_timer.start()
+
+    def on_engine_event(self, event, value):
+        if event == "state":
+            playing = value == "playing"
+            self.icons.set_icon(self.play_pause_button, 'mdi.pause' if playing else 'mdi.play')
+            self.play_pause_button.setText("Pause" if playing else "Play")
+            self.update_status_label()
+            if playing:
+                self.position_timer.start()
+            else:
+                self.position_timer.stop()
+            self.update_meter_timer(playing)
+            self.update_position()
+        elif event in ("track", "analysis"):
+            self.update_status_label()
+            self.update_waveform()
+            self.update_position()
+        elif event == "tags":
+            if self.engine.current_track_path in value:
+                self.update_status_label()
+            self.refresh_search_results()
+        elif event == "seek":
+            self.update_position()
+        elif event == "volume":
+            self.update_volume_display()
+        elif event == "progress":
+            self.show_load_progress(value)
+        elif event == "error":
+            QMessageBox.critical(self, "Error", value)
+
+    def on_playlist_changed(self, change):
+        if not self.load_status_timer.isActive():
+            self.update_status_label()
+        self.refresh_search_results()
+
+    def focus_search(self):
+        self.search_box.setFocus()
+        self.search_box.selectAll()
+
+    def refresh_search_results(self):
+        if self.search_box.text().strip() and not self.search_timer.isActive():
+            self.search_timer.start()
+
+    def update_search_results(self):
+        # Runs on every keystroke: the engine's index answers in milliseconds
+        query = self.search_box.text()
+        results = self.engine.search(query, SEARCH_RESULT_LIMIT + 1) if query.strip() else []
+        self.search_results.clear()
+        for _, path in results[:SEARCH_RESULT_LIMIT]:
+            item = QListWidgetItem(self.engine.display_name(path))
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setToolTip(path)
+            self.search_results.addItem(item)
+        note = None
+        if len(results) > SEARCH_RESULT_LIMIT:
+            note = f"Only the first {SEARCH_RESULT_LIMIT} matches are shown; keep typing"
+        elif query.strip() and not results:
+            note = "No matches"
+        if note:
+            item = QListWidgetItem(note)
+            item.setFlags(Qt.ItemFlag.NoItemFlags)
+            self.search_results.addItem(item)
+        self.search_results.setVisible(bool(query.strip()))
+
+    def play_search_result(self, item):
+        path = item.data(Qt.ItemDataRole.UserRole)
+        if path is not None:
+            self.engine.play_track(self.engine.playlist.index_of(path))
+
+    def play_first_search_result(self):
+        if self.search_results.count():
+            self.play_search_result(self.search_results.item(0))
+
+    def show_load_progress(self, message):
+        self.status_label.setText(message)
+        self.load_status_timer.start()
+
+    def load_m3u_dialog(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Playlist", "", "Playlists (*.m3u *.m3u8 *.pls)")
+        if file_path:
+            self.engine.load([file_path], f"load of {file_path}")
+
+    def save_playlist_dialog(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Playlist", "", "M3U Playlists (*.m3u *.m3u8)")
+        if file_path:
+            if not file_path.lower().endswith((".m3u", ".m3u8")):
+                file_path += ".m3u"
+            self.engine.save_playlist_to_file(file_path)
+
+
+    def on_position_slider_changed(self, value):
+        # Dragging only previews the time; clicks on the groove and arrow
+        # keys seek straight away. Timer updates don't get here (signals
+        # are blocked while update_position() moves the slider).
+        if self.position_slider.isSliderDown():
+            self.position_label.setText(format_time(value / 1000))
+        else:
+            self.engine.seek(value / 1000)
+
+    def seek_to_slider(self):
+        self.engine.seek(self.position_slider.value() / 1000)
+
+    def update_waveform(self):
+        path = self.engine.current_track_path
+        self.waveform_view.set_waveform(self.engine.waveform(path) if path else None)
+
+    def update_position(self):
+        engine = self.engine
+        duration = engine.duration
+        position = min(engine.position, duration)
+        self.waveform_view.set_position(position, duration)
+        self.position_slider.setEnabled(engine.current_source is not None)
+        self.duration_label.setText(format_time(duration))
+        if self.position_slider.isSliderDown():
+            return
+        self.position_slider.blockSignals(True)
+        self.position_slider.setMaximum(int(duration * 1000))
+        self.position_slider.setValue(int(position * 1000))
+        self.position_slider.blockSignals(False)
+        self.position_label.setText(format_time(position))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_time is None:
+            # Icons (and the qtawesome import) wait until the window is up
+            self.first_paint_time = time.perf_counter()
+            QTimer.singleShot(0, self.icons.build)
+
+    def closeEvent(self, event):
+        self.stats_timer.stop()
+        self.position_timer.stop()
+        self.meter_timer.stop()
+        self.engine.shutdown()
+        super().closeEvent(event)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        file_paths = [url.toLocalFile() for url in event.mimeData().urls()]
+        self.engine.load(file_paths, "drop")
+
+    def load_files(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "Select Audio Files or Playlists",
+            "",
+            "Audio Files (*.mp3 *.wav *.flac *.ogg *.m4a *.aac);;Playlist Files (*.m3u *.m3u8 *.pls);;All Files (*)"
+        )
+        if file_paths:
+            self.engine.load(file_paths, "file load")
+
+    def set_volume(self, val):
+        self.engine.set_volume(float(val) / 100.0)
+
+    def update_volume_display(self):
+        volume = int(self.engine.volume * 100)
+        if self.volume_slider.value() != volume:
+            self.volume_slider.setValue(volume)
+        muted = self.engine.volume == 0.0
+        self.icons.set_icon(self.mute_button, 'mdi.volume-off' if muted else 'mdi.volume-high')
+        self.mute_button.setToolTip("Unmute" if muted else "Mute")
+        self.volume_label.setText(f"{volume}%")
+
+    def update_status_label(self):
+        engine = self.engine
+        if engine.current_sound and engine.playlist:
+            file_path = engine.playlist[engine.current_track_index]
+            name = engine.display_name(file_path)
+            info = engine.analysis.lookup(file_path)
+            tags = engine.tags.get(file_path)
+            duration = info.duration if info else tags.duration if tags else None
+            if duration:
+                self.status_label.setText(f"Now Playing: {name} ({format_time(duration)})")
+            else:
+                self.status_label.setText(f"Now Playing: {name}")
+        elif not engine.playlist:
+            self.status_label.setText("No files in playlist")
+        else:
+            self.status_label.setText("Stopped")
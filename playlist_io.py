@@ -0,0 +1,142 @@
+import os
+import re
+from collections import namedtuple
+from urllib.parse import unquote, urlparse
+
+PLAYLIST_EXTENSIONS = frozenset({".m3u", ".m3u8", ".pls"})
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# duration is in seconds and title is a display name; either may be None
+PlaylistEntry = namedtuple("PlaylistEntry", "path duration title")
+
+PLS_KEY = re.compile(r"(file|title|length)(\d+)$", re.IGNORECASE)
+
+
+def is_playlist(path):
+    return os.path.splitext(path)[1].lower() in PLAYLIST_EXTENSIONS
+
+
+def read_playlist(file_path, chunk_size=2000):
+    # Yields (entries, fraction of the file read) in chunks of up to
+    # chunk_size, parsing as the file is read so the first chunk can be
+    # checked and shown while the rest is still on disk. Relative entries
+    # are resolved against the playlist's folder.
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+    size = os.path.getsize(file_path) or 1
+    parse = _parse_pls if file_path.lower().endswith(".pls") else _parse_m3u
+    with open(file_path, "rb") as f:
+        chunk = []
+        for entry in parse(_decode_lines(f), base_dir):
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                yield chunk, f.tell() / size
+                chunk = []
+        if chunk:
+            yield chunk, 1.0
+
+
+def _decode_lines(f):
+    # UTF-8 (the M3U8 rule, and what most players write today), line by
+    # line falling back to cp1252 for old Windows-made .m3u files.
+    first = True
+    for raw in f:
+        if first:
+            raw = raw.removeprefix(b"\xef\xbb\xbf")
+            first = False
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            line = raw.decode("cp1252", errors="replace")
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _parse_m3u(lines, base_dir):
+    duration = title = None
+    for line in lines:
+        if line.startswith("#"):
+            if line[:8].upper() == "#EXTINF:":
+                duration, title = _parse_extinf(line[8:])
+            continue
+        path = resolve_location(line, base_dir)
+        if path:
+            yield PlaylistEntry(path, duration, title)
+        duration = title = None
+
+
+def _parse_extinf(body):
+    # "#EXTINF:<seconds> [key="value" ...],<title>"; -1 means unknown
+    head, _, title = body.partition(",")
+    try:
+        duration = float(head.split()[0]) if head.split() else None
+    except ValueError:
+        duration = None
+    if duration is not None and duration < 0:
+        duration = None
+    return duration, title.strip() or None
+
+
+def _parse_pls(lines, base_dir):
+    # PLS keys are numbered rather than ordered, so the entries are
+    # collected first and handed out in number order.
+    entries = {}
+    for line in lines:
+        key, sep, value = line.partition("=")
+        match = PLS_KEY.match(key.strip()) if sep else None
+        if match:
+            entries.setdefault(int(match.group(2)), {})[match.group(1).lower()] = value.strip()
+    for number in sorted(entries):
+        fields = entries[number]
+        if not fields.get("file"):
+            continue  # Title/Length without a File
+        path = resolve_location(fields["file"], base_dir)
+        if not path:
+            continue
+        try:
+            duration = float(fields["length"])
+        except (KeyError, ValueError):
+            duration = None
+        if duration is not None and duration < 0:
+            duration = None
+        yield PlaylistEntry(path, duration, fields.get("title") or None)
+
+
+def resolve_location(location, base_dir):
+    # Local path for a playlist entry, or None for ones that can't be played
+    # from disk (http and other URLs)
+    if "://" in location:
+        url = urlparse(location)
+        if url.scheme != "file":
+            return None
+        location = unquote(url.path)
+    elif os.sep == "/" and "\\" in location and not location.startswith("/"):
+        location = location.replace("\\", "/")  # Made on Windows
+    if not os.path.isabs(location):
+        location = os.path.join(base_dir, location)
+    return os.path.normpath(location)
+
+
+def existing_entries(entries):
+    # One pool job per chunk instead of one per entry
+    return [entry for entry in entries if os.path.isfile(entry.path)]
+
+
+def write_m3u(file_path, paths, durations, titles):
+    # Extended M3U in one buffered pass, written next to the target and
+    # renamed over it so a failed save never leaves half a playlist.
+    # durations/titles map a path to what the #EXTINF line should say;
+    # unknown durations are written as -1.
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="\n", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write("#EXTM3U\n")
+        f.writelines(_m3u_lines(paths, durations, titles))
+    os.replace(temp_path, file_path)
+
+
+def _m3u_lines(paths, durations, titles):
+    for path in paths:
+        duration = durations.get(path)
+        title = titles.get(path) or os.path.splitext(os.path.basename(path))[0]
+        seconds = round(duration) if duration is not None else -1
+        yield f"#EXTINF:{seconds},{title}\n{path}\n"
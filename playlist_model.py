@@ -0,0 +1,113 @@
+from collections import namedtuple
+
+# kind is "insert", "remove", "move" or "reset"; start/count describe the
+# affected rows for inserts, otherwise the whole list.
+PlaylistChange = namedtuple("PlaylistChange", "kind start count")
+
+
+class Playlist:
+    # Ordered list of track paths plus one dict that serves both as the
+    # dedupe set and as the path -> position index. Positions go stale after
+    # a remove or move and are rebuilt in one pass the next time they're
+    # needed, so bulk edits stay linear.
+    def __init__(self, paths=()):
+        self._paths = []
+        self._positions = {}
+        self._positions_valid = True
+        self._listeners = []
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __bool__(self):
+        return bool(self._paths)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __getitem__(self, index):
+        return self._paths[index]
+
+    def __contains__(self, path):
+        return path in self._positions
+
+    def index_of(self, path):
+        if path not in self._positions:
+            return -1
+        if not self._positions_valid:
+            self._reindex()
+        return self._positions[path]
+
+    def _reindex(self):
+        self._positions = {path: i for i, path in enumerate(self._paths)}
+        self._positions_valid = True
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, change):
+        for callback in self._listeners:
+            callback(change)
+
+    def append(self, path):
+        return bool(self.extend([path]))
+
+    def extend(self, paths):
+        # Returns the paths that were actually added (duplicates are skipped)
+        start = len(self._paths)
+        added = []
+        positions = self._positions
+        for path in paths:
+            if path not in positions:
+                positions[path] = start + len(added)
+                added.append(path)
+        if added:
+            self._paths.extend(added)
+            self._notify(PlaylistChange("insert", start, len(added)))
+        return added
+
+    def insert(self, index, paths):
+        added = []
+        seen = self._positions
+        for path in paths:
+            if path not in seen:
+                seen[path] = -1
+                added.append(path)
+        if added:
+            index = max(0, min(index, len(self._paths)))
+            appending = index == len(self._paths)
+            self._paths[index:index] = added
+            if appending and self._positions_valid:
+                for offset, path in enumerate(added):
+                    seen[path] = index + offset
+            else:
+                self._positions_valid = False
+            self._notify(PlaylistChange("insert", index, len(added)))
+        return added
+
+    def remove_indices(self, indices):
+        drop = set(i for i in indices if 0 <= i < len(self._paths))
+        if not drop:
+            return []
+        removed = [self._paths[i] for i in sorted(drop)]
+        self._paths = [path for i, path in enumerate(self._paths) if i not in drop]
+        for path in removed:
+            del self._positions[path]
+        self._positions_valid = False
+        self._notify(PlaylistChange("remove", 0, len(self._paths)))
+        return removed
+
+    def move(self, source, destination):
+        if source == destination:
+            return
+        path = self._paths.pop(source)
+        self._paths.insert(destination, path)
+        self._positions_valid = False
+        self._notify(PlaylistChange("move", 0, len(self._paths)))
+
+    def clear(self):
+        self._paths = []
+        self._positions = {}
+        self._positions_valid = True
+        self._notify(PlaylistChange("reset", 0, 0))
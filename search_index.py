@@ -0,0 +1,166 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from itertools import chain
+
+WORD = re.compile(r"[^\W_]+")
+FILTER_COST = 64  # Checking one track's words costs about this many postings entries of a union
+SHORT_PREFIX = 2  # Prefixes up to this long keep their own list of tracks
+
+
+def normalize(text):
+    # Lower case without accents, so "beyonce" finds "Beyoncé"
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return text
+
+
+def tokenize(text):
+    return WORD.findall(normalize(text))
+
+
+def _short_prefixes(words):
+    return {word[:length] for word in words for length in range(1, SHORT_PREFIX + 1)}
+
+
+class SearchIndex:
+    # Inverted index from words to the tracks they appear in, for search as
+    # you type. Every word of a query is a prefix ("beat liv" finds "The
+    # Beatles - Live at the BBC"); a track matches when each of them starts
+    # one of its words. Words are kept sorted so the ones sharing a prefix
+    # are found by bisection. Words first seen since the last query wait in
+    # a side list that the next query sorts and merges in, so adding tracks
+    # never rebuilds anything. The first letter or two of a query would
+    # union thousands of words, so those prefixes keep a ready-made list of
+    # tracks instead. Postings are flat arrays of track ids (a set per word
+    # takes several times the memory); a track only leaves one when its
+    # tags change, which is rare enough for array.remove(). Tracks can be
+    # added from any thread; reserve() fixes their order up front when
+    # their words arrive out of order.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}  # path -> track id, in the order tracks were added
+        self._paths = []  # track id -> path
+        self._words_of = []  # track id -> tuple of its words
+        self._postings = {}  # word -> array of track ids
+        self._short = {}  # prefix of up to SHORT_PREFIX letters -> array of track ids
+        self._sorted_words = []
+        self._new_words = []
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def set(self, path, texts):
+        # Indexes path under the words of texts (None entries are skipped),
+        # replacing whatever it was indexed under before
+        words = frozenset(word for text in texts if text for word in tokenize(text))
+        with self._lock:
+            self._add(path, words)
+
+    def reserve(self, paths):
+        # Gives paths their place in the result order before they have any
+        # words, so results keep that order whenever the words come in
+        with self._lock:
+            ids, words_of = self._ids, self._words_of
+            for path in paths:
+                if path not in ids:
+                    ids[path] = len(self._paths)
+                    self._paths.append(path)
+                    words_of.append(())
+
+    def _add(self, path, words):
+        track = self._ids.get(path)
+        if track is None:
+            track = len(self._paths)
+            self._ids[path] = track
+            self._paths.append(path)
+            self._words_of.append(())
+        old = frozenset(self._words_of[track])
+        if words == old:
+            return
+        postings = self._postings
+        for word in old - words:
+            postings[word].remove(track)  # The word stays listed, matching nothing
+        for word in words - old:
+            if word not in postings:
+                postings[word] = array("i")
+                self._new_words.append(word)
+            postings[word].append(track)
+        old_prefixes, prefixes = _short_prefixes(old), _short_prefixes(words)
+        short = self._short
+        for prefix in old_prefixes - prefixes:
+            short[prefix].remove(track)
+        for prefix in prefixes - old_prefixes:
+            if prefix not in short:
+                short[prefix] = array("i")
+            short[prefix].append(track)
+        self._words_of[track] = tuple(words)
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._paths = []
+            self._words_of = []
+            self._postings = {}
+            self._short = {}
+            self._sorted_words = []
+            self._new_words = []
+
+    def _words_with_prefix(self, prefix):
+        if self._new_words:
+            self._sorted_words += self._new_words
+            self._sorted_words.sort()  # Two sorted runs: merged in one pass
+            self._new_words = []
+        words = self._sorted_words
+        start = bisect.bisect_left(words, prefix)
+        end = bisect.bisect_left(words, prefix + "\U0010ffff", start)
+        return words[start:end]
+
+    def _postings_for(self, term):
+        if len(term) <= SHORT_PREFIX:
+            return [self._short.get(term, ())]
+        return [self._postings[word] for word in self._words_with_prefix(term)]
+
+    def _matching(self, terms):
+        # Starts from the term with the fewest postings. Each later term is
+        # intersected with what is left or, when only a few tracks are left,
+        # checked against those tracks' own words, whichever is less work.
+        candidates = []
+        for term in set(terms):
+            postings = self._postings_for(term)
+            candidates.append((sum(map(len, postings)), term, postings))
+        candidates.sort(key=lambda candidate: candidate[0])
+        words_of = self._words_of
+        ids = None
+        for size, term, postings in candidates:
+            if ids is None:
+                ids = set(chain.from_iterable(postings))
+            elif len(ids) * FILTER_COST < size:
+                ids = {track for track in ids if any(word.startswith(term) for word in words_of[track])}
+            else:
+                ids = ids.intersection(chain.from_iterable(postings))
+            if not ids:
+                break
+        return ids
+
+    def search(self, query, limit=None):
+        # Paths of the matching tracks in the order they were reserved or
+        # added, at most limit of them; an empty query matches nothing
+        terms = tuple(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            ids = self._matching(terms)
+            if limit is None or limit >= len(ids):
+                chosen = sorted(ids)
+            else:
+                chosen = heapq.nsmallest(limit, ids)
+            paths = self._paths
+            return [paths[track] for track in chosen]
@@ -0,0 +1,261 @@
+import bisect
+import logging
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_cache import cache_key
+from audio_frames import PROBE_SIZE, adts_frame, find_frame, mp3_frame
+
+SCAN_CHUNK_SIZE = 1024 * 1024
+RESYNC_LIMIT = 64 * 1024  # Garbage tolerated between two frames before an MP3/ADTS scan gives up
+MP3_DECODER_DELAY = 529  # Samples ffmpeg adds to the LAME encoder delay when trimming the start
+MP3_RESERVOIR_BYTES = 511  # How much main data from earlier frames a Layer III frame may use
+
+
+class SeekIndex:
+    # Places in a compressed file where decoding can restart: frames[i] is
+    # the first sample decoded from byte offsets[i]. ffmpeg is fed the file
+    # from the chosen offset (after header, for formats that need their
+    # stream header to decode) and the extra samples in front of the target
+    # are dropped, so seeks land on the exact sample and cost the same
+    # anywhere in the file. delay is what a decode from the start trims off
+    # (MP3 encoder delay). preroll is how many restart points to back up so
+    # the decoder has warmed up by the target, and reach how many payload
+    # bytes (frame minus overhead bytes of header and side info) before
+    # the first of those it may still read from.
+    def __init__(self, demuxer, frames, offsets, header=b"", delay=0, preroll=0, reach=0, overhead=0):
+        self.demuxer = demuxer
+        self.frames = frames
+        self.offsets = offsets
+        self.header = header
+        self.delay = delay
+        self.preroll = preroll
+        self.reach = reach
+        self.overhead = overhead
+
+    def __len__(self):
+        return len(self.frames)
+
+    def locate(self, frame):
+        # (byte offset to decode from, frames to drop from the decoded output)
+        raw = frame + self.delay
+        i = max(bisect.bisect_right(self.frames, raw) - 1 - self.preroll, 0)
+        needed = self.reach
+        while i > 0 and needed > 0:
+            i -= 1
+            needed -= self.offsets[i + 1] - self.offsets[i] - self.overhead
+        return self.offsets[i], raw - self.frames[i]
+
+
+def build_seek_index(file_path):
+    # Returns a SeekIndex, or None for files ffmpeg should seek itself (WAV
+    # needs no index, MP4/Ogg carry their own, and a FLAC file without a
+    # SEEKTABLE is searched by ffmpeg's demuxer).
+    with open(file_path, "rb") as f:
+        head = f.read(10)
+        if head[:4] == b"fLaC":
+            f.seek(4)
+            return _flac_index(f)
+        if head[:4] in (b"RIFF", b"RF64", b"BW64", b"OggS", b"FORM") or head[4:8] == b"ftyp":
+            return None
+        if head[:3] == b"ID3" and len(head) == 10:
+            # ID3v2 tag in front of the audio: syncsafe size, optional footer
+            size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+            start = 10 + size + (10 if head[5] & 0x10 else 0)
+        else:
+            start = 0
+        f.seek(start)
+        probe = f.read(PROBE_SIZE)
+    position = find_frame(probe, mp3_frame)
+    if position >= 0:
+        return _mp3_index(file_path, start + position)
+    position = find_frame(probe, adts_frame)
+    if position >= 0:
+        return _adts_index(file_path, start + position)
+    return None
+
+
+def _walk_frames(file_path, start, parse):
+    # Yields (offset, frame length, samples, sample rate, overhead) for
+    # every frame from start on, skipping short runs of garbage between
+    # frames and stopping at trailing tags (ID3v1, APE, Lyrics3).
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        buffer = f.read(SCAN_CHUNK_SIZE)
+        base = start
+        position = 0
+        skipped = 0
+        while True:
+            if len(buffer) - position < 8:
+                more = f.read(SCAN_CHUNK_SIZE)
+                if not more:
+                    return
+                buffer = buffer[position:] + more
+                base += position
+                position = 0
+            frame = parse(buffer, position)
+            if frame is None:
+                if buffer.startswith((b"TAG", b"APETAGEX", b"LYRICS"), position) or skipped > RESYNC_LIMIT:
+                    return
+                following = buffer.find(b"\xff", position + 1)
+                step = following - position if following >= 0 else len(buffer) - position
+                position += step
+                skipped += step
+                continue
+            skipped = 0
+            if position + frame[0] > len(buffer):
+                # Frame runs past the buffer: fetch the rest before yielding
+                more = f.read(SCAN_CHUNK_SIZE)
+                if not more:
+                    yield (base + position,) + frame
+                    return
+                buffer = buffer[position:] + more
+                base += position
+                position = 0
+            yield (base + position,) + frame
+            position += frame[0]
+
+
+def _mp3_index(file_path, start):
+    frames = array("q")
+    offsets = array("q")
+    delay = 0
+    sample = 0
+    overhead = 0
+    for offset, length, samples, sample_rate, overhead in _walk_frames(file_path, start, mp3_frame):
+        if not offsets and offset == start:
+            info = _mp3_info_frame(file_path, offset, length, overhead)
+            if info is not None:
+                # Xing/Info/VBRI frame: no audio, ffmpeg skips it
+                delay = info
+                continue
+        frames.append(sample)
+        offsets.append(offset)
+        sample += samples
+    if not frames:
+        return None
+    # The frame before the target has to decode cleanly for its overlap,
+    # and it may keep part of its data in the frames before it (the bit
+    # reservoir).
+    return SeekIndex("mp3", frames, offsets, delay=delay, preroll=1, reach=MP3_RESERVOIR_BYTES,
+                     overhead=overhead)
+
+
+def _mp3_info_frame(file_path, offset, length, side_info_end):
+    # Encoder delay to trim if the frame at offset is a Xing/Info/VBRI tag
+    # frame (0 when the tag carries no LAME delay), None for an audio frame.
+    # The Xing tag sits where the audio data would start.
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    xing = side_info_end
+    if frame[36:40] == b"VBRI":
+        return 0
+    if frame[xing:xing + 4] not in (b"Xing", b"Info"):
+        return None
+    flags = struct.unpack_from(">I", frame, xing + 4)[0] if len(frame) >= xing + 8 else 0
+    lame = xing + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    if frame[lame:lame + 4] in (b"LAME", b"Lavf", b"Lavc") and len(frame) >= lame + 24:
+        # Same rule as ffmpeg's mp3 demuxer: 12-bit delay, then 12-bit padding
+        return (int.from_bytes(frame[lame + 21:lame + 24], "big") >> 12) + MP3_DECODER_DELAY
+    return 0
+
+
+def _adts_index(file_path, start):
+    frames = array("q")
+    offsets = array("q")
+    sample = 0
+    for offset, length, samples, sample_rate, _ in _walk_frames(file_path, start, adts_frame):
+        frames.append(sample)
+        offsets.append(offset)
+        sample += samples
+    if not frames:
+        return None
+    # Each AAC frame overlaps the previous one by half a window
+    return SeekIndex("aac", frames, offsets, preroll=1)
+
+
+def _flac_index(f):
+    # f is positioned after "fLaC". Every frame decodes on its own, so the
+    # SEEKTABLE points are used as they are; STREAMINFO goes first so ffmpeg
+    # knows the stream format.
+    streaminfo = None
+    points = []
+    last = False
+    while not last:
+        block = f.read(4)
+        if len(block) < 4:
+            return None
+        last = bool(block[0] & 0x80)
+        kind, size = block[0] & 0x7F, int.from_bytes(block[1:4], "big")
+        body = f.read(size)
+        if kind == 0:
+            streaminfo = body
+        elif kind == 3:
+            for sample, offset, _ in struct.iter_unpack(">QQH", body[:len(body) - len(body) % 18]):
+                if sample != 0xFFFFFFFFFFFFFFFF:  # Placeholder point
+                    points.append((sample, offset))
+    if streaminfo is None or not points:
+        return None
+    audio_start = f.tell()
+    points.sort()
+    if points[0][0] != 0:
+        points.insert(0, (0, 0))
+    header = b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+    return SeekIndex("flac", array("q", (sample for sample, _ in points)),
+                     array("q", (audio_start + offset for _, offset in points)), header=header)
+
+
+class SeekIndexCache:
+    # Seek indexes by path/mtime/size for the most recent few tracks. Each is
+    # built once, on a worker: prepare() starts it when a streamed track is
+    # opened, so it is usually ready by the first seek. get() doesn't wait
+    # for one still being built (the walk over a long file's frame headers
+    # would hold up the seek); the caller seeks without it meanwhile. Building
+    # costs one pass over the frame headers (or the FLAC metadata); every
+    # seek after that is a bisect.
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> Future of SeekIndex or None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seek-index")
+
+    def prepare(self, file_path):
+        self._future(file_path)
+
+    def get(self, file_path, wait=False):
+        # The index, or None if there is none or (unless wait) it isn't built yet
+        future = self._future(file_path)
+        if not wait and not future.done():
+            return None
+        return future.result()
+
+    def _future(self, file_path):
+        key = cache_key(file_path)
+        with self._lock:
+            future = self._entries.get(key)
+            if future is None:
+                future = self._executor.submit(self._build, file_path)
+                self._entries[key] = future
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+        return future
+
+    def _build(self, file_path):
+        try:
+            index = build_seek_index(file_path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f"Could not index {file_path} for seeking: {e}")
+            return None
+        if index is not None:
+            logging.debug(f"Seek index for {os.path.basename(file_path)}: {len(index)} points")
+        return index
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
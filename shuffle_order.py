@@ -0,0 +1,90 @@
+import random
+from array import array
+
+
+class ShuffleOrder:
+    # The order shuffle plays a playlist in, kept apart from the playlist:
+    # order is a permutation of playlist indices and slots its inverse
+    # (playlist index -> position in order), both flat arrays, so the track
+    # before or after any other is two lookups and reshuffling never
+    # touches the playlist entries. The part of the order up to the current
+    # track is the play history; previous walks back through it, and a
+    # track picked by hand is moved in right after the current one so the
+    # history stays what was actually played. Every
+    # shuffle draws a fresh seed (or takes the one given), so an order can
+    # be reproduced from the seed the log shows.
+    def __init__(self):
+        self.order = array("q")
+        self.slots = array("q")
+        self.seed = None
+        self._rng = random.Random()
+        self._seeds = random.Random()
+
+    def __len__(self):
+        return len(self.order)
+
+    def reshuffle(self, count, first=None, seed=None):
+        # A new order over count tracks, starting with first if given
+        self.seed = self._seeds.randrange(2 ** 32) if seed is None else seed
+        self._rng = random.Random(self.seed)
+        indices = list(range(count))
+        if first is not None and 0 <= first < count:
+            indices[0], indices[first] = first, 0
+            rest = indices[1:]
+            self._rng.shuffle(rest)
+            indices[1:] = rest
+        else:
+            self._rng.shuffle(indices)
+        self.order = array("q", indices)
+        self._index_slots()
+
+    def _index_slots(self):
+        slots = array("q", bytes(8 * len(self.order)))
+        for slot, index in enumerate(self.order):
+            slots[index] = slot
+        self.slots = slots
+
+    def extend(self, count, current=None):
+        # Tracks appended to the playlist go to random places in the part of
+        # the order still to be played (after current), one swap each
+        order, slots, rng = self.order, self.slots, self._rng
+        start = len(order)
+        played = slots[current] + 1 if current is not None and 0 <= current < start else 0
+        order.extend(range(start, start + count))
+        slots.extend(range(start, start + count))
+        for slot in range(start, start + count):
+            other = rng.randint(played, slot)
+            order[slot], order[other] = order[other], order[slot]
+            slots[order[slot]], slots[order[other]] = slot, other
+
+    def first(self):
+        return self.order[0] if self.order else None
+
+    def neighbour(self, index, step, wrap=False):
+        # The playlist index step places from index in the order (1 is the
+        # next track, -1 the previous one); None past either end unless wrap
+        order = self.order
+        if not 0 <= index < len(order):
+            return None
+        slot = self.slots[index] + step
+        if wrap:
+            return order[slot % len(order)]
+        return order[slot] if 0 <= slot < len(order) else None
+
+    def move_after(self, index, current):
+        # Puts index in the slot after current, shifting the tracks between
+        # by one. A track from the history is taken out of it and played again.
+        order, slots = self.order, self.slots
+        if index == current or not (0 <= index < len(order) and 0 <= current < len(order)):
+            return
+        source, target = slots[index], slots[current] + 1
+        if source >= target:
+            order[target + 1:source + 1] = order[target:source]
+            order[target] = index
+            changed = range(target, source + 1)
+        else:
+            order[source:target - 1] = order[source + 1:target]
+            order[target - 1] = index
+            changed = range(source, target)
+        for slot in changed:
+            slots[order[slot]] = slot
@@ -0,0 +1,414 @@
+import io
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_cache import cache_key
+from audio_frames import PROBE_SIZE, find_frame, mp3_frame
+from audio_stream import read_wav_layout
+from track_analysis import TrackTags
+
+OGG_PROBE_SIZE = 64 * 1024  # Searched for the comment header at the start, and the last page at the end
+MAX_TAG_BYTES = 16 * 1024 * 1024  # Larger tags are assumed corrupt
+TAG_BATCH_SIZE = 64  # Paths per pool task
+
+# Frame IDs by ID3v2 major version for title, artist, album and length (ms)
+ID3_FRAMES = {
+    2: {b"TT2": "title", b"TP1": "artist", b"TAL": "album", b"TLE": "length"},
+    3: {b"TIT2": "title", b"TPE1": "artist", b"TALB": "album", b"TLEN": "length"},
+    4: {b"TIT2": "title", b"TPE1": "artist", b"TALB": "album", b"TLEN": "length"},
+}
+ID3_ENCODINGS = ("latin-1", "utf-16", "utf-16-be", "utf-8")
+VORBIS_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album"}
+RIFF_INFO_FIELDS = {b"INAM": "title", b"IART": "artist", b"IPRD": "album"}
+
+_mutagen = None  # The module once imported, False if it isn't installed
+
+
+def read_tags(file_path):
+    # Title, artist, album and duration from the file's headers, without
+    # decoding any audio. MP3 (ID3v2/ID3v1), FLAC, Ogg Vorbis/Opus and WAV
+    # are parsed here; anything else goes to mutagen when it is installed.
+    with open(file_path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        if head[:4] == b"fLaC":
+            fields = _flac_tags(f, 4)
+        elif head[:4] == b"OggS":
+            fields = _ogg_tags(f)
+        elif head[:4] in (b"RIFF", b"RF64", b"BW64") and head[8:12] == b"WAVE":
+            fields = _wav_tags(f, file_path)
+        elif head[:3] == b"ID3" or os.path.splitext(file_path)[1].lower() == ".mp3":
+            fields = _mpeg_tags(f)
+        else:
+            fields = None
+    if fields is None:
+        fields = _mutagen_tags(file_path)
+    if fields is None:
+        return TrackTags(None, None, None, None)
+    return TrackTags(fields.get("title"), fields.get("artist"), fields.get("album"), fields.get("duration"))
+
+
+def _text(value):
+    value = value.strip("\x00 \t\r\n")
+    return value or None
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3v2_tags(f, offset=0):
+    # ({field: value}, bytes the tag takes up) for an ID3v2 tag at offset,
+    # or ({}, 0) if there is none. Frames nobody asked for (cover art, mostly)
+    # are skipped with a seek rather than read.
+    f.seek(offset)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3" or header[3] not in ID3_FRAMES:
+        return {}, 0
+    version, flags, size = header[3], header[5], _syncsafe(header[6:10])
+    total = 10 + size + (10 if flags & 0x10 else 0)
+    if size > MAX_TAG_BYTES:
+        return {}, total
+    if flags & 0x80 and version < 4:
+        # Whole-tag unsynchronisation: undo it in memory
+        f = io.BytesIO(f.read(size).replace(b"\xff\x00", b"\xff"))
+        end = len(f.getvalue())
+    else:
+        end = f.tell() + size
+    if flags & 0x40:
+        extended = f.read(4)
+        if len(extended) < 4:
+            return {}, total
+        skip = _syncsafe(extended) - 4 if version == 4 else struct.unpack(">I", extended)[0]
+        f.seek(skip, os.SEEK_CUR)
+
+    wanted = ID3_FRAMES[version]
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    fields = {}
+    while f.tell() + header_size <= end and len(fields) < len(wanted):
+        frame = f.read(header_size)
+        if len(frame) < header_size:
+            break  # The tag says it runs past the end of the file
+        frame_id = frame[:id_size]
+        if not frame_id.strip(b"\x00"):
+            break  # Padding
+        if version == 2:
+            frame_size = int.from_bytes(frame[3:6], "big")
+        elif version == 3:
+            frame_size = struct.unpack(">I", frame[4:8])[0]
+        else:
+            frame_size = _syncsafe(frame[4:8])
+        frame_flags = 0 if version == 2 else frame[9]
+        if frame_size > end - f.tell():
+            break
+        if frame_id not in wanted:
+            f.seek(frame_size, os.SEEK_CUR)
+            continue
+        body = f.read(frame_size)
+        if len(body) < frame_size:
+            break  # Cut off by the end of the file
+        if version == 3:
+            if frame_flags & 0xC0:
+                continue  # Compressed or encrypted
+            if frame_flags & 0x20:
+                body = body[1:]  # Group ID
+        elif version == 4:
+            if frame_flags & 0x0C:
+                continue
+            if frame_flags & 0x40:
+                body = body[1:]
+            if frame_flags & 0x01:
+                body = body[4:]  # Data length indicator
+            if frame_flags & 0x02:
+                body = body.replace(b"\xff\x00", b"\xff")
+        if not body or body[0] >= len(ID3_ENCODINGS):
+            continue
+        value = _text(body[1:].decode(ID3_ENCODINGS[body[0]], errors="replace").split("\x00")[0])
+        if value:
+            fields[wanted[frame_id]] = value
+    if "length" in fields:
+        try:
+            fields["duration"] = int(fields.pop("length")) / 1000 or None
+        except ValueError:
+            del fields["length"]
+    return fields, total
+
+
+def _id3v1_tags(f):
+    f.seek(-128, os.SEEK_END)
+    tag = f.read(128)
+    if tag[:3] != b"TAG":
+        return {}
+    fields = {}
+    for name, start in (("title", 3), ("artist", 33), ("album", 63)):
+        value = _text(tag[start:start + 30].split(b"\x00")[0].decode("latin-1"))
+        if value:
+            fields[name] = value
+    return fields
+
+
+def _mpeg_tags(f):
+    fields, start = _id3v2_tags(f)
+    size = os.fstat(f.fileno()).st_size
+    if size >= 128:
+        v1 = _id3v1_tags(f)
+        if v1:
+            size -= 128
+        for name, value in v1.items():
+            fields.setdefault(name, value)
+    if "duration" not in fields:
+        f.seek(start)
+        duration = _mp3_duration(f.read(PROBE_SIZE), size - start)
+        if duration:
+            fields["duration"] = duration
+    return fields
+
+
+def _mp3_duration(probe, audio_bytes):
+    # From the frame count in a Xing/Info or VBRI header, or from the size
+    # of the audio and the first frame's bitrate for CBR files
+    position = find_frame(probe, mp3_frame)
+    if position < 0:
+        return None
+    length, samples, sample_rate, side_info_end = mp3_frame(probe, position)
+    xing = position + side_info_end
+    if probe[xing:xing + 4] in (b"Xing", b"Info") and len(probe) >= xing + 12:
+        if struct.unpack_from(">I", probe, xing + 4)[0] & 1:
+            return struct.unpack_from(">I", probe, xing + 8)[0] * samples / sample_rate
+    vbri = position + 36
+    if probe[vbri:vbri + 4] == b"VBRI" and len(probe) >= vbri + 18:
+        return struct.unpack_from(">I", probe, vbri + 14)[0] * samples / sample_rate
+    return (audio_bytes - position) * samples / (length * sample_rate)
+
+
+def _vorbis_comments(data, fields):
+    # Vorbis comment block: vendor string, then KEY=value strings, all
+    # little-endian length prefixed (FLAC, Ogg Vorbis and Opus share it)
+    try:
+        position = 4 + struct.unpack_from("<I", data, 0)[0]
+        count = struct.unpack_from("<I", data, position)[0]
+        position += 4
+        for _ in range(count):
+            length = struct.unpack_from("<I", data, position)[0]
+            key, _, value = data[position + 4:position + 4 + length].decode("utf-8", errors="replace").partition("=")
+            position += 4 + length
+            name = VORBIS_FIELDS.get(key.upper())
+            if name and name not in fields and _text(value):
+                fields[name] = _text(value)
+    except struct.error:
+        pass  # Truncated: keep what was read
+    return fields
+
+
+def _flac_tags(f, offset):
+    # Metadata blocks after "fLaC": STREAMINFO gives the length, the
+    # VORBIS_COMMENT block the tags; pictures and seek tables are skipped
+    f.seek(offset)
+    fields = {}
+    last = False
+    while not last:
+        block = f.read(4)
+        if len(block) < 4:
+            break
+        last = bool(block[0] & 0x80)
+        kind, size = block[0] & 0x7F, int.from_bytes(block[1:4], "big")
+        if kind == 0:
+            info = int.from_bytes(f.read(size)[10:18], "big")
+            sample_rate, total = info >> 44, info & ((1 << 36) - 1)
+            if sample_rate and total:
+                fields["duration"] = total / sample_rate
+        elif kind == 4:
+            _vorbis_comments(f.read(size), fields)
+        else:
+            f.seek(size, os.SEEK_CUR)
+    return fields
+
+
+def _ogg_packets(data):
+    # Packets of the first logical stream in data, reassembled across pages
+    packet = b""
+    position = data.find(b"OggS")
+    serial = None
+    while 0 <= position and position + 27 <= len(data):
+        if data[position:position + 4] != b"OggS":
+            break
+        page_serial = data[position + 14:position + 18]
+        segments = data[position + 26]
+        lacing = data[position + 27:position + 27 + segments]
+        position += 27 + segments
+        if serial is None:
+            serial = page_serial
+        for lace in lacing:
+            if page_serial == serial:
+                packet += data[position:position + lace]
+            position += lace
+            if lace < 255 and page_serial == serial:
+                yield packet
+                packet = b""
+
+
+def _ogg_tags(f):
+    packets = _ogg_packets(f.read(OGG_PROBE_SIZE))
+    identification, comments = next(packets, b""), next(packets, b"")
+    fields = {}
+    if identification[:7] == b"\x01vorbis" and len(identification) >= 16:
+        sample_rate, skip = struct.unpack_from("<I", identification, 12)[0], 0
+        if comments[:7] == b"\x03vorbis":
+            _vorbis_comments(comments[7:], fields)
+    elif identification[:8] == b"OpusHead" and len(identification) >= 12:
+        sample_rate, skip = 48000, struct.unpack_from("<H", identification, 10)[0]  # Opus granules are 48 kHz
+        if comments[:8] == b"OpusTags":
+            _vorbis_comments(comments[8:], fields)
+    else:
+        return None  # FLAC or Speex in Ogg: left to mutagen
+    # The granule position of the last page is the stream length in samples
+    size = os.fstat(f.fileno()).st_size
+    f.seek(max(0, size - OGG_PROBE_SIZE))
+    tail = f.read()
+    last = tail.rfind(b"OggS")
+    if sample_rate and last >= 0 and last + 14 <= len(tail):
+        granule = struct.unpack_from("<q", tail, last + 6)[0]
+        if granule > skip:
+            fields["duration"] = (granule - skip) / sample_rate
+    return fields
+
+
+def _wav_tags(f, file_path):
+    # LIST/INFO strings, or an ID3 tag in an "id3 " chunk; the length comes
+    # from the data chunk
+    fields = {}
+    f.seek(12)
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"LIST" and size <= MAX_TAG_BYTES:
+            body = f.read(size)
+            if body[:4] == b"INFO":
+                position = 4
+                while position + 8 <= len(body):
+                    sub_id, sub_size = body[position:position + 4], struct.unpack_from("<I", body, position + 4)[0]
+                    name = RIFF_INFO_FIELDS.get(sub_id)
+                    if name:
+                        raw = body[position + 8:position + 8 + sub_size].split(b"\x00")[0]
+                        try:
+                            value = raw.decode("utf-8")
+                        except UnicodeDecodeError:
+                            value = raw.decode("cp1252", errors="replace")
+                        if _text(value):
+                            fields.setdefault(name, _text(value))
+                    position += 8 + sub_size + sub_size % 2
+            f.seek(size % 2, os.SEEK_CUR)
+        elif chunk_id in (b"id3 ", b"ID3 "):
+            start = f.tell()
+            for name, value in _id3v2_tags(f, start)[0].items():
+                fields.setdefault(name, value)
+            f.seek(start + size + size % 2)
+        elif chunk_id == b"data" and size == 0xFFFFFFFF:
+            break  # RF64: the data runs to the end of the file
+        else:
+            f.seek(size + size % 2, os.SEEK_CUR)  # Tags are often written after the audio
+    fields.pop("duration", None)
+    layout = read_wav_layout(file_path)
+    if layout is not None:
+        fields["duration"] = layout.data_size / (layout.channels * layout.bits_per_sample // 8) / layout.sample_rate
+    return fields
+
+
+def _mutagen_tags(file_path):
+    global _mutagen
+    if _mutagen is None:
+        try:
+            import mutagen
+            _mutagen = mutagen
+        except ImportError:
+            _mutagen = False
+    if not _mutagen:
+        return None
+    try:
+        audio = _mutagen.File(file_path, easy=True)
+    except _mutagen.MutagenError:
+        return None
+    if audio is None:
+        return None
+    fields = {}
+    for name in ("title", "artist", "album"):
+        values = (audio.tags or {}).get(name)
+        if values and _text(str(values[0])):
+            fields[name] = _text(str(values[0]))
+    if getattr(audio.info, "length", None):
+        fields["duration"] = audio.info.length
+    return fields
+
+
+class TagReader:
+    # Reads tags for batches of paths on a thread pool, so a folder scan
+    # can queue its files as fast as it finds them. Tags read before are
+    # taken from the analysis database as long as the file is unchanged;
+    # new ones are written back in one transaction per batch.
+    # on_done([(path, TrackTags), ...]) is called from a pool thread.
+    def __init__(self, store, on_done=None, max_workers=2, batch_size=TAG_BATCH_SIZE):
+        self.store = store
+        self.batch_size = batch_size
+        self._on_done = on_done
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tags")
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def request(self, file_paths):
+        with self._lock:
+            generation = self._generation
+        for start in range(0, len(file_paths), self.batch_size):
+            self._executor.submit(self._run, file_paths[start:start + self.batch_size], generation)
+
+    def cancel(self):
+        # Batches already queued are dropped without reading anything
+        with self._lock:
+            self._generation += 1
+
+    def _current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _run(self, file_paths, generation):
+        if not self._current(generation):
+            return
+        try:
+            keys = {}
+            for path in file_paths:
+                try:
+                    keys[path] = cache_key(path)
+                except OSError:
+                    continue
+            known = self.store.get_tags(keys.values())
+            results = []
+            new_rows = []
+            for path, key in keys.items():
+                tags = known.get(key[0])
+                if tags is None:
+                    try:
+                        tags = read_tags(path)
+                        new_rows.append((key, tags))
+                    except (OSError, ValueError, struct.error) as e:
+                        logging.debug(f"Could not read tags from {path}: {e}")
+                        tags = TrackTags(None, None, None, None)
+                        new_rows.append((key, tags))
+                    except Exception as e:
+                        # A parser bug: still index the file by name, and
+                        # don't store anything, so a fixed reader tries again
+                        logging.warning(f"Reading tags from {path} failed: {e}")
+                        tags = TrackTags(None, None, None, None)
+                results.append((path, tags))
+            if new_rows:
+                self.store.put_tags(new_rows)
+            if self._on_done and results and self._current(generation):
+                self._on_done(results)
+        except Exception as e:
+            logging.warning(f"Reading tags failed: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
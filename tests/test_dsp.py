@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+import pytest
+
+from dsp import EQ_BLOCK_FRAMES, BiquadEQ, Resampler, _run_biquad, biquad_coefficients
+
+
+def response(b, a, frequency, sample_rate):
+    # Gain of the biquad at frequency, from its transfer function
+    z = np.exp(-1j * 2 * math.pi * frequency / sample_rate)
+    return abs((b[0] + b[1] * z + b[2] * z * z) / (1 + a[0] * z + a[1] * z * z))
+
+
+def sine(frequency, sample_rate, frames, channels=2, amplitude=0.5):
+    t = np.arange(frames) / sample_rate
+    return np.repeat((amplitude * np.sin(2 * math.pi * frequency * t))[:, None], channels, axis=1).astype(np.float32)
+
+
+def run_eq(eq, block, sizes):
+    out = block.copy()
+    start = 0
+    while start < len(out):
+        for size in sizes:
+            eq.process(out[start:start + size])
+            start += size
+    return out
+
+
+@pytest.mark.parametrize("kind, frequency, expected", [
+    ("peak", 1000, 6.0),
+    ("lowshelf", 1, 6.0),
+    ("highshelf", 23999, 6.0),
+    ("peak", 20, 0.0),
+    ("lowshelf", 20000, 0.0),
+])
+def test_biquad_coefficients(kind, frequency, expected):
+    b, a = biquad_coefficients(kind, 1000, 6.0, 0.7, 48000)
+    assert 20 * math.log10(response(b, a, frequency, 48000)) == pytest.approx(expected, abs=0.05)
+
+
+def test_biquad_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        biquad_coefficients("notch", 1000, 6.0, 0.7, 48000)
+    with pytest.raises(ValueError):
+        BiquadEQ().set_bands([("peak", 1000, 6.0, 0)])
+
+
+def test_eq_matches_sample_by_sample_filter():
+    # Block boundaries (odd sizes, single frames, more than EQ_BLOCK_FRAMES)
+    # must not show in the output
+    rng = np.random.default_rng(1)
+    block = rng.uniform(-0.5, 0.5, (3000, 2)).astype(np.float32)
+    eq = BiquadEQ()
+    eq.set_bands([("lowshelf", 100, 4.0, 0.7), ("peak", 2500, -8.0, 2.0)])
+    eq.reserve(512, 2, 44100)
+    out = run_eq(eq, block, (1, 37, EQ_BLOCK_FRAMES, 300, 2))
+    expected = block.astype(np.float64)
+    for kind, frequency, gain_db, q in eq.bands:
+        b, a = biquad_coefficients(kind, frequency, gain_db, q, 44100)
+        expected = np.array([_run_biquad(b, a, channel, (0.0, 0.0, 0.0, 0.0)) for channel in expected.T]).T
+    assert np.max(np.abs(out - expected)) < 5e-4  # float32 rounding
+
+
+def test_eq_gain_on_a_tone():
+    eq = BiquadEQ()
+    eq.set_bands([("peak", 1000, 6.0, 1.0)])
+    eq.reserve(1024, 2, 48000)
+    out = run_eq(eq, sine(1000, 48000, 48000), (1024,))
+    peak = np.max(np.abs(out[24000:]))
+    assert 20 * math.log10(peak / 0.5) == pytest.approx(6.0, abs=0.05)
+
+
+def test_flat_bands_pass_through():
+    eq = BiquadEQ()
+    eq.set_bands([("peak", 1000, 0.0, 1.0), ("lowshelf", 80, 0, 0.7)])
+    eq.reserve(1024, 2, 48000)
+    assert not eq.active
+    block = sine(440, 48000, 1000)
+    assert np.array_equal(run_eq(eq, block, (1000,)), block)
+
+
+def resample(resampler, block, chunk=1000):
+    # Feeds block through in chunks, then pads to flush the tail out
+    outputs = []
+    for start in range(0, len(block), chunk):
+        part = block[start:start + chunk]
+        resampler.input_space(len(part))[:] = part
+        resampler.commit(len(part))
+        out = np.empty((resampler.available(), block.shape[1]), dtype=np.float32)
+        resampler.process(out)
+        outputs.append(out)
+    expected = -(-len(block) * resampler.up // resampler.down)
+    resampler.pad(resampler.taps)
+    out = np.empty((expected - sum(map(len, outputs)), block.shape[1]), dtype=np.float32)
+    resampler.process(out)
+    outputs.append(out)
+    return np.concatenate(outputs)
+
+
+@pytest.mark.parametrize("in_rate, out_rate", [(44100, 48000), (48000, 44100), (22050, 48000), (96000, 44100)])
+def test_resampler_keeps_a_tone(in_rate, out_rate):
+    frames = in_rate // 2
+    out = resample(Resampler(in_rate, out_rate, 2), sine(1000, in_rate, frames))
+    assert len(out) == math.ceil(frames * out_rate / in_rate)
+    # Output n is the input signal at n / out_rate: same phase, frequency and level
+    reference = sine(1000, out_rate, len(out))
+    middle = slice(100, len(out) - 100)
+    assert np.max(np.abs(out[middle] - reference[middle])) < 2e-3
+
+
+def test_resampler_filters_above_nyquist():
+    # 20 kHz can't be represented at 22.05 kHz and must not alias down
+    out = resample(Resampler(48000, 22050, 1), sine(20000, 48000, 48000, channels=1))
+    assert np.max(np.abs(out[200:-200])) < 0.5 * 10 ** (-60 / 20)
+
+
+def test_resampler_input_needed():
+    resampler = Resampler(44100, 48000, 1, max_frames=256)
+    produced = 0
+    for _ in range(50):
+        count = resampler.input_needed(256)
+        resampler.input_space(count)[:] = 1.0
+        resampler.commit(count)
+        assert resampler.available() >= 256
+        out = np.empty((256, 1), dtype=np.float32)
+        resampler.process(out)
+        produced += 256
+    # DC passes at unity once past the start-up zeros
+    assert np.allclose(out, 1.0, atol=1e-3)
+    assert resampler.frames_in == pytest.approx(produced * 44100 / 48000, abs=resampler.taps + 2)
@@ -0,0 +1,84 @@
+import os
+
+from playlist_io import PlaylistEntry, read_playlist, resolve_location, write_m3u
+
+
+def read_all(path, chunk_size=2000):
+    return [entry for entries, _ in read_playlist(str(path), chunk_size) for entry in entries]
+
+
+def test_m3u(tmp_path):
+    playlist = tmp_path / "list.m3u"
+    playlist.write_bytes(
+        b"\xef\xbb\xbf#EXTM3U\n"
+        b"#EXTINF:123,Artist - Song\n"
+        b"music/one.mp3\n"
+        b"\n"
+        b"#EXTINF:-1 tvg-id=\"x\",\n"
+        b"http://example.com/stream\n"
+        b"#EXTINF:bad,Unused\n"
+        b"/abs/two.flac\r\n"
+        b"#A comment\n"
+        b"sub\\three.ogg\n"
+        b"caf\xe9.mp3\n"
+        b"file:///abs/with%20space.mp3\n"
+    )
+    assert read_all(playlist) == [
+        PlaylistEntry(str(tmp_path / "music" / "one.mp3"), 123.0, "Artist - Song"),
+        PlaylistEntry("/abs/two.flac", None, "Unused"),
+        PlaylistEntry(str(tmp_path / "sub" / "three.ogg"), None, None),
+        PlaylistEntry(str(tmp_path / "café.mp3"), None, None),
+        PlaylistEntry("/abs/with space.mp3", None, None),
+    ]
+
+
+def test_m3u8_utf8(tmp_path):
+    playlist = tmp_path / "list.m3u8"
+    playlist.write_text("#EXTINF:5,Ünïcode ✓\nÜ.mp3\n", encoding="utf-8")
+    assert read_all(playlist) == [PlaylistEntry(str(tmp_path / "Ü.mp3"), 5.0, "Ünïcode ✓")]
+
+
+def test_pls_number_order(tmp_path):
+    playlist = tmp_path / "list.pls"
+    playlist.write_text(
+        "[playlist]\n"
+        "File2=b.mp3\nTitle2=Second\nLength2=-1\n"
+        "File1=a.mp3\nTitle1=First\nLength1=61\n"
+        "File3=http://example.com/radio\n"
+        "title10 = Tenth\nfile10 = c.mp3\nLength10=oops\n"
+        "Length4=9\n"
+        "NumberOfEntries=4\nVersion=2\n"
+    )
+    assert read_all(playlist) == [
+        PlaylistEntry(str(tmp_path / "a.mp3"), 61.0, "First"),
+        PlaylistEntry(str(tmp_path / "b.mp3"), None, "Second"),
+        PlaylistEntry(str(tmp_path / "c.mp3"), None, "Tenth"),
+    ]
+
+
+def test_chunks_and_progress(tmp_path):
+    playlist = tmp_path / "list.m3u"
+    playlist.write_text("".join(f"{i}.mp3\n" for i in range(25)))
+    chunks = list(read_playlist(str(playlist), chunk_size=10))
+    assert [len(entries) for entries, _ in chunks] == [10, 10, 5]
+    fractions = [fraction for _, fraction in chunks]
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    assert read_all(tmp_path / "list.m3u", 10)[12].path == str(tmp_path / "12.mp3")
+
+
+def test_empty_playlist(tmp_path):
+    (tmp_path / "empty.m3u").write_bytes(b"")
+    assert read_all(tmp_path / "empty.m3u") == []
+
+
+def test_resolve_location():
+    assert resolve_location("rtsp://host/x", "/base") is None
+    assert resolve_location("../up/./x.mp3", "/base/dir") == os.path.normpath("/base/up/x.mp3")
+
+
+def test_write_m3u_round_trip(tmp_path):
+    paths = [str(tmp_path / "a.mp3"), str(tmp_path / "b, c.flac")]
+    playlist = str(tmp_path / "out.m3u")
+    write_m3u(playlist, paths, {paths[0]: 61.6}, {paths[1]: "Title"})
+    assert read_all(playlist) == [PlaylistEntry(paths[0], 62.0, "a"), PlaylistEntry(paths[1], None, "Title")]
+    assert not os.path.exists(playlist + ".tmp")
@@ -0,0 +1,148 @@
+import struct
+
+import pytest
+
+from audio_frames import adts_frame, find_frame, mp3_frame
+from seek_index import MP3_DECODER_DELAY, build_seek_index
+
+MP3_FRAME = b"\xff\xfb\x90\x00"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417 bytes, 1152 samples
+MP3_FRAME_LENGTH = 417
+
+
+def mp3_audio(count):
+    return (MP3_FRAME + bytes(MP3_FRAME_LENGTH - 4)) * count
+
+
+def adts_audio(count, length=200):
+    # MPEG-4 AAC LC, 44.1 kHz, stereo, no CRC, one raw block (1024 samples)
+    header = bytes([0xFF, 0xF1, 0x50, 0x80 | (length >> 11), (length >> 3) & 0xFF, ((length & 7) << 5) | 0x1F, 0xFC])
+    return (header + bytes(length - 7)) * count
+
+
+def flac_block(kind, body, last=False):
+    return bytes([kind | (0x80 if last else 0)]) + len(body).to_bytes(3, "big") + body
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (b"\xff\xfb\x90\x00", (417, 1152, 44100, 36)),
+    (b"\xff\xfb\x92\xc0", (418, 1152, 44100, 21)),  # Padded, mono
+    (b"\xff\xfa\x90\x00", (417, 1152, 44100, 38)),  # CRC
+    (b"\xff\xf3\x90\x00", (261, 576, 22050, 21)),  # MPEG-2, 80 kbps
+    (b"\xff\xfd\x94\x00", (480, 1152, 48000, 4)),  # Layer II, 160 kbps
+])
+def test_mp3_frame(header, expected):
+    assert mp3_frame(header, 0) == expected
+
+
+@pytest.mark.parametrize("header", [
+    b"\xff\xfb\x90",  # Truncated
+    b"\xff\xfb\xf0\x00",  # Bad bitrate
+    b"\xff\xfb\x0c\x00",  # Free format, reserved sample rate
+    b"\xff\xeb\x90\x00",  # Reserved version
+    b"\xff\xf9\x90\x00",  # Reserved layer
+    b"\xfe\xfb\x90\x00",
+])
+def test_mp3_frame_rejects(header):
+    assert mp3_frame(header, 0) is None
+
+
+def test_adts_frame():
+    assert adts_frame(adts_audio(1), 0) == (200, 1024, 44100, 7)
+    assert adts_frame(adts_audio(1)[:6], 0) is None
+    assert adts_frame(b"\xff\xf1\x7c" + bytes(4), 0) is None  # Sample rate index 15
+    assert adts_frame(b"\xff\xf1\x50\x80\x00\x1f\xfc", 0) is None  # Shorter than its header
+
+
+def test_find_frame_needs_a_run_of_frames():
+    # A lone sync word in front of the stream is skipped
+    data = b"\x00\xff\xfb\x90\x00" + bytes(50) + mp3_audio(6)
+    assert find_frame(data, mp3_frame) == 55
+    assert find_frame(mp3_audio(2) + b"\x00" * 2000, mp3_frame) == -1
+    # A stream cut by the end of the probe still counts
+    assert find_frame(b"\x00" * 3 + mp3_audio(2)[:600], mp3_frame) == 3
+
+
+def test_mp3_index(tmp_path):
+    index = build_seek_index(write(tmp_path, "a.mp3", mp3_audio(40)))
+    assert index.demuxer == "mp3" and len(index) == 40
+    assert list(index.frames[:3]) == [0, 1152, 2304]
+    assert list(index.offsets[:3]) == [0, 417, 834]
+    # One frame of preroll, then back far enough for 511 bytes of reservoir
+    # (381 payload bytes a frame)
+    assert index.locate(1152 * 10 + 5) == (7 * 417, 3 * 1152 + 5)
+    assert index.locate(100) == (0, 100)
+
+
+def test_mp3_index_after_id3_and_info_frame(tmp_path):
+    info = bytearray(mp3_audio(1))
+    lame = 36 + 8 + 4
+    info[36:lame] = b"Info" + struct.pack(">II", 1, 30)
+    info[lame:lame + 4] = b"LAME"
+    info[lame + 21:lame + 24] = ((576 << 12) | 1000).to_bytes(3, "big")
+    tag = b"ID3\x03\x00\x00\x00\x00\x00\x14" + bytes(20)
+    index = build_seek_index(write(tmp_path, "a.mp3", tag + bytes(info) + mp3_audio(30)))
+    assert index.delay == 576 + MP3_DECODER_DELAY
+    assert index.offsets[0] == 30 + 417 and len(index) == 30
+    assert index.locate(0) == (index.offsets[0], 576 + MP3_DECODER_DELAY)
+
+
+def test_mp3_walk_resyncs_and_stops_at_tags(tmp_path):
+    data = mp3_audio(10) + b"\x00\xff\x00" * 10 + mp3_audio(10) + b"TAG" + bytes(125) + mp3_audio(5)
+    index = build_seek_index(write(tmp_path, "a.mp3", data))
+    assert len(index) == 20
+    assert index.offsets[10] == 10 * 417 + 30
+
+
+def test_mp3_walk_keeps_truncated_last_frame(tmp_path):
+    index = build_seek_index(write(tmp_path, "a.mp3", mp3_audio(10)[:-100]))
+    assert len(index) == 10
+
+
+def test_adts_index(tmp_path):
+    index = build_seek_index(write(tmp_path, "a.aac", adts_audio(12)))
+    assert index.demuxer == "aac" and len(index) == 12
+    assert index.locate(1024 * 5 + 1) == (4 * 200, 1024 + 1)
+
+
+@pytest.mark.parametrize("data", [b"", b"ID3\x03", bytes(5000), b"\xff" * 5000])
+def test_no_index_for_unknown_data(tmp_path, data):
+    assert build_seek_index(write(tmp_path, "x.mp3", data)) is None
+
+
+@pytest.mark.parametrize("head", [b"RIFF", b"OggS", b"\x00\x00\x00\x20ftyp"])
+def test_formats_ffmpeg_seeks(tmp_path, head):
+    assert build_seek_index(write(tmp_path, "x", head + bytes(100))) is None
+
+
+def flac_file(points, streaminfo=bytes(range(34))):
+    seektable = b"".join(struct.pack(">QQH", *point) for point in points)
+    return (b"fLaC" + flac_block(0, streaminfo) + flac_block(3, seektable + b"\x01\x02")
+            + flac_block(1, bytes(10), last=True) + bytes(5000))
+
+
+def test_flac_seektable(tmp_path):
+    placeholder = (0xFFFFFFFFFFFFFFFF, 0, 0)
+    data = flac_file([(88200, 3000, 4096), (44100, 1000, 4096), placeholder])
+    index = build_seek_index(write(tmp_path, "a.flac", data))
+    audio_start = 4 + 4 + 34 + 4 + 3 * 18 + 2 + 4 + 10
+    assert index.demuxer == "flac"
+    assert list(index.frames) == [0, 44100, 88200]
+    assert list(index.offsets) == [audio_start, audio_start + 1000, audio_start + 3000]
+    assert index.header == b"fLaC\x80\x00\x00\x22" + bytes(range(34))
+    assert index.locate(50000) == (audio_start + 1000, 50000 - 44100)
+
+
+def test_flac_without_seektable(tmp_path):
+    data = b"fLaC" + flac_block(0, bytes(34), last=True) + bytes(100)
+    assert build_seek_index(write(tmp_path, "a.flac", data)) is None
+
+
+def test_flac_truncated_metadata(tmp_path):
+    data = flac_file([(0, 0, 4096), (44100, 1000, 4096)])
+    assert build_seek_index(write(tmp_path, "a.flac", data[:50])) is None
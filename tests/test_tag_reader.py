@@ -0,0 +1,182 @@
+import struct
+import wave
+
+import pytest
+
+from tag_reader import read_tags
+from track_analysis import TrackTags
+
+MP3_FRAME = b"\xff\xfb\x90\x00"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417 bytes, 1152 samples
+MP3_FRAME_LENGTH = 417
+
+
+def mp3_audio(count):
+    return (MP3_FRAME + bytes(MP3_FRAME_LENGTH - 4)) * count
+
+
+def syncsafe(size):
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def id3v2(version, frames):
+    # frames: (frame id, text encoding byte, encoded text)
+    body = b""
+    for frame_id, encoding, text in frames:
+        data = bytes([encoding]) + text
+        if version == 2:
+            body += frame_id + len(data).to_bytes(3, "big") + data
+        elif version == 3:
+            body += frame_id + struct.pack(">I", len(data)) + b"\x00\x00" + data
+        else:
+            body += frame_id + syncsafe(len(data)) + b"\x00\x00" + data
+    body += bytes(32)  # Padding
+    return b"ID3" + bytes([version, 0, 0]) + syncsafe(len(body)) + body
+
+
+def id3v1(title, artist, album):
+    fields = [value.encode("latin-1").ljust(30, b"\x00") for value in (title, artist, album)]
+    return b"TAG" + b"".join(fields) + b"2024" + bytes(30) + b"\x00"
+
+
+def vorbis_comment(pairs, vendor=b"test"):
+    items = [f"{key}={value}".encode() for key, value in pairs]
+    return (struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(items))
+            + b"".join(struct.pack("<I", len(item)) + item for item in items))
+
+
+def flac_block(kind, body, last=False):
+    return bytes([kind | (0x80 if last else 0)]) + len(body).to_bytes(3, "big") + body
+
+
+def streaminfo(sample_rate, channels, total):
+    packed = (sample_rate << 44) | ((channels - 1) << 41) | (15 << 36) | total
+    return bytes(10) + packed.to_bytes(8, "big") + bytes(16)
+
+
+def ogg_page(packet, granule=0, sequence=0, serial=1):
+    lacing = bytes([255] * (len(packet) // 255) + [len(packet) % 255])
+    return (b"OggS" + b"\x00\x00" + struct.pack("<qII", granule, serial, sequence) + bytes(4)
+            + bytes([len(lacing)]) + lacing + packet)
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("version, encoding, encode", [
+    (2, 0, lambda text: text.encode("latin-1")),
+    (3, 1, lambda text: text.encode("utf-16")),
+    (4, 3, lambda text: text.encode("utf-8")),
+])
+def test_id3v2_versions(tmp_path, version, encoding, encode):
+    ids = {2: (b"TT2", b"TP1", b"TAL", b"TLE"), 3: (b"TIT2", b"TPE1", b"TALB", b"TLEN"),
+           4: (b"TIT2", b"TPE1", b"TALB", b"TLEN")}[version]
+    tag = id3v2(version, [(ids[0], encoding, encode("Títle")), (ids[1], encoding, encode("Ärtist")),
+                          (ids[2], encoding, encode("Albüm")), (ids[3], 0, b"12500")])
+    path = write(tmp_path, "a.mp3", tag + mp3_audio(10))
+    assert read_tags(path) == TrackTags("Títle", "Ärtist", "Albüm", 12.5)
+
+
+def test_id3v1_fills_in_and_cbr_duration(tmp_path):
+    tag = id3v2(3, [(b"TIT2", 0, b"From v2")])
+    path = write(tmp_path, "a.mp3", tag + mp3_audio(100) + id3v1("From v1", "Artist", "Album"))
+    tags = read_tags(path)
+    assert (tags.title, tags.artist, tags.album) == ("From v2", "Artist", "Album")
+    assert tags.duration == pytest.approx(100 * 1152 / 44100)
+
+
+def test_xing_frame_count(tmp_path):
+    first = bytearray(mp3_audio(1))
+    first[36:48] = b"Xing" + struct.pack(">II", 1, 1000)  # Frame count flag
+    path = write(tmp_path, "a.mp3", bytes(first) + mp3_audio(5))
+    assert read_tags(path).duration == pytest.approx(1000 * 1152 / 44100)
+
+
+@pytest.mark.parametrize("keep, title", [(3, None), (10, None), (14, None), (20, None), (40, "Title")])
+def test_truncated_id3v2(tmp_path, keep, title):
+    # Cut inside the header, a frame header and a frame body; whole frames before the cut survive
+    tag = id3v2(3, [(b"TIT2", 0, b"Title"), (b"TPE1", 0, b"Artist")])
+    path = write(tmp_path, "cut.mp3", tag[:keep])
+    assert read_tags(path) == TrackTags(title, None, None, None)
+
+
+def test_frame_larger_than_tag(tmp_path):
+    tag = bytearray(id3v2(3, [(b"TIT2", 0, b"Title")]))
+    tag[14:18] = struct.pack(">I", 1 << 30)
+    path = write(tmp_path, "a.mp3", bytes(tag) + mp3_audio(2))
+    assert read_tags(path).title is None
+
+
+def test_no_frames_no_duration(tmp_path):
+    path = write(tmp_path, "noise.mp3", b"\x00\x01" * 4000)
+    assert read_tags(path) == TrackTags(None, None, None, None)
+
+
+def test_flac(tmp_path):
+    data = (b"fLaC" + flac_block(0, streaminfo(44100, 2, 441000))
+            + flac_block(1, bytes(100))
+            + flac_block(4, vorbis_comment([("title", "T"), ("ARTIST", "A"), ("Album", "B"), ("TITLE", "second")]),
+                         last=True)
+            + bytes(64))
+    assert read_tags(write(tmp_path, "a.flac", data)) == TrackTags("T", "A", "B", 10.0)
+
+
+def test_flac_truncated_comments(tmp_path):
+    comments = vorbis_comment([("TITLE", "T"), ("ARTIST", "A")])
+    data = b"fLaC" + flac_block(0, streaminfo(48000, 2, 96000)) + flac_block(4, comments, last=True)
+    tags = read_tags(write(tmp_path, "a.flac", data[:-3]))
+    assert (tags.title, tags.artist, tags.duration) == ("T", None, 2.0)
+
+
+def test_ogg_vorbis(tmp_path):
+    identification = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100) + bytes(15)
+    comments = b"\x03vorbis" + vorbis_comment([("TITLE", "T"), ("ARTIST", "A"), ("ALBUM", "B")]) + b"\x01"
+    data = (ogg_page(identification) + ogg_page(comments, sequence=1)
+            + ogg_page(bytes(300), granule=441000, sequence=2))
+    assert read_tags(write(tmp_path, "a.ogg", data)) == TrackTags("T", "A", "B", 10.0)
+
+
+def test_opus_pre_skip(tmp_path):
+    head = b"OpusHead" + bytes([1, 2]) + struct.pack("<HI", 312, 48000) + bytes(3)
+    data = (ogg_page(head) + ogg_page(b"OpusTags" + vorbis_comment([("TITLE", "T")]), sequence=1)
+            + ogg_page(bytes(10), granule=96000 + 312, sequence=2))
+    tags = read_tags(write(tmp_path, "a.opus", data))
+    assert (tags.title, tags.duration) == ("T", 2.0)
+
+
+def wav_with_chunks(path, chunks, seconds=1.5, rate=8000):
+    with wave.open(path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(int(seconds * rate) * 2))
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        for chunk_id, body in chunks:
+            f.write(chunk_id + struct.pack("<I", len(body)) + body + b"\x00" * (len(body) % 2))
+        size = f.tell()
+        f.seek(4)
+        f.write(struct.pack("<I", size - 8))
+    return path
+
+
+def test_wav_info(tmp_path):
+    info = b"INFO"
+    for sub_id, text in ((b"INAM", "Títle".encode()), (b"IART", "Ärtist".encode("cp1252")), (b"IPRD", b"Alb")):
+        body = text + b"\x00"
+        info += sub_id + struct.pack("<I", len(body)) + body + b"\x00" * (len(body) % 2)
+    path = wav_with_chunks(str(tmp_path / "a.wav"), [(b"LIST", info)])
+    assert read_tags(path) == TrackTags("Títle", "Ärtist", "Alb", 1.5)
+
+
+def test_wav_id3_chunk(tmp_path):
+    path = wav_with_chunks(str(tmp_path / "a.wav"), [(b"id3 ", id3v2(4, [(b"TIT2", 3, b"T")]))])
+    assert read_tags(path) == TrackTags("T", None, None, 1.5)
+
+
+def test_wav_truncated_info(tmp_path):
+    info = b"INFO" + b"INAM" + struct.pack("<I", 1000) + b"short"
+    path = wav_with_chunks(str(tmp_path / "a.wav"), [(b"LIST", info)])
+    assert read_tags(path).duration == 1.5
@@ -0,0 +1,245 @@
+import logging
+import mmap
+import os
+import sqlite3
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_cache import cache_key
+from audio_stream import PIPE_CHUNK_SIZE, SAMPLE_WIDTH, decoder_command, probe_audio, read_wav_layout
+from waveform import WaveformBuilder
+
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".ktiseosnyx_player")
+ANALYSIS_DB_PATH = os.path.join(DATA_DIR, "analysis.sqlite3")
+HEADROOM_DB = 0.1  # Same target as pydub's AudioSegment.normalize()
+
+TrackInfo = namedtuple("TrackInfo", "peak duration sample_rate channels")
+# From the container's tags and headers; any field may be None
+TrackTags = namedtuple("TrackTags", "title artist album duration")
+
+
+def gain_for_peak(peak):
+    # peak is the largest absolute sample as a fraction of full scale
+    if peak <= 0:
+        return 1.0
+    return 10 ** (-HEADROOM_DB / 20) / peak
+
+
+def pcm_peak(data):
+    import numpy as np  # Not needed until the first track is analysed
+    samples = np.frombuffer(data, dtype=np.int16)
+    if not len(samples):
+        return 0.0
+    return max(int(samples.max()), -int(samples.min())) / 32768.0
+
+
+def scan_peak(file_path, sample_rate, channels, waveform=None):
+    # Decode through ffmpeg and fold the peak chunk by chunk, so memory stays
+    # flat regardless of track length. The same pass feeds the waveform
+    # builder, if given.
+    process = subprocess.Popen(decoder_command(file_path, sample_rate, channels),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    peak = 0.0
+    frames = 0
+    leftover = b""
+    try:
+        while True:
+            chunk = process.stdout.read(PIPE_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - len(chunk) % 2
+            leftover = chunk[usable:]
+            peak = max(peak, pcm_peak(chunk[:usable]))
+            if waveform is not None:
+                waveform.feed(chunk[:usable])
+            frames += usable // (2 * channels)
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode} while analysing {file_path}")
+    return peak, frames / sample_rate
+
+
+def scan_mapped_peak(file_path, layout, chunk_bytes=8 * 1024 * 1024, waveform=None):
+    # 16-bit PCM WAV: fold the peak over a memory map of the data chunk
+    # instead of piping the whole file through ffmpeg.
+    peak = 0.0
+    end = layout.data_offset + layout.data_size
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for start in range(layout.data_offset, end, chunk_bytes):
+            chunk = mapped[start:min(start + chunk_bytes, end)]
+            peak = max(peak, pcm_peak(chunk))
+            if waveform is not None:
+                waveform.feed(chunk)
+    frames = layout.data_size // (layout.channels * layout.bits_per_sample // 8)
+    return peak, frames / layout.sample_rate
+
+
+class TrackAnalysisStore:
+    # Per-track peak, duration and format, persisted in SQLite and keyed by
+    # path + mtime + size. Lookups are memoised so the GUI can ask freely.
+    def __init__(self, db_path=ANALYSIS_DB_PATH):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER,"
+            " peak REAL, duration REAL, sample_rate INTEGER, channels INTEGER)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tags ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER,"
+            " title TEXT, artist TEXT, album TEXT, duration REAL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._memo = {}
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+            row = self._conn.execute(
+                "SELECT peak, duration, sample_rate, channels FROM tracks"
+                " WHERE path = ? AND mtime_ns = ? AND size = ?", key).fetchone()
+            info = TrackInfo(*row) if row else None
+            self._memo[key] = info
+            return info
+
+    def lookup(self, file_path):
+        try:
+            return self.get(cache_key(file_path))
+        except OSError:
+            return None
+
+    def durations(self, file_paths, chunk_size=500):
+        # {path: seconds} for every analysed path, in a handful of queries.
+        # Matched on path alone: a playlist save doesn't stat 50k files to
+        # get #EXTINF hints right for the odd one rewritten since.
+        by_abspath = {os.path.abspath(path): path for path in file_paths}
+        keys = list(by_abspath)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                rows = self._conn.execute(
+                    f"SELECT path, duration FROM tracks WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+                for path, duration in rows:
+                    if duration is not None:
+                        found[by_abspath[path]] = duration
+        return found
+
+    def put(self, key, info):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)", key + tuple(info))
+            self._conn.commit()
+            self._memo[key] = info
+
+    def get_tags(self, keys, chunk_size=500):
+        # {path: TrackTags} for the keys whose file hasn't changed since its
+        # tags were read, in a handful of queries
+        wanted = {key[0]: key for key in keys}
+        paths = list(wanted)
+        found = {}
+        with self._lock:
+            for start in range(0, len(paths), chunk_size):
+                chunk = paths[start:start + chunk_size]
+                rows = self._conn.execute(
+                    "SELECT path, mtime_ns, size, title, artist, album, duration FROM tags"
+                    f" WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+                for path, mtime_ns, size, *tags in rows:
+                    if wanted[path][1:] == (mtime_ns, size):
+                        found[path] = TrackTags(*tags)
+        return found
+
+    def put_tags(self, rows):
+        # (key, TrackTags) pairs, written in one transaction
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (key + tuple(tags) for key, tags in rows))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TrackAnalyzer:
+    # Fills the store on a background thread. on_done(file_path, info) is
+    # called from that thread once a track has been analysed. With a
+    # WaveformStore, the overview is built in the same pass as the peak, so
+    # drawing it never costs a decode of its own.
+    def __init__(self, store, on_done=None, waveforms=None):
+        self.store = store
+        self.waveforms = waveforms
+        self._on_done = on_done
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analyzer")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def needs(self, key, info):
+        return info is None or (self.waveforms is not None and not self.waveforms.has(key))
+
+    def request(self, file_path, decoded=None):
+        # decoded=(data, sample_rate, channels) when the caller already holds
+        # the whole track as PCM
+        with self._lock:
+            if file_path in self._pending:
+                return
+            self._pending.add(file_path)
+        self._executor.submit(self._run, file_path, decoded)
+
+    def _run(self, file_path, decoded=None):
+        try:
+            key = cache_key(file_path)
+            info = self.store.get(key)
+            if self.needs(key, info):
+                info = self._scan(file_path, key, info, decoded)
+            if self._on_done:
+                self._on_done(file_path, info)
+        except Exception as e:
+            logging.warning(f"Analysis of {file_path} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(file_path)
+
+    def _scan(self, file_path, key, info, decoded):
+        layout = read_wav_layout(file_path) if decoded is None else None
+        if decoded is not None:
+            data, sample_rate, channels = decoded
+            expected_frames = len(data) // (SAMPLE_WIDTH * channels)
+        elif layout is not None and layout.bits_per_sample == SAMPLE_WIDTH * 8:
+            sample_rate, channels = layout.sample_rate, layout.channels
+            expected_frames = layout.data_size // (SAMPLE_WIDTH * channels)
+        elif info is not None:
+            sample_rate, channels = info.sample_rate, info.channels
+            expected_frames = int(info.duration * sample_rate)
+        else:
+            sample_rate, channels, duration = probe_audio(file_path)
+            expected_frames = int((duration or 0) * sample_rate)
+        waveform = WaveformBuilder(channels, expected_frames) if self.waveforms is not None else None
+
+        if decoded is not None:
+            peak = pcm_peak(data)
+            if waveform is not None:
+                for start in range(0, len(data), PIPE_CHUNK_SIZE * 16):
+                    waveform.feed(data[start:start + PIPE_CHUNK_SIZE * 16])
+            duration = expected_frames / sample_rate
+        elif layout is not None and layout.bits_per_sample == SAMPLE_WIDTH * 8:
+            peak, duration = scan_mapped_peak(file_path, layout, waveform=waveform)
+        else:
+            peak, duration = scan_peak(file_path, sample_rate, channels, waveform=waveform)
+
+        if info is None:
+            info = TrackInfo(peak, duration, sample_rate, channels)
+            self.store.put(key, info)
+            logging.debug(f"Analysed {file_path}: peak={peak:.4f} duration={duration:.1f}s")
+        if waveform is not None:
+            self.waveforms.put(key, waveform.finish(sample_rate))
+        return info
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+WAVEFORM_COLUMNS = 4096  # Finest level; each coarser one halves it
+WAVEFORM_LEVELS = 4
+UNKNOWN_LENGTH_BUCKET_FRAMES = 256
+
+
+class Waveform:
+    # Min/max of the channel-mixed int16 samples per column, at a few zoom
+    # levels. levels[0] is the finest; the view draws the first level at
+    # least as wide as itself.
+    def __init__(self, levels, duration):
+        self.levels = levels  # [(mins, maxs)] of int16 arrays
+        self.duration = duration
+
+    def level_for(self, width):
+        for mins, maxs in reversed(self.levels):
+            if len(mins) >= width:
+                return mins, maxs
+        return self.levels[0]
+
+
+class WaveformBuilder:
+    # Folds decoded 16-bit PCM into fixed-size buckets as it arrives, a whole
+    # chunk at a time with reshape + min/max, then resamples to the column
+    # count in finish(). expected_frames only picks the bucket size, so a
+    # wrong estimate costs resolution, not correctness.
+    def __init__(self, channels, expected_frames=0, columns=WAVEFORM_COLUMNS):
+        self.channels = channels
+        self.columns = columns
+        self.bucket_frames = (max(1, expected_frames // (columns * 4)) if expected_frames
+                              else UNKNOWN_LENGTH_BUCKET_FRAMES)
+        self.frames = 0
+        self._mins = []
+        self._maxs = []
+        self._partial = None  # Trailing samples short of a whole bucket
+        self._odd_byte = b""
+
+    def feed(self, data):
+        import numpy as np
+        if self._odd_byte:
+            data = self._odd_byte + data
+        usable = len(data) - len(data) % 2
+        self._odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        if self._partial is not None:
+            samples = np.concatenate((self._partial, samples))
+        bucket = self.bucket_frames * self.channels
+        whole = len(samples) - len(samples) % bucket
+        if whole:
+            blocks = samples[:whole].reshape(-1, bucket)
+            self._mins.append(blocks.min(axis=1))
+            self._maxs.append(blocks.max(axis=1))
+        self._partial = samples[whole:].copy() if whole < len(samples) else None
+        self.frames += usable // (2 * self.channels)
+
+    def finish(self, sample_rate):
+        import numpy as np
+        mins, maxs = self._mins, self._maxs
+        if self._partial is not None and len(self._partial):
+            mins = mins + [self._partial.min(keepdims=True)]
+            maxs = maxs + [self._partial.max(keepdims=True)]
+        if not mins:
+            empty = np.zeros(1, dtype=np.int16)
+            return Waveform([(empty, empty)], 0.0)
+        mins, maxs = np.concatenate(mins), np.concatenate(maxs)
+        if len(mins) > self.columns:
+            starts = (np.arange(self.columns) * len(mins)) // self.columns
+            mins, maxs = np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+        levels = [(mins, maxs)]
+        while len(levels) < WAVEFORM_LEVELS and len(mins) >= 2:
+            even = len(mins) - len(mins) % 2
+            mins = np.minimum(mins[:even:2], mins[1:even:2])
+            maxs = np.maximum(maxs[:even:2], maxs[1:even:2])
+            levels.append((mins, maxs))
+        return Waveform(levels, self.frames / sample_rate)
+
+
+class WaveformStore:
+    # Waveforms as small .npz sidecar files named after the track's cache key,
+    # so a rewritten file gets a new one. The last few loaded are kept.
+    def __init__(self, directory, max_entries=8):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + ".npz")
+
+    def has(self, key):
+        with self._lock:
+            if key in self._memo:
+                return True
+        return os.path.exists(self.path_for(key))
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        import numpy as np
+        try:
+            with np.load(path) as data:
+                peaks, lengths, duration = data["peaks"], data["lengths"], float(data["duration"])
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Unreadable peak file {path}: {e}")
+            return None
+        bounds = np.cumsum(np.concatenate(([0], lengths)))
+        levels = [(peaks[0, start:end], peaks[1, start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+        waveform = Waveform(levels, duration)
+        self._remember(key, waveform)
+        return waveform
+
+    def put(self, key, waveform):
+        import numpy as np
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path,
+                 peaks=np.stack((np.concatenate([mins for mins, _ in waveform.levels]),
+                                 np.concatenate([maxs for _, maxs in waveform.levels]))),
+                 lengths=np.array([len(mins) for mins, _ in waveform.levels]),
+                 duration=np.float64(waveform.duration))
+        os.replace(temp_path, path)
+        self._remember(key, waveform)
+
+    def _remember(self, key, waveform):
+        with self._lock:
+            self._memo[key] = waveform
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)